@@ -0,0 +1,119 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""Benchmark of the memory held by the documents buffered between the fetching and indexing threads.
+
+    The benchmark builds the documents of synthetic files the way the fetching threads do, keeps
+    them all alive as if they were waiting in the queue, and measures the memory they hold with
+    tracemalloc. The documents are built both as the Document records used by the connector and as
+    the json dictionaries they are converted to when indexed, which is how the documents were
+    buffered before. The bodies are left out, as they take the same memory in both cases.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from ees_network_drive import adapter, constant  # noqa
+from ees_network_drive.document import Document  # noqa
+from ees_network_drive.files import Files  # noqa
+
+SERVER_IP = "10.0.0.1"
+SERVICE_NAME = "Projects"
+MODIFIED_AT = 1640877268
+
+
+def file_details(index, folders):
+    """Returns the details of a synthetic file, as built by Files.extract_files
+    :param index: index of the file
+    :param folders: number of folders the files are spread across
+    """
+    file_name = f"report-{index:08d}.docx"
+    file_path = os.path.join("department", f"project-{index % folders:05d}", "documents", file_name)
+    return {
+        'file_size': 20000 + index,
+        'file_path': file_path,
+        'updated_at': time.strftime(constant.RFC_3339_DATETIME_FORMAT, time.gmtime(MODIFIED_AT + index)),
+        'file_type': os.path.splitext(file_name)[1],
+        'created_at': time.strftime(constant.RFC_3339_DATETIME_FORMAT, time.gmtime(MODIFIED_AT)),
+        'file_name': file_name,
+        'last_write_time': MODIFIED_AT + index,
+        'web_path': f"file://{SERVER_IP}/{SERVICE_NAME}/{file_path}",
+    }
+
+
+def permissions(index):
+    """Returns the permissions of a synthetic file"""
+    return {
+        'allow': [f"S-1-5-21-3623811015-3361044348-30300820-{1000 + index % 50}", "S-1-5-32-544"],
+        'deny': [],
+    }
+
+
+def build_dictionary(file_id, details, file_permissions):
+    """Builds the document of a file as a json dictionary"""
+    doc = {field: details.get(file_field) for field, file_field in adapter.FILES.items()}
+    doc.update({'body': None, 'id': str(file_id)})
+    doc['_allow_permissions'] = file_permissions['allow']
+    doc['_deny_permissions'] = file_permissions['deny']
+    return doc
+
+
+def build_record(file_id, details, file_permissions, url_prefix):
+    """Builds the document of a file as a Document record"""
+    doc = Document.from_file_details(file_id, details, url_prefix)
+    doc.set_permissions(file_permissions, Files.permission_hash(file_permissions))
+    return doc
+
+
+def measure(build, count, folders):
+    """Returns the number of bytes held by count documents built with the function"""
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    documents = [build(index, file_details(index, folders), permissions(index)) for index in range(count)]
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del documents
+    return held - baseline
+
+
+def main():
+    """Measures the memory held by the documents in both representations"""
+    parser = argparse.ArgumentParser(prog="bench_documents")
+    parser.add_argument("--documents", type=int, default=100000, help="number of documents built")
+    parser.add_argument("--folders", type=int, default=1000, help="number of folders the files are spread across")
+    parser.add_argument("--json", action="store_true", help="print the measurements as json")
+    args = parser.parse_args()
+
+    url_prefix = f"file://{SERVER_IP}/{SERVICE_NAME}/"
+    results = {}
+    for name, build in [
+        ("dictionary", build_dictionary),
+        ("record", lambda file_id, details, file_permissions: build_record(
+            file_id, details, file_permissions, url_prefix)),
+    ]:
+        held = measure(build, args.documents, args.folders)
+        results[name] = {
+            "bytes_per_document": round(held / args.documents, 1),
+            "megabytes_per_million_documents": round(held / args.documents * 1000000 / (1024 * 1024), 1),
+        }
+    reduction = 1 - results["record"]["bytes_per_document"] / results["dictionary"]["bytes_per_document"]
+
+    if args.json:
+        print(json.dumps({"documents": args.documents, "results": results, "reduction": round(reduction, 3)}))
+        return 0
+    print(f"{'Representation':<16} {'Bytes/doc':>10} {'MB per 1M docs':>15}")
+    for name, result in results.items():
+        print(f"{name:<16} {result['bytes_per_document']:>10} {result['megabytes_per_million_documents']:>15}")
+    print(f"Reduction: {reduction:.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""Regression benchmark for filtering a folder listing with Files.extract_files.
+
+    The benchmark builds a synthetic listing of a single folder and measures the time taken
+    by extract_files to filter it against a time range and the configured indexing rules.
+    It exits with a non-zero status when the time per entry exceeds the given budget.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from ees_network_drive.configuration import Configuration  # noqa
+from ees_network_drive.files import Files  # noqa
+from ees_network_drive.indexing_rule import IndexingRules  # noqa
+from ees_network_drive.utils import rfc_3339_to_epoch  # noqa
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), "..", "tests", "config", "network_drive_connector.yml")
+EXTENSIONS = [".png", ".txt", ".jpg", ".pdf", ".gif"]
+
+
+def build_listing(entries):
+    """Returns a synthetic listPath result where roughly half of the files fall in the time range
+    :param entries: number of entries in the listing
+    """
+    base_time = rfc_3339_to_epoch("2022-01-01T00:00:00Z")
+    return [
+        SimpleNamespace(
+            isDirectory=index % 50 == 0,
+            filename=f"file{index}{EXTENSIONS[index % len(EXTENSIONS)]}",
+            last_attr_change_time=base_time + (index % 2) * 86400 * 365 + 0.25,
+            last_write_time=base_time + (index % 2) * 86400 * 365,
+            create_time=base_time,
+            file_size=(index * 37) % 30000,
+            file_id=index + 1,
+        )
+        for index in range(entries)
+    ]
+
+
+def main():
+    """Runs the benchmark and prints the time per listing entry"""
+    parser = argparse.ArgumentParser(prog="bench_extract_files")
+    parser.add_argument("--entries", type=int, default=50000, help="number of entries in the folder listing")
+    parser.add_argument("--rounds", type=int, default=5, help="number of times the listing is filtered")
+    parser.add_argument(
+        "--max-microseconds-per-entry", type=float, default=None, help="fail when the time per entry exceeds this"
+    )
+    args = parser.parse_args()
+
+    config = Configuration(file_name=CONFIG_FILE)
+    logger = logging.getLogger("bench_extract_files")
+    files = Files(logger, config, Mock())
+    indexing_rules = IndexingRules(config)
+    smb_connection = Mock()
+    smb_connection.listPath = Mock(return_value=build_listing(args.entries))
+    time_range = {
+        "start_time": rfc_3339_to_epoch("2021-12-28T15:14:28Z"),
+        "end_time": rfc_3339_to_epoch("2022-03-25T15:14:28Z"),
+    }
+
+    timings = []
+    for _ in range(args.rounds):
+        started_at = time.perf_counter()
+        storage = files.extract_files(smb_connection, "Users", "dummy", time_range, indexing_rules)
+        timings.append(time.perf_counter() - started_at)
+
+    per_entry = min(timings) / args.entries * 1000000
+    print(f"entries: {args.entries}, kept: {len(storage)}, best of {args.rounds}: {min(timings):.3f}s, "
+          f"{per_entry:.2f}us per entry")
+    if args.max_microseconds_per_entry is not None and per_entry > args.max_microseconds_per_entry:
+        print(f"Regression: {per_entry:.2f}us per entry exceeds the budget of {args.max_microseconds_per_entry}us")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
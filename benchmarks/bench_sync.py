@@ -0,0 +1,261 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""End to end benchmark of the full, incremental and deletion syncs.
+
+    The benchmark runs the sync commands of the connector against an in-process fake Network
+    Drives server serving a synthetic folder tree and a fake Enterprise Search accepting every
+    document, so the throughput of the connector can be measured without a file server. Tika is
+    replaced by a plain decoding of the file contents. The local storage, checkpoint and statistics
+    files are written to a temporary directory.
+
+    For each sync, the benchmark reports the documents processed per second, the peak resident
+    memory of the process and the number of SMB calls made per document. With --json, the timings
+    of the stages of each sync are included as well.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from types import SimpleNamespace
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from ees_network_drive import (checkpointing, crawl_statistics, deletion_sync_command, files,  # noqa
+                               full_sync_command, incremental_sync_command, local_storage)
+from ees_network_drive.deletion_sync_command import DeletionSyncCommand  # noqa
+from ees_network_drive.full_sync_command import FullSyncCommand  # noqa
+from ees_network_drive.incremental_sync_command import IncrementalSyncCommand  # noqa
+from ees_network_drive.metrics import METRICS  # noqa
+from ees_network_drive.sources import get_sources  # noqa
+
+from fakes import FakeNetworkDrive, FakeTree, FakeWorkplaceSearch  # noqa
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), "..", "tests", "config", "network_drive_connector.yml")
+SERVICE_NAME = "Benchmark"
+ROOT_PATH = "drive"
+
+
+def peak_rss_megabytes():
+    """Returns the peak resident memory of the process in megabytes, None if it cannot be measured"""
+    if not resource:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def isolate_state(stack, directory):
+    """Redirects the local storage, checkpoint, progress, statistics and lock files of the connector
+    to the directory, so that the benchmark does not touch the files of an installed connector
+    :param stack: ExitStack undoing the redirections
+    :param directory: path of the temporary directory
+    """
+    paths = {
+        "ids": os.path.join(directory, "doc_id.jsonl"),
+        "lock": os.path.join(directory, "connector.lock"),
+        "checkpoint": os.path.join(directory, "checkpoint.json"),
+        "progress": os.path.join(directory, "full_sync_progress.json"),
+        "stats": os.path.join(directory, "crawl_stats.json"),
+    }
+    for module, name, key in [
+        (full_sync_command, "IDS_PATH", "ids"),
+        (full_sync_command, "LOCK_PATH", "lock"),
+        (full_sync_command, "CHECKPOINT_PATH", "checkpoint"),
+        (full_sync_command, "PROGRESS_PATH", "progress"),
+        (full_sync_command, "STATS_PATH", "stats"),
+        (incremental_sync_command, "IDS_PATH", "ids"),
+        (incremental_sync_command, "STATS_PATH", "stats"),
+        (deletion_sync_command, "IDS_PATH", "ids"),
+    ]:
+        stack.enter_context(patch.object(module, name, paths[key]))
+    # The other commands rely on the default paths of the classes
+    for function, defaults in [
+        (local_storage.LocalStorage.__init__, (paths["ids"],)),
+        (local_storage.FileLock.__init__, (paths["lock"],)),
+        (checkpointing.Checkpoint.__init__, (paths["checkpoint"],)),
+        (crawl_statistics.CrawlStatistics.__init__, (paths["stats"],)),
+    ]:
+        stack.enter_context(patch.object(function, "__defaults__", defaults))
+
+
+def create_command(command_class, args, network_drive, workplace_search, logger):
+    """Returns a sync command using the fakes instead of the real clients"""
+    command = command_class(SimpleNamespace(config_file=CONFIG_FILE, **vars(args)))
+    configurations = command.config._Configuration__configurations
+    configurations.update({
+        "network_drive.path": f"{SERVICE_NAME}/{ROOT_PATH}",
+        "network_drives_sync_thread_count": args.fetch_threads,
+        "network_drives_sync_executor": "thread",
+        "enterprise_search_sync_thread_count": args.index_threads,
+        "enable_document_permission": args.ace_count > 0,
+        "network_drive_enterprise_search.user_mapping": None,
+        "include": None,
+        "exclude": None,
+        "start_time": "1970-01-01T00:00:00Z",
+        "max_in_flight_bytes": args.max_in_flight_bytes,
+        "prefetch_file_count": args.prefetch_file_count,
+    })
+    # The additional drives serve the same tree, their documents are told apart by the prefix of their IDs
+    configurations["network_drives"] = [
+        {"name": f"drive-{index}", "path": f"{SERVICE_NAME}/{ROOT_PATH}"} for index in range(1, args.drives)
+    ]
+    command.logger = logger
+    command.network_drive_client = network_drive
+    command.workplace_search_custom_client = workplace_search
+    command.sources = get_sources(command.config, logger)
+    for source in command.sources:
+        source.network_drive_client = network_drive
+    return command
+
+
+def run_sync(name, command, network_drive, workplace_search, documents):
+    """Runs the command and returns its measurements
+    :param documents: function returning the number of documents processed by the sync
+    """
+    network_drive.counter.reset()
+    METRICS.drain()
+    started_at = time.perf_counter()
+    command.execute()
+    seconds = time.perf_counter() - started_at
+    smb_calls = network_drive.counter.reset()
+    index_calls = workplace_search.counter.reset()
+    processed = documents()
+    return {
+        "sync": name,
+        "documents": processed,
+        "seconds": round(seconds, 3),
+        "documents_per_second": round(processed / seconds, 1) if seconds else None,
+        "peak_rss_mb": peak_rss_megabytes(),
+        "smb_calls": dict(smb_calls),
+        "smb_calls_per_document": round(sum(smb_calls.values()) / processed, 2) if processed else None,
+        "enterprise_search_calls": dict(index_calls),
+        "stages": METRICS.summary(),
+    }
+
+
+def main():
+    """Runs the full, incremental and deletion syncs and prints their measurements"""
+    parser = argparse.ArgumentParser(prog="bench_sync")
+    parser.add_argument("--fan-out", type=int, default=4, help="number of sub folders of each folder")
+    parser.add_argument("--depth", type=int, default=3, help="depth of the folder tree")
+    parser.add_argument("--files-per-folder", type=int, default=50, help="number of files in each folder")
+    parser.add_argument("--file-size", type=int, default=4096, help="size of each file in bytes")
+    parser.add_argument("--ace-count", type=int, default=3,
+                        help="number of users allowed on each file, 0 disables the document permissions")
+    parser.add_argument("--smb-latency", type=float, default=0.0, help="latency of each SMB call in seconds")
+    parser.add_argument("--index-latency", type=float, default=0.0,
+                        help="latency of each request to Enterprise Search in seconds")
+    parser.add_argument("--fetch-threads", type=int, default=5, help="number of threads fetching the files")
+    parser.add_argument("--index-threads", type=int, default=5, help="number of threads indexing the documents")
+    parser.add_argument("--modified-fraction", type=float, default=0.1,
+                        help="fraction of the files modified before the incremental sync")
+    parser.add_argument("--deleted-fraction", type=float, default=0.1,
+                        help="fraction of the files deleted before the deletion sync")
+    parser.add_argument("--max-in-flight-bytes", type=int, default=None,
+                        help="byte budget of the documents fetched and not indexed yet, unlimited by default")
+    parser.add_argument("--prefetch-file-count", type=int, default=0,
+                        help="number of files each fetching thread downloads ahead, disabled by default")
+    parser.add_argument("--extraction-latency", type=float, default=0.0,
+                        help="time spent extracting each file in seconds, standing for Tika")
+    parser.add_argument("--drives", type=int, default=1,
+                        help="number of drives synced by each run, all of them serving the same tree")
+    parser.add_argument("--json", action="store_true", help="print the measurements as json")
+    args = parser.parse_args()
+
+    logger = logging.getLogger("bench_sync")
+    logger.setLevel(logging.ERROR)
+    logger.addHandler(logging.StreamHandler())
+    # The deletion sync logs with the logger of the connector before the benchmark logger is set
+    logging.getLogger("ees_network_drive.base_command").disabled = True
+
+    tree = FakeTree(
+        ROOT_PATH, args.fan_out, args.depth, args.files_per_folder, args.file_size, int(time.time()) - 86400
+    )
+    network_drive = FakeNetworkDrive(tree, args.smb_latency, args.ace_count)
+    workplace_search = FakeWorkplaceSearch(args.index_latency)
+    command_args = SimpleNamespace(
+        fetch_threads=args.fetch_threads, index_threads=args.index_threads, ace_count=args.ace_count,
+        max_in_flight_bytes=args.max_in_flight_bytes, prefetch_file_count=args.prefetch_file_count,
+        drives=args.drives,
+    )
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory, ExitStack() as stack:
+        isolate_state(stack, directory)
+        stack.enter_context(patch("ees_network_drive.extractors.extract", lambda content: content.decode("utf-8")))
+
+        if args.extraction_latency:
+            extract_content = files.extract_content
+
+            def slow_extract_content(file_name, content):
+                time.sleep(args.extraction_latency)
+                return extract_content(file_name, content)
+
+            stack.enter_context(patch.object(files, "extract_content", slow_extract_content))
+
+        def create(command_class):
+            return create_command(command_class, command_args, network_drive, workplace_search, logger)
+
+        def indexed_since(count):
+            return lambda: workplace_search.indexed - count
+
+        results.append(run_sync(
+            "full", create(FullSyncCommand), network_drive, workplace_search, indexed_since(0)
+        ))
+
+        # The incremental sync fetches the files modified after the checkpoint, which has a precision
+        # of one second
+        time.sleep(1.1)
+        tree.touch(args.modified_fraction, int(time.time()))
+        indexed = workplace_search.indexed
+        results.append(run_sync(
+            "incremental", create(IncrementalSyncCommand), network_drive, workplace_search, indexed_since(indexed)
+        ))
+
+        deleted = tree.delete(args.deleted_fraction)
+        # Every stored document is checked by the deletion sync
+        results.append(run_sync(
+            "deletion", create(DeletionSyncCommand), network_drive, workplace_search,
+            lambda: (tree.file_count() + deleted) * args.drives
+        ))
+        if workplace_search.deleted != deleted * args.drives:
+            print(
+                f"Warning: {deleted * args.drives} files were deleted but {workplace_search.deleted} documents "
+                "were removed"
+            )
+
+    if args.json:
+        print(json.dumps({
+            "files": tree.file_count() + deleted, "folders": len(tree.folders), "drives": args.drives,
+            "results": results,
+        }))
+        return 0
+    print(
+        f"Tree: {args.drives} drives of {len(tree.folders)} folders, {tree.file_count() + deleted} files of "
+        f"{args.file_size} bytes"
+    )
+    print(f"{'Sync':<12} {'Documents':>10} {'Seconds':>9} {'Docs/sec':>10} {'Peak RSS MB':>12} {'SMB calls/doc':>14}")
+    for result in results:
+        print(
+            f"{result['sync']:<12} {result['documents']:>10} {result['seconds']:>9} "
+            f"{str(result['documents_per_second']):>10} {str(result['peak_rss_mb']):>12} "
+            f"{str(result['smb_calls_per_document']):>14}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
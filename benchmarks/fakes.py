@@ -0,0 +1,220 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""In-process fakes of the Network Drives server and of Enterprise Search used by the benchmarks.
+
+    FakeNetworkDrive serves a synthetic folder tree through objects implementing the subset of the
+    pysmb SMBConnection interface used by the connector, and FakeWorkplaceSearch accepts the indexing
+    and deletion requests of the connector without sending them anywhere. Both count the calls they
+    receive so that the benchmarks can report the number of calls made per document.
+"""
+import os
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+from smb.base import SharedFile
+from smb.smb_constants import ATTR_DIRECTORY, ATTR_NORMAL
+
+SEARCH_DIRECTORIES = 16
+ACCESS_ALLOWED_TYPE = 0
+ACCESS_DENIED_TYPE = 1
+
+
+class CallCounter:
+    """Thread-safe counter of the calls received by a fake"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = Counter()
+
+    def count(self, name):
+        """Counts a call
+        :param name: name of the called method
+        """
+        with self.lock:
+            self.calls[name] += 1
+
+    def reset(self):
+        """Returns the counted calls and starts counting from zero"""
+        with self.lock:
+            calls, self.calls = self.calls, Counter()
+        return calls
+
+
+class FakeTree:
+    """Synthetic folder tree of a Network Drive.
+
+    Every folder below the root has fan_out sub folders down to the given depth, and contains
+    files_per_folder files of file_size bytes.
+    """
+
+    def __init__(self, root, fan_out, depth, files_per_folder, file_size, modified_at):
+        self.root = root
+        self.file_size = file_size
+        self.lock = threading.Lock()
+        self.folders = {}
+        self.next_file_id = 1
+        self.dots = [self.shared_file(".", modified_at, True), self.shared_file("..", modified_at, True)]
+        self.build(root, fan_out, depth, files_per_folder, modified_at)
+
+    def build(self, path, fan_out, depth, files_per_folder, modified_at):
+        """Adds the folder and its sub folders to the tree"""
+        entries = {}
+        for index in range(files_per_folder):
+            file_name = f"file{index}.txt"
+            entries[file_name] = self.shared_file(file_name, modified_at, False)
+        if depth:
+            for index in range(fan_out):
+                folder_name = f"folder{index}"
+                entries[folder_name] = self.shared_file(folder_name, modified_at, True)
+                self.build(os.path.join(path, folder_name), fan_out, depth - 1, files_per_folder, modified_at)
+        self.folders[path] = entries
+
+    def shared_file(self, name, modified_at, is_directory):
+        """Returns the pysmb entry of a file or a folder"""
+        file_id = self.next_file_id
+        self.next_file_id += 1
+        return SharedFile(
+            modified_at, modified_at, modified_at, modified_at,
+            0 if is_directory else self.file_size, 0,
+            ATTR_DIRECTORY if is_directory else ATTR_NORMAL,
+            name, name, file_id,
+        )
+
+    def file_count(self):
+        """Returns the number of files in the tree"""
+        return sum(not entry.isDirectory for entries in self.folders.values() for entry in entries.values())
+
+    def touch(self, fraction, modified_at):
+        """Updates the modification time of a fraction of the files
+        :param fraction: fraction of the files of each folder to be modified, between 0 and 1
+        :param modified_at: new modification time in seconds since the epoch
+        """
+        with self.lock:
+            for entries in self.folders.values():
+                files = [entry for entry in entries.values() if not entry.isDirectory]
+                for entry in files[:int(len(files) * fraction)]:
+                    entry.last_attr_change_time = entry.last_write_time = modified_at
+
+    def delete(self, fraction):
+        """Deletes a fraction of the files of each folder
+        :param fraction: fraction of the files of each folder to be deleted, between 0 and 1
+        Returns:
+            count: number of deleted files
+        """
+        deleted = 0
+        with self.lock:
+            for entries in self.folders.values():
+                files = [name for name, entry in entries.items() if not entry.isDirectory]
+                for name in files[:int(len(files) * fraction)]:
+                    entries.pop(name)
+                    deleted += 1
+        return deleted
+
+
+class FakeSMBConnection:
+    """Implements the methods of the pysmb SMBConnection used by the connector on top of a FakeTree"""
+
+    def __init__(self, tree, counter, latency, ace_count):
+        self.tree = tree
+        self.counter = counter
+        self.latency = latency
+        self.ace_count = ace_count
+
+    def call(self, name):
+        """Counts the call and waits for the configured server latency"""
+        self.counter.count(name)
+        if self.latency:
+            time.sleep(self.latency)
+
+    def listPath(self, service_name, path, search=None):
+        """Returns the entries of a folder, only the sub folders when search is the directory attribute"""
+        self.call("listPath")
+        path = os.path.normpath(path)
+        with self.tree.lock:
+            entries = list(self.tree.folders[path].values())
+        if search == SEARCH_DIRECTORIES:
+            entries = [entry for entry in entries if entry.isDirectory]
+        return self.tree.dots + entries
+
+    def getSecurity(self, service_name, path):
+        """Returns a security descriptor allowing ace_count users and denying one"""
+        self.call("getSecurity")
+        aces = [
+            SimpleNamespace(sid=f"S-1-5-21-1000-{index}", type=ACCESS_ALLOWED_TYPE, mask=1179817)
+            for index in range(self.ace_count)
+        ]
+        aces.append(SimpleNamespace(sid="S-1-5-21-1000-9999", type=ACCESS_DENIED_TYPE, mask=1179817))
+        return SimpleNamespace(dacl=SimpleNamespace(aces=aces))
+
+    def retrieveFile(self, service_name, path, file_obj):
+        """Writes the synthetic contents of the file to the file object"""
+        self.call("retrieveFile")
+        file_obj.write(b"x" * self.tree.file_size)
+        return ATTR_NORMAL, self.tree.file_size
+
+    def close(self):
+        """Closes the fake connection"""
+
+
+class FakeNetworkDrive:
+    """Replaces the NetworkDrive client of the connector, each connection serves the same FakeTree"""
+
+    def __init__(self, tree, latency=0, ace_count=3):
+        self.tree = tree
+        self.latency = latency
+        self.ace_count = ace_count
+        self.counter = CallCounter()
+        self.connection_key = ("fake", id(tree))
+
+    def connect(self):
+        """Returns a new fake connection"""
+        self.counter.count("connect")
+        return FakeSMBConnection(self.tree, self.counter, self.latency, self.ace_count)
+
+
+class FakeWorkplaceSearch:
+    """Replaces the EnterpriseSearchWrapper of the connector, accepting every document"""
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.counter = CallCounter()
+        self.lock = threading.Lock()
+        self.indexed = 0
+        self.deleted = 0
+        self.documents = {}
+
+    def index_documents(self, documents, timeout):
+        """Accepts the documents and returns a response without errors"""
+        self.counter.count("index_documents")
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.indexed += len(documents)
+            for document in documents:
+                self.documents[document["id"]] = document
+        return {"results": [{"id": document["id"], "errors": []} for document in documents]}
+
+    def update_document_permissions(self, documents, timeout):
+        """Updates the permissions of the indexed documents and returns a response without errors"""
+        self.counter.count("update_document_permissions")
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            for document in documents:
+                self.documents.setdefault(document["id"], {"id": document["id"]}).update(document)
+        return {"results": [{"id": document["id"], "errors": []} for document in documents]}
+
+    def delete_documents(self, document_ids):
+        """Accepts the deletion of the documents"""
+        self.counter.count("delete_documents")
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.deleted += len(document_ids)
+            for document_id in document_ids:
+                self.documents.pop(document_id, None)
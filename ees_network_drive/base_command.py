@@ -9,6 +9,7 @@ Connector can run multiple commands such as full-sync, incremental-sync,
 etc. This module provides convenience interface defining the shared
 objects and methods that will can be used by commands."""
 import logging
+import threading
 
 try:
     from functools import cached_property
@@ -17,11 +18,14 @@ except ImportError:
 
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from .byte_budget import ByteBudget
 from .configuration import Configuration
+from .content_cache import ContentCache
 from .enterprise_search_wrapper import EnterpriseSearchWrapper
 from .indexing_rule import IndexingRules
 from .local_storage import LocalStorage
 from .network_drive_client import NetworkDrive
+from .sources import get_sources, interleave
 
 
 class BaseCommand:
@@ -75,6 +79,13 @@ class BaseCommand:
         """Get the Network Drives client instance for the running command."""
         return NetworkDrive(self.config, self.logger)
 
+    @cached_property
+    def sources(self):
+        """Get the Network Drives synced by the running command, the drive configured with the network_drive.*
+        settings followed by the drives listed in the network_drives setting.
+        """
+        return get_sources(self.config, self.logger)
+
     @cached_property
     def indexing_rules(self):
         """Get the object for indexing rules to check should the file be indexed or not
@@ -109,6 +120,81 @@ class BaseCommand:
                     executor.submit(func)
         return documents
 
+    def fetch_drives(self, drive_syncs):
+        """Fetches the folders of the drives with the fetching threads shared by the drives. The folders of each
+        drive are taken in turn, so that every drive gets its share of the threads
+        :param drive_syncs: list of the DriveSync objects of the drives, with the folders to be fetched
+        """
+        thread_count = self.config.get_value("network_drives_sync_thread_count")
+        thread_count = max(
+            [drive_sync.crawl_statistics.suggest_thread_count(drive_sync.folders, thread_count)
+             for drive_sync in drive_syncs] or [thread_count]
+        )
+        # Every folder is queued as a separate job, so that idle threads keep pulling folders until
+        # the whole drives are fetched
+        jobs = interleave([[(drive_sync, [folder]) for folder in drive_sync.folders] for drive_sync in drive_syncs])
+        self.logger.info(f"Fetching {len(jobs)} folders of {len(drive_syncs)} drives using {thread_count} threads")
+        with ThreadPoolExecutor(max_workers=thread_count) as executor:
+            future_to_job = {executor.submit(drive_sync.fetch, partition_paths): (drive_sync, partition_paths)
+                             for drive_sync, partition_paths in jobs}
+            for future in as_completed(future_to_job):
+                drive_sync, path = future_to_job[future]
+                try:
+                    future.result()
+                except Exception as exception:
+                    self.logger.exception(
+                        f"Error while fetching in path {path} of the drive {drive_sync.source.checkpoint_key}. "
+                        f"Error {exception}"
+                    )
+
+    def create_budget(self):
+        """Returns the byte budget shared by the fetching and indexing threads of a sync, None if the
+        max_in_flight_bytes setting is not provided"""
+        max_in_flight_bytes = self.config.get_value("max_in_flight_bytes")
+        return ByteBudget(max_in_flight_bytes) if max_in_flight_bytes else None
+
+    def create_content_cache(self, cache_path=None):
+        """Returns the cache of the texts extracted by the fetching threads of a sync, loaded from the cache
+        file if any, None if the content_cache_max_bytes setting is not provided
+        :param cache_path: path of the cache file, the content_cache_path setting by default
+        """
+        max_bytes = self.config.get_value("content_cache_max_bytes")
+        if not max_bytes:
+            return None
+        content_cache = ContentCache(max_bytes)
+        cache_path = cache_path or self.config.get_value("content_cache_path")
+        if cache_path:
+            content_cache.load(cache_path, self.logger)
+        return content_cache
+
+    def save_content_cache(self, content_cache, cache_path=None):
+        """Saves the texts extracted by a sync to the cache file, if the content_cache_path setting is provided
+        :param content_cache: ContentCache object returned by create_content_cache
+        :param cache_path: path of the cache file, the content_cache_path setting by default
+        """
+        cache_path = cache_path or self.config.get_value("content_cache_path")
+        if content_cache and cache_path:
+            content_cache.save(cache_path, self.logger)
+
+    def run_producer_and_consumer(self, queue, producer, consumer):
+        """Runs the consumer while the producer fetches the documents, so that the documents are indexed
+        as soon as they are fetched. The end signals are sent to the consumer threads once the producer
+        completes or fails
+        :param queue: Shared queue to store the fetched documents
+        :param producer: function fetching the documents and pushing them in the queue
+        :param consumer: function indexing the documents of the queue until it receives the end signals
+        """
+        consumer_thread = threading.Thread(target=consumer)
+        consumer_thread.start()
+        try:
+            producer()
+        finally:
+            # Send end signals for each live threads to notify them to close watching the queue
+            # for any incoming documents
+            for _ in range(self.config.get_value("enterprise_search_sync_thread_count")):
+                queue.end_signal()
+            consumer_thread.join()
+
     @cached_property
     def local_storage(self):
         """Get the object for local storage to fetch and update ids stored locally
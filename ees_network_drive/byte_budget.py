@@ -0,0 +1,98 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""This module bounds the memory used by the documents of a running sync.
+
+    The fetching threads reserve the size of each file from a global budget before downloading
+    it, and the indexing threads release the reservation once the document has been sent to
+    Enterprise Search. When the budget is exhausted, the fetching threads wait for the indexing
+    threads to catch up instead of buffering more documents. The files downloaded ahead by the
+    prefetchers reserve their size from the same budget.
+"""
+import threading
+
+
+class ByteBudget:
+    """This class holds the number of bytes reserved by the documents in flight, keyed by document id"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.condition = threading.Condition()
+        self.used = 0
+        self.waiters = 0
+        self.closed = False
+        self.reservations = {}
+
+    def fits(self, size):
+        """Returns True if the size can be reserved without waiting. A document larger than the whole
+        budget is reserved once the budget is empty, so it cannot block the sync forever"""
+        return self.closed or not self.used or self.used + size <= self.limit
+
+    def reserve(self, document_id, size):
+        """Reserves the size for the document"""
+        self.used += size
+        self.reservations[document_id] = self.reservations.get(document_id, 0) + size
+
+    def acquire(self, document_id, size, on_wait=None):
+        """Reserves the size of a document, waiting for other documents to be released if the budget is
+        exhausted
+        :param document_id: id of the document
+        :param size: number of bytes to be reserved
+        :param on_wait: function called before waiting, to hand the documents held by the caller to the
+            indexing threads. Otherwise the fetching threads could hold the whole budget while nothing
+            can be indexed
+        """
+        size = min(max(size or 0, 0), self.limit)
+        with self.condition:
+            if self.fits(size):
+                self.reserve(document_id, size)
+                return
+        if on_wait:
+            on_wait()
+        with self.condition:
+            self.waiters += 1
+            try:
+                while not self.fits(size):
+                    self.condition.wait()
+            finally:
+                self.waiters -= 1
+            self.reserve(document_id, size)
+
+    def try_acquire(self, document_id, size):
+        """Reserves the size of a document if the budget allows it without waiting, and no fetching thread is
+        waiting for the budget. Used to download files ahead, which should not take the budget from the files
+        being fetched
+        :param document_id: id of the document
+        :param size: number of bytes to be reserved
+        Returns:
+            reserved: True if the size was reserved
+        """
+        size = min(max(size or 0, 0), self.limit)
+        with self.condition:
+            if self.waiters or not self.fits(size):
+                return False
+            self.reserve(document_id, size)
+            return True
+
+    def release(self, document_ids):
+        """Releases the bytes reserved by the documents
+        :param document_ids: ids of the documents indexed or dropped
+        """
+        with self.condition:
+            for document_id in document_ids:
+                self.used -= self.reservations.pop(document_id, 0)
+            self.condition.notify_all()
+
+    def has_waiters(self):
+        """Returns True if a fetching thread is waiting for the budget"""
+        with self.condition:
+            return self.waiters > 0
+
+    def close(self):
+        """Stops enforcing the budget, so that the fetching threads are not blocked forever when the
+        indexing threads stopped"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
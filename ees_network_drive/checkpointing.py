@@ -14,11 +14,15 @@
 """
 import json
 import os
+import threading
+import time
 
-from .constant import RFC_3339_DATETIME_FORMAT
+from .constant import PROGRESS_FLUSH_INTERVAL, RFC_3339_DATETIME_FORMAT
 from .schema import coerce_rfc_3339_date
+from .utils import write_json_atomically
 
 CHECKPOINT_PATH = os.path.join(os.path.dirname(__file__), 'checkpoint.json')
+PROGRESS_PATH = os.path.join(os.path.dirname(__file__), 'full_sync_progress.json')
 
 
 class IncorrectFormatError(Exception):
@@ -42,9 +46,10 @@ class Checkpoint:
         This class allows to get and set checkpoints, storing them in
         file system.
     """
-    def __init__(self, config, logger):
+    def __init__(self, config, logger, checkpoint_path=CHECKPOINT_PATH):
         self.config = config
         self.logger = logger
+        self.checkpoint_path = checkpoint_path
 
     def get_checkpoint(self, current_time, obj_type):
         """This method fetches the checkpoint from the checkpoint file in
@@ -54,18 +59,18 @@ class Checkpoint:
            :param obj_type: drive for which checkpoint is fetched
         """
         self.logger.info(
-            f"Fetching the checkpoint details from the checkpoint file: {CHECKPOINT_PATH}"
+            f"Fetching the checkpoint details from the checkpoint file: {self.checkpoint_path}"
         )
 
         start_time = self.config.get_value("start_time")
         end_time = self.config.get_value("end_time")
 
-        if os.path.exists(CHECKPOINT_PATH) and os.path.getsize(CHECKPOINT_PATH) > 0:
+        if os.path.exists(self.checkpoint_path) and os.path.getsize(self.checkpoint_path) > 0:
             self.logger.debug(
                 "Checkpoint file exists and has contents, hence considering the checkpoint time \
                 instead of start_time and end_time"
             )
-            with open(CHECKPOINT_PATH, encoding="UTF-8") as checkpoint_store:
+            with open(self.checkpoint_path, encoding="UTF-8") as checkpoint_store:
                 try:
                     checkpoint_list = json.load(checkpoint_store)
 
@@ -84,7 +89,7 @@ class Checkpoint:
                             raise IncorrectFormatError(obj_type, checkpoint_list.get(obj_type), exception)
                 except ValueError as exception:
                     self.logger.exception(
-                        f"Error while parsing the json file of the checkpoint store from path: {CHECKPOINT_PATH}. \
+                        f"Error while parsing the json file of the checkpoint store from path: {self.checkpoint_path}. \
                             Error: {exception}"
                     )
                     self.logger.info(
@@ -93,7 +98,7 @@ class Checkpoint:
 
         else:
             self.logger.debug(
-                f"Checkpoint file does not exist at {CHECKPOINT_PATH}, considering \
+                f"Checkpoint file does not exist at {self.checkpoint_path}, considering \
                 the start_time and end_time from the configuration file"
             )
 
@@ -109,47 +114,197 @@ class Checkpoint:
             :index_type: indexing type from "incremental" or "full_sync"
             :param obj_type: object type to set the checkpoint
         """
+        # The first checkpoint of an object is the end_time of an incremental sync, and the time given by a full sync,
+        # even when the checkpoints of other drives are already stored
+        if index_type == "incremental":
+            first_checkpoint_time = self.config.get_value('end_time')
+        else:
+            first_checkpoint_time = current_time
         try:
-            with open(CHECKPOINT_PATH, encoding="UTF-8") as checkpoint_store:
+            with open(self.checkpoint_path, encoding="UTF-8") as checkpoint_store:
                 checkpoint_list = json.load(checkpoint_store)
                 if checkpoint_list.get(obj_type):
                     self.logger.debug(
                         f"Setting the checkpoint contents: {current_time} for the {obj_type} \
-                        to the checkpoint path: {CHECKPOINT_PATH}"
+                        to the checkpoint path: {self.checkpoint_path}"
                     )
                     checkpoint_list[obj_type] = current_time
                 else:
                     self.logger.debug(
-                        f"Setting the checkpoint contents: {self.config.get_value('end_time')} for the {obj_type} \
-                        to the checkpoint path: {CHECKPOINT_PATH}"
+                        f"Setting the checkpoint contents: {first_checkpoint_time} for the {obj_type} \
+                        to the checkpoint path: {self.checkpoint_path}"
                     )
-                    checkpoint_list[obj_type] = self.config.get_value('end_time')
+                    checkpoint_list[obj_type] = first_checkpoint_time
         except Exception as exception:
             if isinstance(exception, FileNotFoundError):
                 self.logger.debug(
-                    f"Checkpoint file not found on path: {CHECKPOINT_PATH}. Generating the checkpoint file"
+                    f"Checkpoint file not found on path: {self.checkpoint_path}. Generating the checkpoint file"
                 )
             else:
                 self.logger.exception(
-                    f"Error while fetching the json file of the checkpoint store from path: {CHECKPOINT_PATH}. \
+                    f"Error while fetching the json file of the checkpoint store from path: {self.checkpoint_path}. \
                     Error: {exception}"
                 )
-            if index_type == "incremental":
-                checkpoint_time = self.config.get_value('end_time')
-            else:
-                checkpoint_time = current_time
             self.logger.debug(
-                f"Setting the checkpoint contents: {checkpoint_time} for the {obj_type} \
-                to the checkpoint path: {CHECKPOINT_PATH}"
+                f"Setting the checkpoint contents: {first_checkpoint_time} for the {obj_type} \
+                to the checkpoint path: {self.checkpoint_path}"
             )
-            checkpoint_list = {obj_type: checkpoint_time}
+            checkpoint_list = {obj_type: first_checkpoint_time}
 
-        with open(CHECKPOINT_PATH, "w", encoding="UTF-8") as checkpoint_store:
-            try:
-                json.dump(checkpoint_list, checkpoint_store, indent=4)
-                self.logger.info("Successfully saved the checkpoint")
-            except ValueError as exception:
-                self.logger.exception(
-                    f"Error while updating the existing checkpoint json file. \
-                    Adding the new content directly instead of updating. Error: {exception}"
-                )
+        try:
+            write_json_atomically(self.checkpoint_path, checkpoint_list)
+            self.logger.info("Successfully saved the checkpoint")
+        except ValueError as exception:
+            self.logger.exception(
+                f"Error while updating the existing checkpoint json file. \
+                The previous checkpoint is kept. Error: {exception}"
+            )
+
+
+class SyncProgress:
+    """SyncProgress class keeps track of the progress of a full sync, so that an interrupted
+        full sync can be resumed.
+
+        A group of folders is completed once every document fetched from it has been acknowledged
+        by Enterprise Search. The completed folders, along with the IDs of their documents, are
+        flushed periodically to the progress file.
+    """
+
+    def __init__(self, logger, progress_path=PROGRESS_PATH, flush_interval=PROGRESS_FLUSH_INTERVAL):
+        self.logger = logger
+        self.progress_path = progress_path
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        # Held while the progress file is written, so that the threads registering and acknowledging documents only
+        # wait for the snapshot of the completed folders, and an older snapshot never replaces a newer one
+        self.flush_lock = threading.Lock()
+        self.started_at = None
+        self.completed_folders = {}
+        self.pending = {}
+        self.pending_ids = {}
+        self.last_flush = time.monotonic()
+
+    def start(self, started_at):
+        """Starts tracking a new full sync, discarding the progress of any previous full sync
+        :param started_at: time at which the full sync started
+        """
+        self.started_at = started_at
+        self.completed_folders = {}
+        self.flush(force=True)
+
+    def resume(self):
+        """Loads the progress of the interrupted full sync
+        Returns:
+            resumed: True if the progress of a previous full sync was found
+        """
+        try:
+            with open(self.progress_path, encoding="UTF-8") as progress_file:
+                progress = json.load(progress_file)
+        except FileNotFoundError:
+            self.logger.info(f"No progress found at {self.progress_path}, starting a new full sync")
+            return False
+        except ValueError as exception:
+            self.logger.exception(
+                f"Error while parsing the progress file from path: {self.progress_path}. Error: {exception}"
+            )
+            return False
+        self.started_at = progress["started_at"]
+        self.completed_folders = progress.get("folders", {})
+        self.logger.info(
+            f"Resuming the full sync started at {self.started_at}, {len(self.completed_folders)} folders are already \
+            completed"
+        )
+        return True
+
+    def register(self, folders, documents, fetched=True, failed_folders=()):
+        """Registers the documents fetched from a group of folders before they are sent to Enterprise Search.
+        The documents of a group can be registered in several calls, the last one with fetched set to True
+        :param folders: list of folder paths the documents were fetched from
+        :param documents: list of documents fetched from the folders
+        :param fetched: False if more documents of the folders will be registered
+        :param failed_folders: folders of the group that could not be listed, which are never completed so that a
+            resumed full sync fetches them again
+        """
+        key = tuple(folders)
+        with self.lock:
+            pending = self.pending.setdefault(
+                key, {"ids": set(), "documents": {}, "fetched": False, "failed": set()}
+            )
+            for doc in documents:
+                pending["ids"].add(doc["id"])
+                pending["documents"][doc["id"]] = doc["path"]
+                self.pending_ids[doc["id"]] = key
+            pending["failed"].update(failed_folders)
+            pending["fetched"] = pending["fetched"] or fetched
+            self._complete_if_acknowledged(key)
+        self.flush()
+
+    def acknowledge(self, document_ids):
+        """Marks the documents as indexed by Enterprise Search
+        :param document_ids: list of IDs of the indexed documents
+        """
+        with self.lock:
+            for document_id in document_ids:
+                key = self.pending_ids.pop(document_id, None)
+                if key is not None:
+                    self.pending[key]["ids"].discard(document_id)
+                    self._complete_if_acknowledged(key)
+        self.flush()
+
+    def _complete_if_acknowledged(self, key):
+        """Moves the group of folders to the completed folders once all its documents are acknowledged"""
+        if self.pending[key]["fetched"] and not self.pending[key]["ids"]:
+            pending = self.pending.pop(key)
+            folders = [folder for folder in key if folder not in pending["failed"]]
+            for folder in folders:
+                self.completed_folders[folder] = {}
+            if folders:
+                self.completed_folders[folders[0]] = pending["documents"]
+
+    def completed_ids(self):
+        """Returns the IDs and paths of the documents of all the completed folders"""
+        with self.lock:
+            ids = {}
+            for documents in self.completed_folders.values():
+                ids.update(documents)
+            return ids
+
+    def flush(self, force=False):
+        """Writes the completed folders to the progress file if the flush interval has elapsed
+        :param force: write the progress file regardless of the flush interval
+        """
+        # A periodic flush is skipped while another thread writes the progress file, rather than waiting for it
+        if not self.flush_lock.acquire(blocking=force):
+            return
+        try:
+            with self.lock:
+                if not force and time.monotonic() - self.last_flush < self.flush_interval:
+                    return
+                self.last_flush = time.monotonic()
+                # The documents of a completed folder are not modified anymore, so copying the folders is enough
+                progress = {"started_at": self.started_at, "folders": dict(self.completed_folders)}
+            write_json_atomically(self.progress_path, progress)
+        finally:
+            self.flush_lock.release()
+
+    def clear(self):
+        """Removes the progress file once the full sync has completed"""
+        if os.path.exists(self.progress_path):
+            os.remove(self.progress_path)
+
+
+class SyncProgressGroup:
+    """SyncProgressGroup class forwards the documents acknowledged by Enterprise Search to the progress of
+        each drive synced by a full sync. The IDs of the documents of different drives do not collide, so
+        each progress only completes the folders of its own documents.
+    """
+
+    def __init__(self, sync_progresses):
+        self.sync_progresses = sync_progresses
+
+    def acknowledge(self, document_ids):
+        """Marks the documents as indexed by Enterprise Search
+        :param document_ids: list of IDs of the indexed documents
+        """
+        for sync_progress in self.sync_progresses:
+            sync_progress.acknowledge(document_ids)
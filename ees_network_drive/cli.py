@@ -12,18 +12,27 @@ to Elastic Enterprise Search with subcommands."""
 import os
 import getpass
 from argparse import ArgumentParser
+from contextlib import nullcontext
 
 from .bootstrap_command import BootstrapCommand
 from .deletion_sync_command import DeletionSyncCommand
 from .full_sync_command import FullSyncCommand
 from .incremental_sync_command import IncrementalSyncCommand
+from .merge_shards_command import MergeShardsCommand
+from .metrics import METRICS
+from .metrics_exporter import MetricsExporter
 from .permission_sync_command import PermissionSyncCommand
+from .profiling import PROFILE_MODES, Profiler
+from .sharding import parse_shard, parse_shard_count
+from .stats_command import StatsCommand
 
 CMD_BOOTSTRAP = 'bootstrap'
 CMD_FULL_SYNC = 'full-sync'
 CMD_INCREMENTAL_SYNC = 'incremental-sync'
 CMD_DELETION_SYNC = 'deletion-sync'
 CMD_PERMISSION_SYNC = 'permission-sync'
+CMD_MERGE_SHARDS = 'merge-shards'
+CMD_STATS = 'stats'
 
 commands = {
     CMD_BOOTSTRAP: BootstrapCommand,
@@ -31,6 +40,8 @@ commands = {
     CMD_INCREMENTAL_SYNC: IncrementalSyncCommand,
     CMD_DELETION_SYNC: DeletionSyncCommand,
     CMD_PERMISSION_SYNC: PermissionSyncCommand,
+    CMD_MERGE_SHARDS: MergeShardsCommand,
+    CMD_STATS: StatsCommand,
 }
 
 
@@ -47,6 +58,18 @@ def _parser():
         metavar="CONFIGURATION_FILE_PATH",
         help="path to the configuration file"
     )
+    parser.add_argument(
+        '--profile',
+        choices=PROFILE_MODES,
+        help="profile the command: cpu or wall time spent in each function of each thread, or memory allocations"
+    )
+    parser.add_argument(
+        '--profile-dir',
+        type=str,
+        default=".",
+        metavar="PROFILE_DIRECTORY_PATH",
+        help="directory in which the profiles are written, the current directory by default"
+    )
 
     subparsers = parser.add_subparsers(dest="cmd")
     subparsers.required = True
@@ -69,10 +92,47 @@ def _parser():
         help="Username of the workplace search admin account"
     )
 
-    subparsers.add_parser(CMD_FULL_SYNC)
+    full_sync = subparsers.add_parser(CMD_FULL_SYNC)
+    full_sync.add_argument(
+        '--shard',
+        required=False,
+        type=parse_shard,
+        metavar="INDEX/TOTAL",
+        help="Sync only the folders of the given shard, for example 0/4"
+    )
+    full_sync.add_argument(
+        '--resume',
+        required=False,
+        action='store_true',
+        help="Skip the folders completed by the previous full sync if it was interrupted"
+    )
     subparsers.add_parser(CMD_INCREMENTAL_SYNC)
     subparsers.add_parser(CMD_DELETION_SYNC)
     subparsers.add_parser(CMD_PERMISSION_SYNC)
+    merge_shards = subparsers.add_parser(CMD_MERGE_SHARDS)
+    merge_shards.add_argument(
+        '--shards',
+        required=True,
+        type=parse_shard_count,
+        metavar="TOTAL",
+        help="Total number of shards used for the full sync"
+    )
+    stats = subparsers.add_parser(CMD_STATS)
+    stats.add_argument(
+        '--top',
+        required=False,
+        type=int,
+        default=20,
+        metavar="FOLDER_COUNT",
+        help="Number of folders to display, starting from the slowest"
+    )
+    stats.add_argument(
+        '--shards',
+        required=False,
+        type=parse_shard_count,
+        metavar="TOTAL",
+        help="Total number of shards used for the full sync, to display the statistics of each shard"
+    )
 
     return parser
 
@@ -96,7 +156,24 @@ def run(args):
     """Run the command from the parsed args.
 
     This method takes already parsed and validated arguments
-    and attempts to run the command with specified arguments."""
-    commands[args.cmd](args).execute()
+    and attempts to run the command with specified arguments.
+    The metrics are exported while the command is running, if configured, and the timings of
+    the stages of the sync are logged once the command completes. The command is profiled if
+    the --profile option is provided."""
+    command = commands[args.cmd](args)
+    exporter = MetricsExporter(command.config, command.logger)
+    exporter.start()
+    profile_mode = getattr(args, "profile", None)
+    if profile_mode:
+        profiler = Profiler(profile_mode, args.profile_dir, args.cmd, command.config, command.logger)
+    else:
+        profiler = nullcontext()
+    try:
+        with profiler:
+            command.execute()
+    finally:
+        exporter.stop()
+        if METRICS.histograms or METRICS.counters:
+            METRICS.log_summary(command.logger)
 
     return 0
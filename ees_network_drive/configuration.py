@@ -61,6 +61,23 @@ class Configuration:
             raise ConfigurationInvalidException(f"The start_time: {self.__configurations['start_time']}  \
                     cannot be greater than or equal to the end_time: {self.__configurations['end_time']}")
 
+        source_names = [source["name"] for source in self.__configurations.get("network_drives") or []]
+        duplicate_names = sorted({name for name in source_names if source_names.count(name) > 1})
+        if duplicate_names:
+            raise ConfigurationInvalidException(f"The names of the network_drives must be unique. \
+                    Duplicate names: {duplicate_names}")
+        # The checkpoint of the drive configured with the network_drive.* settings is keyed by its server name
+        if self.__configurations.get("network_drive.server_name") in source_names:
+            raise ConfigurationInvalidException(f"The names of the network_drives must differ from the \
+                    network_drive.server_name: {self.__configurations['network_drive.server_name']}")
+
+        # The byte budget is held by the connector process, so the worker processes downloading the files cannot wait
+        # on it
+        if self.__configurations.get("max_in_flight_bytes") and \
+                self.__configurations.get("network_drives_sync_executor") == "process":
+            raise ConfigurationInvalidException("The max_in_flight_bytes setting cannot be used when the \
+                    network_drives_sync_executor is process")
+
         for date_config in ["start_time", "end_time"]:
             value = self.__configurations[date_config]
             self.__configurations[date_config] = self.__parse_date_config_value(value)
@@ -31,3 +31,12 @@ class ConnectorQueue(Queue):
             self.logger.debug(f"Thread ID {threading.get_ident()} added list of {len(documents)} \
                 documents into the queue ")
             self.put(documents_map)
+
+    def append_permission_updates(self, documents):
+        """Append the documents whose permissions only are updated to the shared queue
+        :param documents: documents of the files whose content did not change
+        """
+        if documents:
+            self.logger.debug(f"Thread ID {threading.get_ident()} added list of {len(documents)} \
+                permission updates into the queue ")
+            self.put({"type": "permission_update", "data": documents})
@@ -9,3 +9,9 @@
 RFC_3339_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
 BATCH_SIZE = 100
 CONNECTION_TIMEOUT = 100000
+PROGRESS_FLUSH_INTERVAL = 60
+METRICS_EXPORT_INTERVAL = 15
+BUDGET_POLL_INTERVAL = 0.05
+WORKER_POLL_INTERVAL = 1
+# Larger plain text files are sent to Tika instead of being decoded in process
+PLAIN_TEXT_SIZE_LIMIT = 10 * 1024 * 1024
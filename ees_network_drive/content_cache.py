@@ -0,0 +1,115 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""This module caches the text extracted from the files, keyed by a hash of their contents.
+
+    The same file is often copied in many folders of a Network Drive. The contents of each file
+    are hashed while they are downloaded, and the text extracted from identical contents is taken
+    from the cache instead of being extracted again. The cache holds the most recently used texts
+    up to a number of bytes, and can be saved to a file to be reused by the next syncs.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from .utils import atomic_write
+
+
+class HashingWriter:
+    """This class wraps the file object the contents of a file are downloaded to, and hashes the
+    contents as they are written"""
+
+    def __init__(self, file_obj):
+        self.file_obj = file_obj
+        self.hash = hashlib.sha256()
+
+    def write(self, data):
+        """Hashes and writes a chunk of the contents"""
+        self.hash.update(data)
+        return self.file_obj.write(data)
+
+    def hexdigest(self):
+        """Returns the hash of the contents written so far"""
+        return self.hash.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self.file_obj, name)
+
+
+class ContentCache:
+    """This class holds the texts extracted from the files, evicting the least recently used texts
+    once the texts exceed the size limit. It is shared by the fetching threads of a process."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.texts = OrderedDict()
+        self.size = 0
+
+    @staticmethod
+    def key(extractor, digest):
+        """Returns the key of the text of a file. The name of the extractor is part of the key, as the same
+        contents may be extracted differently by another extractor, while the copies of a file with other
+        names or extensions share their text when they are sent to the same extractor
+        :param extractor: name of the extractor of the file, see extractors.select_extractor
+        :param digest: hash of the contents of the file
+        """
+        return f"{extractor}:{digest}"
+
+    def get(self, key):
+        """Returns the cached text, None if it is not cached"""
+        with self.lock:
+            text = self.texts.get(key)
+            if text is not None:
+                self.texts.move_to_end(key)
+            return text
+
+    def put(self, key, text):
+        """Caches the text, evicting the least recently used texts if the cache is full. A text larger
+        than the cache is not cached"""
+        if text is None or len(text) > self.limit:
+            return
+        with self.lock:
+            previous = self.texts.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self.texts[key] = text
+            self.size += len(text)
+            while self.size > self.limit:
+                _, evicted = self.texts.popitem(last=False)
+                self.size -= len(evicted)
+
+    def load(self, cache_path, logger):
+        """Loads the texts saved by a previous sync, if any
+        :param cache_path: path of the cache file
+        :param logger: logger object
+        """
+        if not os.path.exists(cache_path):
+            return
+        try:
+            with open(cache_path, encoding="utf-8") as cache_file:
+                for line in cache_file:
+                    if line.strip():
+                        key, text = json.loads(line)
+                        self.put(key, text)
+        except (OSError, ValueError) as exception:
+            logger.warning(f"Error while loading the content cache from path: {cache_path}. Error: {exception}")
+
+    def save(self, cache_path, logger):
+        """Saves the texts, from the least to the most recently used, so that loading them keeps the order
+        :param cache_path: path of the cache file
+        :param logger: logger object
+        """
+        with self.lock:
+            items = list(self.texts.items())
+        try:
+            with atomic_write(cache_path) as cache_file:
+                for item in items:
+                    cache_file.write(json.dumps(item))
+                    cache_file.write("\n")
+        except OSError as exception:
+            logger.error(f"Error while saving the content cache to path: {cache_path}. Error: {exception}")
@@ -0,0 +1,98 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""This module keeps statistics about the folders crawled by the previous syncs.
+
+    For each folder the connector records the number of files, their total size, the time
+    taken to list the folder and the time taken to fetch and extract its files. The next sync
+    uses these statistics to start with the slowest folders and to size its thread pool.
+
+    Only the full syncs record the statistics: an incremental sync only fetches the files that
+    changed, so its timings would make the folders look faster than they are and shrink the thread
+    pool of the next full sync.
+"""
+import json
+import math
+import os
+import threading
+
+from .utils import get_current_time, write_json_atomically
+
+STATS_PATH = os.path.join(os.path.dirname(__file__), 'crawl_stats.json')
+
+
+class CrawlStatistics:
+    """This class records the statistics of the crawled folders and stores them in a json file"""
+
+    def __init__(self, logger, stats_path=STATS_PATH, read_only=False):
+        """
+        :param logger: logger object
+        :param stats_path: path of the json file of the statistics
+        :param read_only: True if the statistics of the crawled folders are neither recorded nor saved
+        """
+        self.logger = logger
+        self.stats_path = stats_path
+        self.read_only = read_only
+        self.lock = threading.Lock()
+        self.folders = {}
+
+    def load(self):
+        """Loads the statistics stored by the previous syncs
+        Returns:
+            folders: dictionary of folder paths and their statistics
+        """
+        try:
+            with open(self.stats_path, encoding='utf-8') as stats_file:
+                self.folders = json.load(stats_file).get("folders", {})
+        except FileNotFoundError:
+            self.logger.debug(f"Crawl statistics were not found at {self.stats_path}")
+        except ValueError as exception:
+            self.logger.exception(
+                f"Error while parsing the crawl statistics from path: {self.stats_path}. Error: {exception}"
+            )
+        return self.folders
+
+    def record(self, folder_path, statistics):
+        """Records the statistics of a folder crawled by the current sync
+        :param folder_path: path of the folder in the Network Drive
+        :param statistics: dictionary containing file_count, total_bytes, listing_seconds and extraction_seconds
+        """
+        if self.read_only:
+            return
+        with self.lock:
+            self.folders[folder_path] = dict(statistics, updated_at=get_current_time())
+
+    def save(self):
+        """Stores the statistics of all the folders in the json file. The file is replaced atomically, so an
+        interrupted sync keeps the statistics of the previous sync"""
+        if self.read_only:
+            return
+        with self.lock:
+            folders = dict(self.folders)
+        try:
+            write_json_atomically(self.stats_path, {"folders": folders})
+        except ValueError as exception:
+            self.logger.exception(
+                f"Error while updating the crawl statistics. The previous statistics are kept. Error: {exception}"
+            )
+
+    def weight(self, folder_path):
+        """Returns the time in seconds taken to sync the folder in the previous sync, 0 if it is unknown
+        :param folder_path: path of the folder in the Network Drive
+        """
+        statistics = self.folders.get(folder_path) or {}
+        return statistics.get("listing_seconds", 0) + statistics.get("extraction_seconds", 0)
+
+    def suggest_thread_count(self, folders, max_thread_count):
+        """Returns the number of threads needed to sync the folders. A sync cannot finish before its slowest
+        folder, so there is no benefit in running more threads than the total sync time divided by the time
+        taken by the slowest folder.
+        :param folders: list of folder paths to be synced
+        :param max_thread_count: number of threads configured for the sync
+        """
+        weights = [self.weight(folder) for folder in folders]
+        if not weights or not max(weights) or not all(weights):
+            return max_thread_count
+        return max(1, min(max_thread_count, math.ceil(sum(weights) / max(weights))))
@@ -13,6 +13,7 @@ import os
 from . import constant
 from .base_command import BaseCommand
 from .files import Files
+from .local_storage import FILE_STATES, IDS_PATH, FileLock, LocalStorage
 from .utils import (group_files_by_folder_path,
                     split_documents_into_equal_chunks)
 
@@ -28,10 +29,11 @@ class DeletionSyncCommand(BaseCommand):
         self.logger.debug("Initializing the deletion sync class")
         self.server_name = self.config.get_value("network_drive.server_name")
 
-    def get_deleted_files(self, drive_name, ids):
+    def get_deleted_files(self, drive_name, ids, source=None):
         """Fetches the ids of deleted files from the Network Drives
         :param drive_name: service name of the Network Drives
         :param ids: structure containing id's of all files
+        :param source: Source object of the drive, the drive configured with the network_drive.* settings by default
         Returns:
             ids_list: list of file ids that got deleted from Network Drives
         """
@@ -45,11 +47,12 @@ class DeletionSyncCommand(BaseCommand):
         deleted_folders = []
         visited_folders = []
 
-        smb_connection = self.network_drive_client.connect()
+        network_drive_client = source.network_drive_client if source else self.network_drive_client
+        smb_connection = network_drive_client.connect()
         if not smb_connection:
             raise ConnectionError("Unknown error while connecting to network drives")
 
-        files = Files(self.logger, self.config, self.network_drive_client)
+        files = Files(self.logger, source.config if source else self.config, network_drive_client)
         for file_id, file_path in file_details.items():
             folder_path, file_name = os.path.split(file_path)
             if folder_path in deleted_folders:
@@ -83,22 +86,38 @@ class DeletionSyncCommand(BaseCommand):
             for chunk in split_documents_into_equal_chunks(ids_list, constant.BATCH_SIZE):
                 self.workplace_search_custom_client.delete_documents(chunk)
             for id in ids_list:
-                ids["global_keys"]["files"].pop(id)
+                ids["global_keys"]["files"].pop(id, None)
         return ids
 
     def execute(self):
-        """Runs the deletion sync logic"""
+        """Runs the deletion sync logic for each drive"""
+        with FileLock():
+            self.logger.info("Starting the deletion sync..")
+            for source in self.sources:
+                self.sync_drive(source)
 
-        self.logger.info("Starting the deletion sync..")
-
-        ids = self.local_storage.load_storage()
-        self.logger.info(f"Starting the deletion sync for drive: {self.server_name}")
-        if ids["delete_keys"].get("files"):
-            deleted_ids = self.get_deleted_files(self.server_name, ids)
-            ids = self.sync_deleted_files(deleted_ids, ids)
+    def sync_drive(self, source):
+        """Removes the files deleted from a drive
+        :param source: Source object of the drive
+        """
+        local_storage = LocalStorage(self.logger, source.file_path(IDS_PATH))
+        # Only the IDs to be checked are loaded in memory, the IDs of the indexed files are streamed
+        # from the local storage when it is updated
+        delete_keys = {
+            document_id: file_path
+            for _, document_id, file_path in local_storage.iter_storage("delete_keys")
+        }
+        deleted_ids = set()
+        self.logger.info(f"Starting the deletion sync for drive: {source.checkpoint_key}")
+        if delete_keys:
+            ids = {"global_keys": {"files": {}}, "delete_keys": {"files": delete_keys}}
+            deleted_ids.update(self.get_deleted_files(source.server_name, ids, source))
+            self.sync_deleted_files(list(deleted_ids), ids)
             self.logger.info("Completed the syncing of deleted files")
         else:
-            self.logger.debug(f"No objects present to be deleted for the drive: {self.server_name}")
-        ids["delete_keys"] = {}
+            self.logger.debug(f"No objects present to be deleted for the drive: {source.checkpoint_key}")
         self.logger.info("Updating the local storage")
-        self.local_storage.update_storage(ids)
+        local_storage.write_storage(
+            record for record in local_storage.iter_storage()
+            if record[0] in ["global_keys", FILE_STATES] and record[1] not in deleted_ids
+        )
@@ -0,0 +1,158 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""This module contains the compact record of a document fetched from the Network Drives.
+
+    The documents fetched by a sync can be buffered by the million in the queue, so each of them
+    is held by a slotted object instead of a dictionary. The fields derived from the path of the
+    file, such as its title, type and url, are not stored but computed when the document is
+    converted to the json document of Enterprise Search, right before it is indexed.
+"""
+import os
+
+from . import adapter
+
+# Fields of the json document read directly from the attributes of the record
+ATTRIBUTES = {
+    "id": "id",
+    "path": "path",
+    "size": "size",
+    "body": "body",
+    "_allow_permissions": "allow_permissions",
+    "_deny_permissions": "deny_permissions",
+}
+PERMISSION_FIELDS = ["_allow_permissions", "_deny_permissions"]
+
+
+class Document:
+    """This class holds a document fetched from the Network Drives until it is indexed. Its fields can be
+    read like the fields of the json document, e.g. document["id"]"""
+
+    __slots__ = (
+        "id", "path", "url_prefix", "size", "created_at", "last_updated", "body", "allow_permissions",
+        "deny_permissions", "permission_hash", "last_write_time", "permissions_only",
+    )
+
+    def __init__(self, document_id, path, url_prefix, size, created_at, last_updated, body=None):
+        """
+        :param document_id: id of the document
+        :param path: path of the file in the Network Drives
+        :param url_prefix: url of the drive, shared by the documents of the drive
+        :param size: size of the file in bytes
+        :param created_at: creation time of the file in the RFC 3339 format
+        :param last_updated: last update time of the file in the RFC 3339 format
+        :param body: text extracted from the file
+        """
+        self.id = document_id
+        self.path = path
+        self.url_prefix = url_prefix
+        self.size = size
+        self.created_at = created_at
+        self.last_updated = last_updated
+        self.body = body
+        self.allow_permissions = None
+        self.deny_permissions = None
+        self.permission_hash = None
+        self.last_write_time = None
+        # Set when only the permissions of the indexed document are updated, the content of the file being unchanged
+        self.permissions_only = False
+
+    @classmethod
+    def from_file_details(cls, file_id, file_details, url_prefix):
+        """Returns the document of a file listed by Files.extract_files
+        :param file_id: id of the file
+        :param file_details: dictionary containing file details
+        :param url_prefix: url of the drive, the url of the file is the prefix followed by its path
+        """
+        document = cls(
+            str(file_id),
+            file_details.get('file_path'),
+            url_prefix,
+            file_details.get('file_size'),
+            file_details.get('created_at'),
+            file_details.get('updated_at'),
+        )
+        document.last_write_time = file_details.get('last_write_time')
+        return document
+
+    def set_permissions(self, permissions, permission_hash):
+        """Sets the allow and deny permissions of the document
+        :param permissions: dictionary of allow and deny permissions lists
+        :param permission_hash: hash of the permissions
+        """
+        self.allow_permissions = permissions['allow']
+        self.deny_permissions = permissions['deny']
+        self.permission_hash = permission_hash
+
+    def file_details(self):
+        """Returns the details of the file the document was fetched from, keyed like in Files.extract_files"""
+        file_name = os.path.basename(self.path) if self.path else None
+        return {
+            'file_path': self.path,
+            'web_path': f"{self.url_prefix}{self.path}",
+            'file_name': file_name,
+            'file_type': os.path.splitext(file_name)[1] if file_name else None,
+            'file_size': self.size,
+            'created_at': self.created_at,
+            'updated_at': self.last_updated,
+        }
+
+    def to_dict(self):
+        """Returns the json document indexed to Enterprise Search"""
+        file_details = self.file_details()
+        document = {field: file_details.get(file_field) for field, file_field in adapter.FILES.items()}
+        document.update({'body': self.body, 'id': self.id})
+        if self.permission_hash is not None:
+            document['_allow_permissions'] = self.allow_permissions
+            document['_deny_permissions'] = self.deny_permissions
+        return document
+
+    def to_permission_update(self):
+        """Returns the partial json document updating the permissions of the indexed document"""
+        return {
+            'id': self.id,
+            '_allow_permissions': self.allow_permissions,
+            '_deny_permissions': self.deny_permissions,
+        }
+
+    def state(self):
+        """Returns the state of the file recorded in the local storage, from which the next incremental sync finds
+        out whether the content or the permissions of the file changed"""
+        return [self.size, self.last_write_time, self.permission_hash]
+
+    def __getitem__(self, field):
+        attribute = ATTRIBUTES.get(field)
+        if attribute:
+            if field in PERMISSION_FIELDS and self.permission_hash is None:
+                raise KeyError(field)
+            return getattr(self, attribute)
+        return self.to_dict()[field]
+
+    def get(self, field, default=None):
+        """Returns the value of a field of the json document, default if the document has no such field"""
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+    def __getstate__(self):
+        # The documents returned by the worker processes are pickled as the tuples of their attributes, without the
+        # names of the attributes
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return f"Document(id={self.id!r}, path={self.path!r})"
+
+
+def to_json(document):
+    """Returns the json document of Enterprise Search for a document record, or for a document that is already
+    a dictionary
+    :param document: Document object or dictionary
+    """
+    return document.to_dict() if isinstance(document, Document) else document
@@ -5,10 +5,13 @@
 #
 """This module perform operations related to Enterprise Search based on the Enterprise Search version
 """
+from concurrent.futures import ThreadPoolExecutor
+
 from elastic_enterprise_search import WorkplaceSearch, __version__
 from packaging import version
 
 ENTERPRISE_V8 = version.parse("8.0")
+PERMISSIONS_PAGE_SIZE = 100
 
 
 class EnterpriseSearchWrapper:
@@ -20,6 +23,7 @@ class EnterpriseSearchWrapper:
         self.host = config.get_value("enterprise_search.host_url")
         self.api_key = config.get_value("enterprise_search.api_key")
         self.ws_source = config.get_value("enterprise_search.source_id")
+        self.permissions_page_size = config.get_value("permissions_page_size") or PERMISSIONS_PAGE_SIZE
         if self.version >= ENTERPRISE_V8:
             if hasattr(args, "user") and args.user:
                 self.workplace_search_client = WorkplaceSearch(
@@ -87,26 +91,88 @@ class EnterpriseSearchWrapper:
                 f"Error while indexing the permissions for user: {user_name} to the workplace. Error: {exception}"
             )
 
-    def list_permissions(self):
-        """List permissions for one or all users"""
-        user_permission = []
+    def list_permissions_page(self, current_page):
+        """Returns one page of the permissions of the users
+        :param current_page: number of the page, starting from 1
+        """
+        if self.version >= ENTERPRISE_V8:
+            return self.workplace_search_client.list_external_identities(
+                content_source_id=self.ws_source, current_page=current_page, page_size=self.permissions_page_size
+            )
+        return self.workplace_search_client.list_permissions(
+            content_source_id=self.ws_source, current_page=current_page, page_size=self.permissions_page_size
+        )
+
+    def iter_permissions(self):
+        """Yields the permission objects of all the users, going through all the pages of results. The next
+        page is requested in the background while the current page is processed
+        """
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            current_page = 1
+            next_page = executor.submit(self.list_permissions_page, current_page)
+            while next_page:
+                response = next_page.result()
+                results = response.get("results") or []
+                total_pages = ((response.get("meta") or {}).get("page") or {}).get("total_pages") or 1
+                next_page = None
+                if results and current_page < total_pages:
+                    current_page += 1
+                    next_page = executor.submit(self.list_permissions_page, current_page)
+                yield from results
+
+    def list_all_permissions(self):
+        """Lists the permissions of all the users
+        Returns:
+            permissions: dictionary of user names and their permission objects, None if the permissions
+                could not be retrieved
+        """
+        try:
+            return {self.permission_user(permission): permission for permission in self.iter_permissions()}
+        except Exception as exception:
+            self.logger.exception(
+                f"Error while retrieving the permissions from the workplace. Error: {exception}"
+            )
+            return None
+
+    def permission_user(self, permission):
+        """Returns the name of the user of a permission object returned by the list of permissions
+        :param permission: dictionary containing permission of perticular user
+        """
+        if self.version >= ENTERPRISE_V8:
+            return permission["external_user_properties"][0]["attribute_value"]
+        return permission["user"]
+
+    def put_permissions(self, user_name, permission_list):
+        """Replaces the permissions of an existing user
+        :param user_name: user to assign permissions
+        :param permission_list: list of permissions
+        """
         try:
             if self.version >= ENTERPRISE_V8:
-                user_permission = self.workplace_search_client.list_external_identities(
-                    content_source_id=self.ws_source
+                self.workplace_search_client.put_external_identity(
+                    content_source_id=self.ws_source,
+                    external_user_id=user_name,
+                    external_user_properties=[
+                        {
+                            "attribute_name": "_elasticsearch_username",
+                            "attribute_value": user_name,
+                        }
+                    ],
+                    permissions=permission_list,
                 )
             else:
-                user_permission = self.workplace_search_client.list_permissions(
+                self.workplace_search_client.put_user_permissions(
                     content_source_id=self.ws_source,
+                    user=user_name,
+                    body={"permissions": permission_list},
                 )
             self.logger.info(
-                "Successfully retrieves all permissions from the workplace"
+                f"Successfully updated the permissions for user {user_name} in the workplace"
             )
         except Exception as exception:
             self.logger.exception(
-                f"Error while retrieving the permissions from the workplace. Error: {exception}"
+                f"Error while updating the permissions for user: {user_name} in the workplace. Error: {exception}"
             )
-        return user_permission
 
     def remove_permissions(self, permission):
         """Removes one or more permissions from an existing set of permissions
@@ -192,3 +258,25 @@ class EnterpriseSearchWrapper:
             self.logger.exception(f"Error while indexing the documents. Error: {exception}")
             raise exception
         return responses
+
+    def update_document_permissions(self, documents, timeout):
+        """Updates the permissions of one or more existing documents of a custom content source, leaving their other
+        fields unchanged. The Enterprise Search client has no method for the partial updates of the documents, so
+        the request is sent directly
+        :param documents: list of partial documents holding the id and the permissions of each document
+        :param timeout: Timeout in seconds
+        """
+        path = f"/api/ws/v1/sources/{self.ws_source}/documents/bulk_update"
+        try:
+            if self.version >= ENTERPRISE_V8:
+                responses = self.workplace_search_client.options(request_timeout=timeout).perform_request(
+                    "PATCH", path, body=documents, headers={"content-type": "application/json"}
+                )
+            else:
+                responses = self.workplace_search_client.perform_request(
+                    "PATCH", path, body=documents, request_timeout=timeout
+                )
+        except Exception as exception:
+            self.logger.exception(f"Error while updating the permissions of the documents. Error: {exception}")
+            raise exception
+        return responses
@@ -0,0 +1,99 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""This module selects how the text of a file is extracted.
+
+    Plain text files, such as source code and configuration files, are decoded in process, while
+    the rich formats are sent to the Tika server. The extractor is chosen from the extension of the
+    file, and the contents of a file without extension are sniffed. The time spent by each extractor
+    is recorded as a separate stage of the sync metrics.
+"""
+import codecs
+import os
+
+from .constant import PLAIN_TEXT_SIZE_LIMIT
+from .metrics import EXTRACTION, METRICS
+from .utils import extract
+
+try:
+    from charset_normalizer import from_bytes
+except ImportError:
+    from_bytes = None
+
+PLAIN_TEXT = "plain_text"
+TIKA = "tika"
+SNIFF_SIZE = 8192
+
+PLAIN_TEXT_EXTENSIONS = [
+    ".txt", ".text", ".md", ".rst", ".log", ".csv", ".tsv", ".json", ".yml", ".yaml", ".ini", ".cfg", ".conf",
+    ".toml", ".properties", ".py", ".sh", ".bat", ".ps1", ".sql", ".c", ".h", ".cpp", ".java", ".js", ".ts",
+    ".go", ".rb", ".cs", ".css",
+]
+
+# Extractor name for each file extension, the files with other extensions are sent to Tika
+EXTRACTORS_BY_EXTENSION = {extension: PLAIN_TEXT for extension in PLAIN_TEXT_EXTENSIONS}
+
+
+def decode_plain_text(content):
+    """Decodes the content of a plain text file, detecting its encoding if it is not UTF-8
+    :param content: bytes of the file
+    Returns:
+        text: decoded text, None if the content does not look like text
+    """
+    try:
+        if content.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            return content.decode("utf-16")
+        if b"\x00" in content[:SNIFF_SIZE]:
+            return None
+        return content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        pass
+    if from_bytes:
+        match = from_bytes(content).best()
+        return str(match) if match else None
+    return content.decode("latin-1")
+
+
+def select_extractor(file_name, content):
+    """Returns the name of the extractor of a file
+    :param file_name: name of the file, used to look up its extension
+    :param content: bytes of the file
+    """
+    if len(content) > PLAIN_TEXT_SIZE_LIMIT:
+        return TIKA
+    extension = os.path.splitext(file_name or "")[1].lower()
+    if extension:
+        return EXTRACTORS_BY_EXTENSION.get(extension, TIKA)
+    # Files without extension are decoded in process when their first bytes are UTF-8 text
+    sample = content[:SNIFF_SIZE]
+    if b"\x00" in sample:
+        return TIKA
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as exception:
+        # The sample may end in the middle of a multi-byte character
+        if exception.start < len(sample) - 3:
+            return TIKA
+    return PLAIN_TEXT
+
+
+def extract_content(file_name, content):
+    """Extracts the text of a file with the extractor selected for it. A file that cannot be decoded
+    as plain text is sent to Tika
+    :param file_name: name of the file
+    :param content: bytes of the file
+    Returns:
+        text: extracted text
+    """
+    extractor = select_extractor(file_name, content)
+    if extractor == PLAIN_TEXT:
+        with METRICS.timer(f"{EXTRACTION}_{PLAIN_TEXT}") as timing:
+            timing["size"] = len(content)
+            text = decode_plain_text(content)
+        if text is not None:
+            return text
+    with METRICS.timer(f"{EXTRACTION}_{TIKA}") as timing:
+        timing["size"] = len(content)
+        return extract(content)
@@ -6,6 +6,8 @@
 """Module responsible for fetching the files from the Network Drives and returning a document with
     all file details in json format.
 """
+import hashlib
+import json
 import os
 from pathlib import Path
 
@@ -13,11 +15,16 @@ import errno
 import tempfile
 import time
 
-from dateutil.parser import parse
 from tika.tika import TikaException
 
-from . import adapter, constant
-from .utils import extract, fetch_users_from_csv_file, hash_id
+from . import constant
+from .content_cache import ContentCache, HashingWriter
+from .document import Document
+from .extractors import extract_content, select_extractor
+from .metrics import (BYTES_DOWNLOADED, CONTENT_CACHE_HITS, CONTENT_CACHE_MISSES, DOCUMENTS_PERMISSIONS_UPDATED,
+                      EXTRACTION, FILE_DOWNLOAD, FOLDER_LISTING, METRICS, SECURITY_LOOKUP)
+from .prefetch import Prefetcher
+from .utils import fetch_users_from_csv_file, hash_id
 
 ACCESS_ALLOWED_TYPE = 0
 ACCESS_DENIED_TYPE = 1
@@ -33,13 +40,32 @@ class Files:
     """This class fetches objects from Network Drives
     """
 
-    def __init__(self, logger, config, client):
+    def __init__(self, logger, config, client, content_cache=None):
         self.logger = logger
         self.user_mapping = config.get_value("network_drive_enterprise_search.user_mapping")
         self.drive_path = config.get_value("network_drive.path")
         self.server_ip = config.get_value("network_drive.server_ip")
+        # The IDs of the files of a drive listed in the network_drives setting are prefixed with the name of the
+        # drive, as the file IDs of different drives can collide
+        source_name = config.get_value("network_drive.name")
+        self.id_prefix = f"{source_name}:" if source_name else ""
         self.enable_document_permission = config.get_value("enable_document_permission")
+        self.metadata_only_file_types = {
+            f".{file_type.lower().lstrip('.')}" for file_type in config.get_value("metadata_only_file_types") or []
+        }
         self.network_drives_client = client
+        # Cache of the texts extracted from identical contents, None if the texts are not cached
+        self.content_cache = content_cache
+        self.prefetch_file_count = config.get_value("prefetch_file_count") or 0
+        self.prefetch_max_bytes = config.get_value("prefetch_max_bytes")
+        # Set when the prefetching stopped on an error, so that its connection is not reused
+        self.prefetch_failed = False
+        # Statistics of the folders fetched by this object, recorded by the crawl statistics
+        self.folder_statistics = {}
+        # IDs of all the files listed by this object, whether they are fetched or not, and the folders whose
+        # listing failed. A full sync deletes the stored files that were not listed if no listing failed
+        self.listed_ids = set()
+        self.listing_errors = []
 
     def is_file_present_on_network_drive(self, smb_connection, drive_name, folder_path,
                                          file_structure, ids_list, visited_folders, deleted_folders):
@@ -93,6 +119,7 @@ class Files:
             file_list = smb_connection.listPath(service_name, rf'{path}', search=16)
         except Exception as exception:
             self.logger.exception(f"Unknown error while fetching files {exception}")
+            self.listing_errors.append(path)
             return store
         for file in file_list:
             if file.filename not in ['.', '..']:
@@ -102,45 +129,65 @@ class Files:
         return store
 
     def extract_files(self, smb_connection, service_name, path, time_range, indexing_rules):
-        """
+        """This method filters a complete folder listing in a single pass. The time range is compared
+            against the raw timestamps of the entries, then the indexing rules are applied to the remaining
+            entries and only the files that are kept get their dates formatted.
             :param smb_connection: SMB connection object
             :param service_name: name of the drive
             :param path: Path of the Network Drives
-            :param time_range: Start and End Time
+            :param time_range: Start and End Time in seconds since the epoch
             :param indexing_rules: object of indexing_rules
             :returns: dictionary of ids and file details for the files fetched
         """
         storage = {}
+        started_at = time.perf_counter()
         try:
             file_list = smb_connection.listPath(service_name, rf'{path}')
         except Exception as exception:
             self.logger.exception(f"Unknown error while extracting files from folder {path}.Error {exception}")
+            self.listing_errors.append(path)
             return storage
-        for file in file_list:
-            if not file.isDirectory:
-                file_name = file.filename
-                updated_at = \
-                    time.strftime(constant.RFC_3339_DATETIME_FORMAT, time.gmtime(file.last_attr_change_time))
-                created_at = \
-                    time.strftime(constant.RFC_3339_DATETIME_FORMAT, time.gmtime(file.create_time))
-                file_path = os.path.join(path, file_name)
-                file_details = {
-                    'updated_at': updated_at,
-                    'file_type': os.path.splitext(file_name)[1],
-                    'file_size': file.file_size,
-                    'created_at': created_at,
-                    'file_name': file_name,
-                    'file_path': file_path,
-                    'web_path': f"file://{self.server_ip}/{service_name}/{file_path}"
-                }
-                is_indexable = indexing_rules.should_index(file_details)
-                if is_indexable \
-                    and parse(time_range.get('start_time')) < parse(updated_at) \
-                        and parse(updated_at) <= parse(time_range.get('end_time')):
-                    file_id = file.file_id if file.file_id else hash_id(file_name, path)
-                    storage.update({file_id: file_details})
+        listing_seconds = time.perf_counter() - started_at
+        METRICS.observe(FOLDER_LISTING, listing_seconds)
+        listed_files = [file for file in file_list if not file.isDirectory]
+        self.listed_ids.update(str(self.document_id(file, path)) for file in listed_files)
+        self.folder_statistics[path] = {
+            'file_count': len(listed_files),
+            'total_bytes': sum(file.file_size for file in listed_files),
+            'listing_seconds': listing_seconds,
+            'extraction_seconds': 0,
+        }
+        start_time = time_range.get('start_time')
+        end_time = time_range.get('end_time')
+        candidates = [
+            file for file in listed_files
+            if start_time < int(file.last_attr_change_time) <= end_time
+        ]
+        for file in candidates:
+            file_name = file.filename
+            file_path = os.path.join(path, file_name)
+            file_details = {'file_size': file.file_size, 'file_path': file_path}
+            if not indexing_rules.should_index(file_details):
+                continue
+            file_details.update({
+                'updated_at': time.strftime(constant.RFC_3339_DATETIME_FORMAT, time.gmtime(file.last_attr_change_time)),
+                'file_type': os.path.splitext(file_name)[1],
+                'created_at': time.strftime(constant.RFC_3339_DATETIME_FORMAT, time.gmtime(file.create_time)),
+                'file_name': file_name,
+                'last_write_time': file.last_write_time,
+                'web_path': f"file://{self.server_ip}/{service_name}/{file_path}"
+            })
+            storage.update({self.document_id(file, path): file_details})
         return storage
 
+    def document_id(self, file, path):
+        """Returns the id of the document of a listed file
+            :param file: SharedFile object listed by the SMB connection
+            :param path: path of the folder of the file
+        """
+        file_id = file.file_id if file.file_id else hash_id(file.filename, path)
+        return f"{self.id_prefix}{file_id}" if self.id_prefix else file_id
+
     def retrieve_permission(self, smb_connection, service_name, file_path):
         """This method is used to retrieve permission from Network Drives.
             :param smb_connection: SMB connection object
@@ -149,7 +196,8 @@ class Files:
             :returns: hash of allow and deny permissions lists
         """
         try:
-            security_info = smb_connection.getSecurity(service_name, rf'{file_path}')
+            with METRICS.timer(SECURITY_LOOKUP):
+                security_info = smb_connection.getSecurity(service_name, rf'{file_path}')
         except Exception as exception:
             self.logger.exception(f"Unknown error while fetching permission details for file {file_path}.\
             Error {exception}")
@@ -171,49 +219,196 @@ class Files:
                         permission_sync_command to sync the user mappings.")
         return {'allow': allow_users, 'deny': deny_users}
 
-    def fetch_files(self, service_name, path_list, time_range, indexing_rules):
+    @staticmethod
+    def permission_hash(permissions):
+        """Returns a hash of the allow and deny permissions of a file, which does not depend on the order of the ACEs
+            :param permissions: dictionary of allow and deny permissions lists
+        """
+        permissions = {key: sorted(set(permissions.get(key) or [])) for key in ['allow', 'deny']}
+        return hashlib.sha256(json.dumps(permissions, sort_keys=True).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def is_content_unchanged(file_details, stored_file):
+        """Returns True if the content of a file did not change since it was fetched by a previous sync. A file is
+            listed by an incremental sync when its attributes changed, which includes a change of its permissions,
+            while its size and last write time only change with its content.
+            :param file_details: dictionary containing file details
+            :param stored_file: tuple of the path and the state of the file recorded in the local storage, see
+                Document.state
+        """
+        if not stored_file:
+            return False
+        size, last_write_time, _ = stored_file[1]
+        return size == file_details.get('file_size') and last_write_time == file_details.get('last_write_time')
+
+    def is_metadata_only(self, file_details):
+        """Returns True if the file is indexed with its metadata only, without downloading its content
+            :param file_details: dictionary containing file details
+        """
+        return (file_details.get('file_type') or '').lower() in self.metadata_only_file_types
+
+    def should_prefetch(self, file_id, file_details, stored_files):
+        """Returns True if the content of the file is going to be downloaded, so that it can be downloaded ahead
+            :param file_id: id of the file
+            :param file_details: dictionary containing file details
+            :param stored_files: dictionary of the paths and states of the files recorded in the local storage
+        """
+        if self.is_metadata_only(file_details):
+            return False
+        # The files which were not moved and whose content is unchanged are not downloaded again
+        stored_file = (stored_files or {}).get(str(file_id))
+        return not (self.is_content_unchanged(file_details, stored_file) and
+                    stored_file[0] == file_details.get('file_path'))
+
+    def fetch_files(self, service_name, path_list, time_range, indexing_rules, smb_connection=None, budget=None,
+                    flush=None, stored_files=None, prefetch_connection=None, batch_size=None):
         """This method is used to fetch and index files to Workplace Search
             :param service_name: name of the drive
             :param path_list: list of folder paths inside the network drives
-            :param time_range: Start and End Time
+            :param time_range: Start and End Time in seconds since the epoch
             :param indexing_rules: object of indexing_rules
+            :param smb_connection: SMB connection object to reuse. If not provided, a new connection
+                is opened and closed once the files are fetched
+            :param budget: ByteBudget from which the size of each file is reserved before downloading it
+            :param flush: function called with the documents fetched so far when the budget is exhausted,
+                the returned list only contains the documents fetched afterwards
+            :param stored_files: dictionary of the paths and states of the files recorded in the local storage by
+                the previous syncs, by document id. When provided, the files whose path and content did not change
+                are not downloaded again: only their permissions are updated if they changed, and they are skipped
+                otherwise
+            :param prefetch_connection: SMB connection used to download the next files while the current file is
+                extracted, when the prefetch_file_count setting is provided
+            :param batch_size: number of documents handed to flush at once, the documents are only handed over when
+                the budget is exhausted if not provided
+            :returns: list of the Document objects of the files fetched
         """
-        schema = adapter.FILES
         documents = []
-        smb_connection = self.network_drives_client.connect()
+        # The url of each document is built from the url of the drive when the document is indexed
+        url_prefix = f"file://{self.server_ip}/{service_name}/"
+        owns_connection = smb_connection is None
+        if owns_connection:
+            smb_connection = self.network_drives_client.connect()
+
+        def hand_over_documents():
+            if flush and documents:
+                flush(list(documents))
+                documents.clear()
+
+        def make_room():
+            hand_over_documents()
+            if prefetcher:
+                prefetcher.drop_ready()
+
         if smb_connection:
-            for folder_path in path_list:
-                storage = self.extract_files(smb_connection, service_name, folder_path, time_range, indexing_rules)
-                for file_id, file_details in storage.items():
-                    doc = {}
-                    for field, file_field in schema.items():
-                        doc[field] = file_details.get(file_field)
-                    doc.update({'body': {}, 'id': str(file_id)})
-                    if self.enable_document_permission:
-                        permissions = self.retrieve_permission(
-                            smb_connection, service_name, file_details.get("file_path"))
-                        doc['_allow_permissions'] = permissions['allow']
-                        doc['_deny_permissions'] = permissions['deny']
-                    doc['body'] = self.fetch_file_content(service_name, file_details, smb_connection)
-                    documents.append(doc)
-            smb_connection.close()
+            reserved_id = None
+            prefetcher = None
+            if prefetch_connection and self.prefetch_file_count:
+                prefetcher = Prefetcher(
+                    lambda file_details, connection: self.download_file(service_name, file_details, connection),
+                    prefetch_connection,
+                    self.prefetch_file_count,
+                    self.prefetch_max_bytes,
+                    budget,
+                )
+            try:
+                for folder_path in path_list:
+                    storage = self.extract_files(smb_connection, service_name, folder_path, time_range, indexing_rules)
+                    if prefetcher:
+                        prefetcher.schedule([
+                            (file_id, file_details) for file_id, file_details in storage.items()
+                            if self.should_prefetch(file_id, file_details, stored_files)
+                        ])
+                    started_at = time.perf_counter()
+                    for file_id, file_details in storage.items():
+                        doc = Document.from_file_details(file_id, file_details, url_prefix)
+                        if self.enable_document_permission:
+                            permissions = self.retrieve_permission(
+                                smb_connection, service_name, file_details.get("file_path"))
+                            doc.set_permissions(permissions, self.permission_hash(permissions))
+                        stored_file = (stored_files or {}).get(doc.id)
+                        if self.is_content_unchanged(file_details, stored_file) and stored_file[0] == doc.path:
+                            if stored_file[1][2] == doc.permission_hash:
+                                # Nothing indexed for the file changed, only attributes that are not part of the
+                                # document
+                                continue
+                            if doc.permission_hash is not None:
+                                doc.permissions_only = True
+                                METRICS.increment(DOCUMENTS_PERMISSIONS_UPDATED)
+                        download_content = not (self.is_metadata_only(file_details) or doc.permissions_only)
+                        # The size of a file downloaded ahead is already reserved by the prefetcher
+                        reserved_id = doc.id
+                        downloaded = prefetcher.take(file_id) if prefetcher and download_content else None
+                        if budget and not downloaded:
+                            size = file_details.get('file_size') if download_content else 0
+                            budget.acquire(reserved_id, size, make_room)
+                        if download_content:
+                            doc.body = self.fetch_file_content(service_name, file_details, smb_connection, downloaded)
+                        documents.append(doc)
+                        reserved_id = None
+                        if batch_size and len(documents) >= batch_size:
+                            hand_over_documents()
+                    if folder_path in self.folder_statistics:
+                        self.folder_statistics[folder_path]['extraction_seconds'] = time.perf_counter() - started_at
+            except BaseException:
+                if budget:
+                    budget.release([doc.id for doc in documents] + ([reserved_id] if reserved_id else []))
+                raise
+            finally:
+                if prefetcher:
+                    prefetcher.close()
+                    self.prefetch_failed = prefetcher.failed
+            if owns_connection:
+                smb_connection.close()
         else:
             raise ConnectionError("Unknown error while connecting to network drives")
         return documents
 
-    def fetch_file_content(self, service_name, file_details, smb_connection):
-        """This method is used to fetch content from Network Drives file
+    def download_file(self, service_name, file_details, smb_connection):
+        """This method downloads the content of a Network Drives file to a temporary file. The content is hashed
+        while it is downloaded when the extracted texts are cached
         :param service_name: name of the drive
         :param file_details: dictionary containing file details
         :param smb_connection: connection object
+        :returns: tuple of the temporary file and the hash of the content, None if the texts are not cached
         """
         file_obj = tempfile.NamedTemporaryFile()
         try:
-            smb_connection.retrieveFile(service_name, file_details.get('file_path'), file_obj)
+            writer = HashingWriter(file_obj) if self.content_cache else file_obj
+            with METRICS.timer(FILE_DOWNLOAD) as download:
+                smb_connection.retrieveFile(service_name, file_details.get('file_path'), writer)
+                download["size"] = file_obj.tell()
+        except BaseException:
+            file_obj.close()
+            raise
+        METRICS.increment(BYTES_DOWNLOADED, download["size"])
+        return file_obj, writer.hexdigest() if self.content_cache else None
+
+    def fetch_file_content(self, service_name, file_details, smb_connection, downloaded=None):
+        """This method is used to fetch content from Network Drives file
+        :param service_name: name of the drive
+        :param file_details: dictionary containing file details
+        :param smb_connection: connection object
+        :param downloaded: tuple returned by download_file when the file was already downloaded
+        """
+        file_obj = None
+        try:
+            file_obj, digest = downloaded or self.download_file(service_name, file_details, smb_connection)
             file_obj.seek(0)
+            content = file_obj.read()
+            cache_key = None
+            if digest:
+                cache_key = ContentCache.key(select_extractor(file_details.get('file_name'), content), digest)
+                cached_content = self.content_cache.get(cache_key)
+                if cached_content is not None:
+                    METRICS.increment(CONTENT_CACHE_HITS)
+                    return cached_content
+                METRICS.increment(CONTENT_CACHE_MISSES)
             try:
-                extracted_content = extract(file_obj.read())
-                file_obj.close()
+                with METRICS.timer(EXTRACTION) as extraction:
+                    extraction["size"] = len(content)
+                    extracted_content = extract_content(file_details.get('file_name'), content)
+                if cache_key:
+                    self.content_cache.put(cache_key, extracted_content)
                 return extracted_content
             except TikaException as exception:
                 self.logger.exception(
@@ -228,4 +423,6 @@ class Files:
             else:
                 self.logger.exception(
                     f"Cannot read the contents of the file {file_details.get('file_name')} . Error {exception}")
-        file_obj.close()
+        finally:
+            if file_obj:
+                file_obj.close()
@@ -8,88 +8,234 @@
     It will attempt to sync absolutely all documents that are available in the
     third-party system and ingest them into Enterprise Search instance.
 """
+import os
+
+from . import constant
 from .base_command import BaseCommand
-from .checkpointing import Checkpoint
+from .checkpointing import CHECKPOINT_PATH, PROGRESS_PATH, Checkpoint, SyncProgress, SyncProgressGroup
 from .connector_queue import ConnectorQueue
-from .local_storage import LocalStorage
+from .crawl_statistics import STATS_PATH, CrawlStatistics
+from .local_storage import IDS_PATH, LOCK_PATH, FileLock, LocalStorage
+from .sharding import filter_folders_for_shard, shard_file_path, shard_of
+from .sources import DriveSync, DriveSyncException
 from .sync_enterprise_search import SyncEnterpriseSearch
-from .sync_network_drives import SyncNetworkDrives
-from .utils import get_current_time, split_list_into_buckets
+from .sync_network_drives import SyncNetworkDrives, create_process_pool
+from .utils import get_current_time, split_documents_into_equal_chunks
 
 INDEXING_TYPE = "full"
 
 
 class FullSyncCommand(BaseCommand):
-    """This class start executions of fullsync feature."""
+    """This class start executions of fullsync feature.
 
-    def start_producer(self, queue, time_range):
-        """This method starts async calls for the producer which is responsible
-        for fetching documents from the Network Drive and pushing them in the shared queue
+    When the --shard i/N argument is provided, only the folders belonging to the shard are
+    synced, and the shard uses its own local storage and checkpoint files.
+
+    When the --resume argument is provided, the folders completed by an interrupted full sync
+    are skipped.
+
+    The drives listed in the network_drives setting are synced along with the configured drive,
+    each with its own local storage, progress and checkpoint.
+
+    The files stored by the previous syncs that were not listed by the full sync are deleted from
+    Enterprise Search, unless a folder could not be listed."""
+
+    def __init__(self, args):
+        super().__init__(args)
+        self.shard = getattr(args, "shard", None)
+        self.resume = getattr(args, "resume", False)
+
+    def file_path(self, path, source):
+        """Returns the path of the file used by the drive and the shard instead of the given path
+        :param path: path of the local storage, crawl statistics, progress or content cache file
+        :param source: Source object of the drive
+        """
+        return shard_file_path(source.file_path(path), self.shard)
+
+    def prepare_drive(self, source, queue, time_range, sync_progress, budget=None, content_cache=None,
+                      process_pool=None):
+        """Lists the folders of a drive to be fetched by the full sync
+        :param source: Source object of the drive
         :param queue: Shared queue to store the fetched documents
         :param time_range: Time range dictionary storing start time and end time
+        :param sync_progress: Object tracking the folders of the drive completed by the full sync
+        :param budget: ByteBudget bounding the size of the documents in flight
+        :param content_cache: ContentCache of the texts extracted from the files
+        :param process_pool: pool of worker processes shared by the drives, None if the files are fetched by threads
+        Returns:
+            drive_sync: DriveSync object of the drive, marked as failed if its folders could not be listed
         """
         logger = self.logger
+        crawl_statistics = CrawlStatistics(logger, self.file_path(STATS_PATH, source))
+        crawl_statistics.load()
         sync_network_drives = SyncNetworkDrives(
             logger,
-            self.config,
+            source.config,
             time_range,
-            self.network_drive_client,
+            source.network_drive_client,
             self.indexing_rules,
             queue,
+            crawl_statistics,
+            sync_progress,
+            budget,
+            content_cache=content_cache,
+            process_pool=process_pool,
         )
-
-        thread_count = self.config.get_value("network_drives_sync_thread_count")
-        drive = self.config.get_value("network_drive.server_name")
-
+        local_storage = LocalStorage(logger, self.file_path(IDS_PATH, source))
+        drive_sync = DriveSync(source, sync_network_drives, local_storage, crawl_statistics)
         try:
-            local_storage = LocalStorage(logger)
-            storage_with_collection = sync_network_drives.get_storage_with_collection(local_storage)
+            folder_sizes = sync_network_drives.count_stored_files(local_storage)
             store = sync_network_drives.connect_and_get_all_folders()
-            partition_paths = split_list_into_buckets(store, thread_count)
-
-            global_keys = self.create_jobs(thread_count, sync_network_drives.perform_sync, (drive,), partition_paths)
-
-            try:
-                storage_with_collection["global_keys"]["files"].update(global_keys)
-            except ValueError as value_error:
-                logger.error(f"Exception while updating storage: {value_error}")
-
-            # Send end signals for each live threads to notify them to close watching the queue
-            # for any incoming documents
-            for _ in range(self.config.get_value("enterprise_search_sync_thread_count")):
-                queue.end_signal()
         except Exception as exception:
-            logger.error("Error while Fetching from the Network drive. Checkpoint not saved")
-            raise exception
-
-        local_storage.update_storage(storage_with_collection)
-
-    def start_consumer(self, queue):
+            logger.error(
+                f"Error while Fetching from the Network drive {source.checkpoint_key}. Checkpoint not saved. "
+                f"Error: {exception}"
+            )
+            drive_sync.failed = True
+            return drive_sync
+        if self.shard:
+            store = filter_folders_for_shard(store, self.shard)
+            logger.info(
+                f"Syncing {len(store)} folders of the drive {source.checkpoint_key} for shard "
+                f"{self.shard.index}/{self.shard.count}"
+            )
+        if sync_progress.completed_folders:
+            store = [folder for folder in store if folder not in sync_progress.completed_folders]
+            drive_sync.fetched_files.update(sync_progress.completed_ids())
+        drive_sync.folders = sync_network_drives.prioritize_folders(store, folder_sizes)
+        return drive_sync
+
+    def start_producer(self, queue, time_range, sync_progresses, budget=None, content_cache=None):
+        """This method starts async calls for the producer which is responsible
+        for fetching documents from the Network Drives and pushing them in the shared queue
+        :param queue: Shared queue to store the fetched documents
+        :param time_range: Time range dictionary storing start time and end time
+        :param sync_progresses: dictionary of the objects tracking the folders completed by the full sync, by
+            name of the drive
+        :param budget: ByteBudget bounding the size of the documents in flight
+        :param content_cache: ContentCache of the texts extracted from the files
+        Returns:
+            failed_sources: list of the Source objects of the drives whose folders could not be listed
+        """
+        process_pool = create_process_pool(self.config, self.logger)
+        drive_syncs = []
+        try:
+            for source in self.sources:
+                drive_syncs.append(self.prepare_drive(
+                    source, queue, time_range, sync_progresses[source.name], budget, content_cache, process_pool
+                ))
+            listed_drive_syncs = [drive_sync for drive_sync in drive_syncs if not drive_sync.failed]
+            self.fetch_drives(listed_drive_syncs)
+            if self.config.get_value("full_sync_deletion"):
+                for drive_sync in listed_drive_syncs:
+                    self.sweep_deleted_files(drive_sync, sync_progresses[drive_sync.source.name])
+        finally:
+            for drive_sync in drive_syncs:
+                drive_sync.sync_network_drives.close()
+            if process_pool:
+                process_pool.shutdown()
+
+        for drive_sync in listed_drive_syncs:
+            drive_sync.save()
+        return [drive_sync.source for drive_sync in drive_syncs if drive_sync.failed]
+
+    def sweep_deleted_files(self, drive_sync, sync_progress=None):
+        """Deletes from Enterprise Search the stored files that were not listed by the full sync. The files of the
+        folders completed before the full sync was resumed were listed by the interrupted attempt. Nothing is
+        deleted if a folder could not be listed, as its files would be missing from the listing
+        :param drive_sync: DriveSync object of the drive, whose local storage holds the IDs of the previous syncs
+        :param sync_progress: Object tracking the folders completed by the full sync
+        Returns:
+            deleted_ids: list of the IDs of the deleted files
+        """
+        sync_network_drives = drive_sync.sync_network_drives
+        if sync_network_drives.listing_errors:
+            self.logger.warning(
+                f"{len(sync_network_drives.listing_errors)} folders could not be listed, the deleted files are not "
+                "removed by this full sync. Run a deletion sync to remove them"
+            )
+            return []
+        completed_folders = sync_progress.completed_folders if sync_progress else {}
+        listed_ids = sync_network_drives.listed_ids
+
+        # A sharded full sync only lists the folders of its shard. The stored files of the other folders, such as
+        # the files stored before the drive was resharded, are left to the deletion sync
+        def is_other_shard_folder(folder_path):
+            return bool(self.shard) and shard_of(folder_path, self.shard.count) != self.shard.index
+
+        deleted_ids = []
+        for _, document_id, file_path in drive_sync.local_storage.iter_storage("global_keys"):
+            folder_path = os.path.dirname(file_path)
+            if not (
+                is_other_shard_folder(folder_path) or document_id in listed_ids or folder_path in completed_folders
+            ):
+                deleted_ids.append(document_id)
+        self.logger.info(f"Deleting {len(deleted_ids)} files that are no longer present in the Network Drives")
+        for chunk in split_documents_into_equal_chunks(deleted_ids, constant.BATCH_SIZE):
+            self.workplace_search_custom_client.delete_documents(chunk)
+        drive_sync.deleted_ids.update(deleted_ids)
+        # Every stored file of the shard was either listed or deleted, so the next deletion sync only checks the
+        # files of the other shards
+        drive_sync.is_left_to_deletion_sync = is_other_shard_folder
+        return deleted_ids
+
+    def start_consumer(self, queue, sync_progress=None, budget=None):
         """This method starts async calls for the consumer which is responsible for indexing documents to the Enterprise Search
         :param queue: Shared queue to fetch the stored documents
+        :param sync_progress: Object tracking the folders completed by the full sync
+        :param budget: ByteBudget bounding the size of the documents in flight
         """
         logger = self.logger
         thread_count = self.config.get_value("enterprise_search_sync_thread_count")
-        sync_es = SyncEnterpriseSearch(self.config, logger, self.workplace_search_custom_client, queue)
+        sync_es = SyncEnterpriseSearch(
+            self.config, logger, self.workplace_search_custom_client, queue, sync_progress, budget
+        )
 
         self.create_jobs(thread_count, sync_es.perform_sync, (), None)
 
     def execute(self):
         """This function execute the full sync."""
-        config = self.config
-        logger = self.logger
-        current_time = get_current_time()
-        checkpoint = Checkpoint(config, logger)
-        drive = config.get_value("network_drive.server_name")
-
-        time_range = {
-            "start_time": config.get_value("start_time"),
-            "end_time": current_time,
-        }
-        logger.info(f"Indexing started at: {current_time}")
-
-        queue = ConnectorQueue(logger)
-        self.start_producer(queue, time_range)
-        self.start_consumer(queue)
-        checkpoint.set_checkpoint(current_time, INDEXING_TYPE, drive)
-        logger.info(f"Indexing ended at: {get_current_time()}")
+        with FileLock(shard_file_path(LOCK_PATH, self.shard)):
+            config = self.config
+            logger = self.logger
+            current_time = get_current_time()
+            checkpoint = Checkpoint(config, logger, shard_file_path(CHECKPOINT_PATH, self.shard))
+
+            time_range = {
+                "start_time": config.get_value("start_time"),
+                "end_time": current_time,
+            }
+            logger.info(f"Indexing started at: {current_time}")
+
+            sync_progresses = {}
+            for source in self.sources:
+                sync_progress = SyncProgress(logger, self.file_path(PROGRESS_PATH, source))
+                if not (self.resume and sync_progress.resume()):
+                    sync_progress.start(current_time)
+                sync_progresses[source.name] = sync_progress
+
+            queue = ConnectorQueue(logger)
+            budget = self.create_budget()
+            cache_path = config.get_value("content_cache_path")
+            cache_path = cache_path and shard_file_path(cache_path, self.shard)
+            content_cache = self.create_content_cache(cache_path)
+            failed_sources = []
+            self.run_producer_and_consumer(
+                queue,
+                lambda: failed_sources.extend(
+                    self.start_producer(queue, time_range, sync_progresses, budget, content_cache)
+                ),
+                lambda: self.start_consumer(queue, SyncProgressGroup(list(sync_progresses.values())), budget),
+            )
+            self.save_content_cache(content_cache, cache_path)
+            for source in self.sources:
+                if source in failed_sources:
+                    continue
+                # The checkpoint is set to the time the first attempt of the full sync started, so that the changes
+                # made to the folders completed before an interruption are picked by the next incremental sync
+                sync_progress = sync_progresses[source.name]
+                checkpoint.set_checkpoint(sync_progress.started_at, INDEXING_TYPE, source.checkpoint_key)
+                sync_progress.clear()
+            logger.info(f"Indexing ended at: {get_current_time()}")
+            if failed_sources:
+                raise DriveSyncException([source.checkpoint_key for source in failed_sources])
@@ -14,83 +14,133 @@
 from .base_command import BaseCommand
 from .checkpointing import Checkpoint
 from .connector_queue import ConnectorQueue
-from .local_storage import LocalStorage
+from .crawl_statistics import STATS_PATH, CrawlStatistics
+from .local_storage import IDS_PATH, FileLock, LocalStorage
+from .sources import DriveSync, DriveSyncException
 from .sync_enterprise_search import SyncEnterpriseSearch
-from .sync_network_drives import SyncNetworkDrives
-from .utils import get_current_time, split_list_into_buckets
+from .sync_network_drives import SyncNetworkDrives, create_process_pool
+from .utils import get_current_time
 
 INDEXING_TYPE = "incremental"
 
 
 class IncrementalSyncCommand(BaseCommand):
-    """This class start executions of incrementalsync feature."""
+    """This class start executions of incrementalsync feature.
 
-    def start_producer(self, queue, time_range):
-        """This method starts async calls for the producer which is responsible
-        for fetching documents from the Network Drive and pushing them in the shared queue
+    The drives listed in the network_drives setting are synced along with the configured drive,
+    each from its own checkpoint."""
+
+    def prepare_drive(self, source, queue, time_range, budget=None, content_cache=None, process_pool=None):
+        """Lists the folders of a drive to be fetched by the incremental sync
+        :param source: Source object of the drive
         :param queue: Shared queue to store the fetched documents
-        :param time_range: Time range dictionary storing start time and end time
+        :param time_range: Time range dictionary storing start time and end time of the drive
+        :param budget: ByteBudget bounding the size of the documents in flight
+        :param content_cache: ContentCache of the texts extracted from the files
+        :param process_pool: pool of worker processes shared by the drives, None if the files are fetched by threads
+        Returns:
+            drive_sync: DriveSync object of the drive, marked as failed if its folders could not be listed
         """
         logger = self.logger
+        # The statistics of the full syncs order the folders, the timings of the changed files are not recorded
+        crawl_statistics = CrawlStatistics(logger, source.file_path(STATS_PATH), read_only=True)
+        crawl_statistics.load()
         sync_network_drives = SyncNetworkDrives(
             logger,
-            self.config,
+            source.config,
             time_range,
-            self.network_drive_client,
+            source.network_drive_client,
             self.indexing_rules,
             queue,
+            crawl_statistics,
+            budget=budget,
+            # The files whose content did not change are found from the states recorded in the local storage
+            skip_unchanged_files=True,
+            content_cache=content_cache,
+            process_pool=process_pool,
         )
-
-        thread_count = self.config.get_value("network_drives_sync_thread_count")
-        drive = self.config.get_value("network_drive.server_name")
-
+        local_storage = LocalStorage(logger, source.file_path(IDS_PATH))
+        drive_sync = DriveSync(source, sync_network_drives, local_storage, crawl_statistics)
         try:
-            local_storage = LocalStorage(logger)
-            storage_with_collection = sync_network_drives.get_storage_with_collection(local_storage)
+            folder_sizes = sync_network_drives.count_stored_files(local_storage)
             store = sync_network_drives.connect_and_get_all_folders()
-            partition_paths = split_list_into_buckets(store, thread_count)
-
-            global_keys = self.create_jobs(thread_count, sync_network_drives.perform_sync, (drive,), partition_paths)
-
-            try:
-                storage_with_collection["global_keys"]["files"].update(global_keys)
-            except ValueError as value_error:
-                logger.error(f"Exception while updating storage: {value_error}")
-
-            # Send end signals for each live threads to notify them to close watching the queue
-            # for any incoming documents
-            for _ in range(self.config.get_value("enterprise_search_sync_thread_count")):
-                queue.end_signal()
         except Exception as exception:
-            logger.error("Error while Fetching from the Network drive. Checkpoint not saved")
-            raise exception
-
-        local_storage.update_storage(storage_with_collection)
-
-    def start_consumer(self, queue):
+            logger.error(
+                f"Error while Fetching from the Network drive {source.checkpoint_key}. Checkpoint not saved. "
+                f"Error: {exception}"
+            )
+            drive_sync.failed = True
+            return drive_sync
+        drive_sync.folders = sync_network_drives.prioritize_folders(store, folder_sizes)
+        return drive_sync
+
+    def start_producer(self, queue, time_ranges, budget=None, content_cache=None):
+        """This method starts async calls for the producer which is responsible
+        for fetching documents from the Network Drives and pushing them in the shared queue
+        :param queue: Shared queue to store the fetched documents
+        :param time_ranges: dictionary of the time ranges storing start time and end time, by name of the drive
+        :param budget: ByteBudget bounding the size of the documents in flight
+        :param content_cache: ContentCache of the texts extracted from the files
+        Returns:
+            failed_sources: list of the Source objects of the drives whose folders could not be listed
+        """
+        process_pool = create_process_pool(self.config, self.logger)
+        drive_syncs = []
+        try:
+            for source in self.sources:
+                drive_syncs.append(self.prepare_drive(
+                    source, queue, time_ranges[source.name], budget, content_cache, process_pool
+                ))
+            listed_drive_syncs = [drive_sync for drive_sync in drive_syncs if not drive_sync.failed]
+            self.fetch_drives(listed_drive_syncs)
+        finally:
+            for drive_sync in drive_syncs:
+                drive_sync.sync_network_drives.close()
+            if process_pool:
+                process_pool.shutdown()
+
+        for drive_sync in listed_drive_syncs:
+            drive_sync.save()
+        return [drive_sync.source for drive_sync in drive_syncs if drive_sync.failed]
+
+    def start_consumer(self, queue, budget=None):
         """This method starts async calls for the consumer which is responsible for indexing documents to the Enterprise Search
         :param queue: Shared queue to fetch the stored documents
+        :param budget: ByteBudget bounding the size of the documents in flight
         """
         logger = self.logger
         thread_count = self.config.get_value("enterprise_search_sync_thread_count")
-        sync_es = SyncEnterpriseSearch(self.config, logger, self.workplace_search_custom_client, queue)
+        sync_es = SyncEnterpriseSearch(self.config, logger, self.workplace_search_custom_client, queue, budget=budget)
 
         self.create_jobs(thread_count, sync_es.perform_sync, (), None)
 
     def execute(self):
         """This function execute the incremental sync."""
-        config = self.config
-        logger = self.logger
-        current_time = get_current_time()
-        checkpoint = Checkpoint(config, logger)
-        drive = config.get_value("network_drive.server_name")
-
-        start_time, end_time = checkpoint.get_checkpoint(current_time, drive)
-        time_range = {"start_time": start_time, "end_time": end_time}
-        logger.info(f"Indexing started at: {current_time}")
-
-        queue = ConnectorQueue(logger)
-        self.start_producer(queue, time_range)
-        self.start_consumer(queue)
-        checkpoint.set_checkpoint(current_time, INDEXING_TYPE, drive)
-        logger.info(f"Indexing ended at: {get_current_time()}")
+        with FileLock():
+            config = self.config
+            logger = self.logger
+            current_time = get_current_time()
+            checkpoint = Checkpoint(config, logger)
+
+            time_ranges = {}
+            for source in self.sources:
+                start_time, end_time = checkpoint.get_checkpoint(current_time, source.checkpoint_key)
+                time_ranges[source.name] = {"start_time": start_time, "end_time": end_time}
+            logger.info(f"Indexing started at: {current_time}")
+
+            queue = ConnectorQueue(logger)
+            budget = self.create_budget()
+            content_cache = self.create_content_cache()
+            failed_sources = []
+            self.run_producer_and_consumer(
+                queue,
+                lambda: failed_sources.extend(self.start_producer(queue, time_ranges, budget, content_cache)),
+                lambda: self.start_consumer(queue, budget),
+            )
+            self.save_content_cache(content_cache)
+            for source in self.sources:
+                if source not in failed_sources:
+                    checkpoint.set_checkpoint(current_time, INDEXING_TYPE, source.checkpoint_key)
+            logger.info(f"Indexing ended at: {get_current_time()}")
+            if failed_sources:
+                raise DriveSyncException([source.checkpoint_key for source in failed_sources])
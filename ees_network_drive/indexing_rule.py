@@ -6,18 +6,53 @@
 """The module defines methods used to check the rules to be followed while indexing the objects to
     Enterprise Search.
 """
+import operator
 import re
 
 from wcmatch import glob
 
+SIZE_OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '!': operator.ne,
+    '!=': operator.ne,
+    '=': operator.eq,
+    '==': operator.eq,
+}
+
 
 class IndexingRules:
-    """This class holds methods used to apply indexing filters on the documents to be indexed
+    """This class holds methods used to apply indexing filters on the documents to be indexed.
+
+    The include and exclude patterns are resolved once when the object is created: patterns
+    present in both include and exclude are dropped from exclude, and size patterns are split
+    into their operator and numeric value. The resolved rules are stored as tuples and never
+    modified afterwards, so a single instance can be shared by all the sync threads.
     """
 
     def __init__(self, config):
-        self.include = config.get_value("include")
-        self.exclude = config.get_value("exclude")
+        include = config.get_value("include") or {}
+        exclude = config.get_value("exclude") or {}
+        self.include = self.resolve_rules(include, {})
+        self.exclude = self.resolve_rules(exclude, include)
+
+    @staticmethod
+    def resolve_rules(pattern_dict, conflicting_patterns):
+        """Converts the patterns from the configuration file into an immutable rule set
+            :param pattern_dict: Dictionary containing key value pairs as filter type and list of patterns
+            :param conflicting_patterns: Dictionary of patterns to be dropped from pattern_dict
+            :returns: tuple of (filter type, tuple of patterns) pairs in configuration order
+        """
+        rules = []
+        for filtertype, pattern in pattern_dict.items():
+            conflicts = conflicting_patterns.get(filtertype) or []
+            values = [value for value in (pattern or []) if value not in conflicts]
+            if filtertype == 'size':
+                values = [(re.match('[><=!]=?', value)[0], re.findall("[0-9]+", value)[0]) for value in values]
+            rules.append((filtertype, tuple(values)))
+        return tuple(rules)
 
     def filter_size(self, file_details, symbol, pattern):
         """This method is used to find if the file size is matching with the pattern
@@ -26,46 +61,30 @@ class IndexingRules:
             :param pattern: numeric part of pattern as a string
             :returns: True or False denoting whether the file size is according to the pattern
         """
-        file_size = file_details['file_size']
-        int_value = int(pattern)
-        operation = {
-            '>': file_size > int_value,
-            '>=': file_size >= int_value,
-            '<': file_size < int_value,
-            '<=': file_size <= int_value,
-            '!': file_size != int_value,
-            '!=': file_size != int_value,
-            '=': file_size == int_value,
-            '==': file_size == int_value,
-        }
-        return operation.get(symbol)
+        operation = SIZE_OPERATORS.get(symbol)
+        if operation:
+            return operation(file_details['file_size'], int(pattern))
 
     def should_index(self, file_details):
         """This method is used to check if the current file is following the indexing rule or not
             :param file_details: dictionary containing file properties
-            :param include: include pattern provided for matching
-            :param exclude: exclude pattern for matching
             :returns: True or False denoting if the file is to following the indexing rule or not
         """
         should_include, should_exclude = True, True
         if self.include:
-            should_include = self.should_include_or_exclude(self.include, {}, file_details, 'include')
+            should_include = self.should_include_or_exclude(self.include, file_details, 'include')
         if self.exclude:
-            should_exclude = self.should_include_or_exclude(self.exclude, self.include, file_details, 'exclude')
+            should_exclude = self.should_include_or_exclude(self.exclude, file_details, 'exclude')
         return should_include and should_exclude
 
-    def should_include_or_exclude(self, pattern_dict, is_present_in_include, file_details, pattern_type):
+    def should_include_or_exclude(self, rules, file_details, pattern_type):
         """Function to decide wether to include the file or exclude it based on the indexing rules defined in the configuration
-           :param pattern_dict: Dictionary containing key value pairs as filter type and list of patterns
-           :param is_present_in_include: Used to check if any pattern is already present in include type
+           :param rules: resolved rules as returned by resolve_rules
            :param file_details: dictionary containing file properties
            :param pattern_type: include/exclude
         """
         should_index = True
-        for filtertype, pattern in pattern_dict.items():
-            for value in (pattern or []):
-                if is_present_in_include and (value in (is_present_in_include.get(filtertype) or [])):
-                    pattern.remove(value)
+        for filtertype, pattern in rules:
             result = self.follows_indexing_rule(filtertype, pattern, file_details, pattern_type)
             if result is False:
                 should_index = False
@@ -77,15 +96,14 @@ class IndexingRules:
         """Applies filters on the file and returns True or False based on whether
            it follows the pattern or not
             :filtertype: denotes the type of filter used: size/path_template
-            :param pattern: include/ exclude pattern provided for matching
+            :param pattern: resolved include/ exclude patterns provided for matching
             :param file_details: dictionary containing file properties
             :param pattern_type: include/exclude
         """
         if pattern:
             for value in pattern:
                 if filtertype == 'size':
-                    initial = re.match('[><=!]=?', value)
-                    result = self.filter_size(file_details, initial[0], re.findall("[0-9]+", value)[0])
+                    result = self.filter_size(file_details, *value)
                 else:
                     result = glob.globmatch(file_details['file_path'], value, flags=glob.GLOBSTAR)
                 if (pattern_type == 'include' and result) or (pattern_type == 'exclude' and not(result)):
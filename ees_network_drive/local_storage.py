@@ -1,40 +1,167 @@
 import os
 import json
 
-IDS_PATH = os.path.join(os.path.dirname(__file__), 'doc_id.json')
+from .utils import atomic_write
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+IDS_PATH = os.path.join(os.path.dirname(__file__), 'doc_id.jsonl')
+LOCK_PATH = os.path.join(os.path.dirname(__file__), 'connector.lock')
+# Collection of the [size, last write time, permission hash] states of the fetched files, by document id
+FILE_STATES = "file_states"
+
+
+class ConnectorLockedException(Exception):
+    """Exception raised when another run of the connector holds the lock on the local storage.
+
+    Attributes:
+        lock_path -- path of the lock file
+    """
+
+    def __init__(self, lock_path):
+        super().__init__(f"Another sync is already running and holds the lock {lock_path}. \
+            Wait for it to complete before starting a new sync.")
+        self.lock_path = lock_path
+
+
+class FileLock:
+    """This class prevents overlapping runs of the connector from updating the local storage at the
+    same time. The lock is held by the operating system on an open file, so it is released even if
+    the connector is killed.
+    """
+
+    def __init__(self, lock_path=LOCK_PATH):
+        self.lock_path = lock_path
+        self.lock_file = None
+
+    def __enter__(self):
+        self.lock_file = open(self.lock_path, "a+", encoding='utf-8')
+        try:
+            if fcntl:
+                fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                self.lock_file.seek(0)
+                msvcrt.locking(self.lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            self.lock_file.close()
+            raise ConnectorLockedException(self.lock_path)
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        if fcntl:
+            fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_UN)
+        else:
+            self.lock_file.seek(0)
+            msvcrt.locking(self.lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        self.lock_file.close()
 
 
 class LocalStorage:
-    """This class contains all the methods to do operations on doc_id json file
+    """This class contains all the methods to do operations on the local ids storage.
+
+    The ids are stored in the JSON Lines format, one [collection, id, path] record per line, so that
+    they can be read and written record by record. The records of the file_states collection hold the
+    state of the file instead of its path. A doc_id.json file written by a previous version
+    of the connector is still read, and is replaced by the JSON Lines file on the next update.
     """
 
-    def __init__(self, logger):
+    def __init__(self, logger, ids_path=IDS_PATH):
         self.logger = logger
+        self.ids_path = ids_path
+        self.legacy_ids_path = f"{os.path.splitext(ids_path)[0]}.json"
 
-    def load_storage(self):
-        """This method fetches the contents of doc_id.json(local ids storage)
+    def exists(self):
+        """Returns True if the local ids storage, in either format, is present"""
+        return os.path.exists(self.ids_path) or os.path.exists(self.legacy_ids_path)
+
+    def iter_storage(self, collection=None):
+        """Yields the stored ids one by one without loading the whole storage in memory. A doc_id.json file
+            written by a previous version of the connector is a single JSON document, so it is loaded whole
+            :param collection: name of the collection to read, global_keys, delete_keys or file_states. All
+                the collections are read if not provided
+            Yields:
+                record: tuple of collection name, document id and file path, or file state
         """
-        try:
-            with open(IDS_PATH, encoding='utf-8') as ids_file:
+        for path in [self.ids_path, self.legacy_ids_path]:
+            if os.path.exists(path):
+                break
+        else:
+            self.logger.debug("Local storage for ids was not found.")
+            return
+        with open(path, encoding='utf-8') as ids_file:
+            first_character = ids_file.read(1)
+            ids_file.seek(0)
+            if first_character == "{":
+                yield from self._iter_legacy_storage(ids_file, collection)
+                return
+            for line_number, line in enumerate(ids_file, 1):
+                if not line.strip():
+                    continue
                 try:
-                    return json.load(ids_file)
+                    record_collection, document_id, file_path = json.loads(line)
                 except ValueError as exception:
                     self.logger.exception(
-                        f"Error while parsing the json file of the ids store from path: {IDS_PATH}. Error: {exception}"
+                        f"Error while parsing the line {line_number} of the ids store from path: {path}. "
+                        f"Error: {exception}"
                     )
-                    return {"global_keys": {}}
-        except FileNotFoundError:
-            self.logger.debug("Local storage for ids was not found.")
-            return {"global_keys": {}}
+                    continue
+                if collection is None or record_collection == collection:
+                    yield record_collection, document_id, file_path
+
+    def _iter_legacy_storage(self, ids_file, collection):
+        """Yields the ids stored in a doc_id.json file written by a previous version of the connector"""
+        try:
+            ids = json.load(ids_file)
+        except ValueError as exception:
+            self.logger.exception(
+                f"Error while parsing the json file of the ids store from path: {ids_file.name}. "
+                f"Error: {exception}"
+            )
+            return
+        for record_collection, values in ids.items():
+            if collection is None or record_collection == collection:
+                for document_id, file_path in ((values or {}).get("files") or {}).items():
+                    yield record_collection, document_id, file_path
+
+    def load_storage(self):
+        """This method fetches the contents of the local ids storage
+            Returns:
+                ids: dictionary of collections, each containing a dictionary of file ids and paths
+        """
+        ids = {"global_keys": {}, "delete_keys": {}}
+        for collection, document_id, file_path in self.iter_storage():
+            ids.setdefault(collection, {}).setdefault("files", {})[document_id] = file_path
+        return ids
+
+    def write_storage(self, records):
+        """This method replaces the local ids storage with the given records, writing them one by one.
+            The file is replaced atomically, so a crash while writing keeps the previous ids instead of
+            a truncated file.
+            :param records: iterable of tuples of collection name, document id and file path
+        """
+        try:
+            with atomic_write(self.ids_path) as ids_file:
+                for record in records:
+                    ids_file.write(json.dumps(record, separators=(",", ":")))
+                    ids_file.write("\n")
+        except (ValueError, TypeError) as exception:
+            self.logger.exception(
+                f"Error while updating the ids store at path: {self.ids_path}. Error: {exception}"
+            )
+            return
+        if self.legacy_ids_path != self.ids_path and os.path.exists(self.legacy_ids_path):
+            os.remove(self.legacy_ids_path)
 
     def update_storage(self, ids):
-        """This method is used to update the ids stored in doc_id.json file
-            :param ids: updated ids to be stored in the doc_id.json file
+        """This method is used to update the ids stored in the local ids storage
+            :param ids: dictionary of collections, each containing a dictionary of file ids and paths
         """
-        with open(IDS_PATH, "w", encoding='utf-8') as ids_file:
-            try:
-                json.dump(ids, ids_file, indent=4)
-            except ValueError as exception:
-                self.logger.exception(
-                    f"Error while updating the doc_id json file. Error: {exception}"
-                )
+        self.write_storage(
+            (collection, document_id, file_path)
+            for collection, values in ids.items()
+            for document_id, file_path in ((values or {}).get("files") or {}).items()
+        )
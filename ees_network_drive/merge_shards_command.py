@@ -0,0 +1,116 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""This module allows to combine the results of a sharded full sync.
+
+    Each shard of a full sync stores the IDs of the documents it indexed and its checkpoint in
+    separate files. This command merges the ID registries of all the shards into the local
+    storage used by the deletion sync and the incremental sync, and sets the checkpoint of the
+    drive to the earliest checkpoint of the shards.
+"""
+import json
+import os
+
+from .base_command import BaseCommand
+from .checkpointing import CHECKPOINT_PATH, Checkpoint
+from .local_storage import FILE_STATES, IDS_PATH, LOCK_PATH, FileLock, LocalStorage
+from .sharding import Shard, shard_file_path
+from .utils import get_current_time
+
+INDEXING_TYPE = "full"
+# Collections of the local storage of the shards which are merged
+MERGED_COLLECTIONS = ["global_keys", "delete_keys", FILE_STATES]
+
+
+class MissingShardException(Exception):
+    """Exception raised when the files of one or more shards are not present.
+
+    Attributes:
+        missing_files -- list of the files that were not found
+    """
+
+    def __init__(self, missing_files):
+        super().__init__(f"Could not find the files of all the shards. Missing files: {missing_files}. \
+            Run the full-sync command for each shard before merging them.")
+        self.missing_files = missing_files
+
+
+class MergeShardsCommand(BaseCommand):
+    """This class merges the local storage and checkpoints of the shards of a full sync."""
+
+    def execute(self):
+        """Runs the merge of the shards of each drive"""
+        with FileLock(LOCK_PATH):
+            shards = [Shard(index, self.args.shards) for index in range(self.args.shards)]
+            for source in self.sources:
+                self.merge_drive(source, shards)
+
+    def merge_drive(self, source, shards):
+        """Merges the local storage and checkpoints of the shards of a drive
+        :param source: Source object of the drive
+        :param shards: list of the Shard tuples of the full sync
+        """
+        logger = self.logger
+        ids_path = source.file_path(IDS_PATH)
+
+        missing_files = [
+            shard_file_path(ids_path, shard)
+            for shard in shards
+            if not LocalStorage(logger, shard_file_path(ids_path, shard)).exists()
+        ] + [
+            shard_file_path(CHECKPOINT_PATH, shard)
+            for shard in shards
+            if not os.path.exists(shard_file_path(CHECKPOINT_PATH, shard))
+        ]
+        if missing_files:
+            raise MissingShardException(missing_files)
+
+        # The records of the shards are streamed into the merged storage instead of being loaded in memory. A file
+        # stored by several shards keeps the record of the last shard, as the later records win when it is read
+        shard_storages = [LocalStorage(logger, shard_file_path(ids_path, shard)) for shard in shards]
+        merged_storage = LocalStorage(logger, ids_path)
+        merged_storage.write_storage(
+            record
+            for shard_storage in shard_storages
+            for record in shard_storage.iter_storage()
+            if record[0] in MERGED_COLLECTIONS
+        )
+        logger.info(
+            f"Merged {sum(1 for _ in merged_storage.iter_storage('global_keys'))} document IDs of the drive "
+            f"{source.checkpoint_key} from {len(shards)} shards"
+        )
+
+        checkpoint_times = []
+        current_time = get_current_time()
+        for shard in shards:
+            checkpoint_path = shard_file_path(CHECKPOINT_PATH, shard)
+            # The checkpoint of a drive whose folders could not be listed by the shard is not saved
+            if has_checkpoint(checkpoint_path, source.checkpoint_key):
+                start_time, _ = Checkpoint(self.config, logger, checkpoint_path).get_checkpoint(
+                    current_time, source.checkpoint_key
+                )
+                checkpoint_times.append(start_time)
+        if not checkpoint_times or len(checkpoint_times) < len(shards):
+            logger.warning(
+                f"{len(shards) - len(checkpoint_times)} shards did not save a checkpoint for the drive "
+                f"{source.checkpoint_key}, its checkpoint is not updated. Run the full-sync command again for these "
+                "shards before merging them"
+            )
+            return
+        Checkpoint(self.config, logger, CHECKPOINT_PATH).set_checkpoint(
+            min(checkpoint_times), INDEXING_TYPE, source.checkpoint_key
+        )
+
+
+def has_checkpoint(checkpoint_path, checkpoint_key):
+    """Returns True if the checkpoint file holds a checkpoint for the drive
+    :param checkpoint_path: path of the checkpoint file of a shard
+    :param checkpoint_key: key of the checkpoint of the drive
+    """
+    try:
+        with open(checkpoint_path, encoding="UTF-8") as checkpoint_store:
+            return bool(json.load(checkpoint_store).get(checkpoint_key))
+    except (OSError, ValueError, AttributeError):
+        return False
@@ -0,0 +1,247 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""This module collects timing statistics for the stages of the sync pipeline.
+
+    Each stage, for example the listing of a folder or the indexing request sent to Enterprise
+    Search, records its durations in a histogram with a fixed number of logarithmic buckets, so
+    the memory used does not grow with the number of documents synced. The statistics of all the
+    stages are logged as a JSON summary at the end of each command.
+
+    Counters, for example the number of documents indexed, and gauges, for example the depth of
+    the queue, are kept in the same registry so that they can be exported while a sync is running.
+"""
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# The upper bound of the bucket i is SMALLEST_BUCKET * 2 ** i seconds. With 36 buckets the largest
+# bound is about 9.5 hours, slower observations are counted in the last bucket
+SMALLEST_BUCKET = 0.000001
+BUCKET_COUNT = 36
+BUCKET_BOUNDS = tuple(SMALLEST_BUCKET * 2 ** index for index in range(BUCKET_COUNT))
+
+FOLDER_LISTING = "folder_listing"
+SECURITY_LOOKUP = "security_lookup"
+FILE_DOWNLOAD = "file_download"
+EXTRACTION = "extraction"
+QUEUE_WAIT = "queue_wait"
+INDEX_REQUEST = "index_request"
+
+DOCUMENTS_FETCHED = "documents_fetched"
+DOCUMENTS_INDEXED = "documents_indexed"
+DOCUMENTS_FAILED = "documents_failed"
+BYTES_DOWNLOADED = "bytes_downloaded"
+DOCUMENTS_PERMISSIONS_UPDATED = "documents_permissions_updated"
+CONTENT_CACHE_HITS = "content_cache_hits"
+CONTENT_CACHE_MISSES = "content_cache_misses"
+
+QUEUE_DEPTH = "queue_depth"
+ACTIVE_SMB_CONNECTIONS = "active_smb_connections"
+
+
+class Histogram:
+    """This class counts the observations of a stage in logarithmic buckets"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.total_bytes = 0
+        self.buckets = [0] * BUCKET_COUNT
+
+    def observe(self, seconds, size=0):
+        """Records an observation
+        :param seconds: duration of the observation
+        :param size: number of bytes processed by the observation
+        """
+        index = 0
+        if seconds > SMALLEST_BUCKET:
+            index = min(BUCKET_COUNT - 1, (math.ceil(seconds / SMALLEST_BUCKET) - 1).bit_length())
+        self.buckets[index] += 1
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.total_bytes += size or 0
+
+    def percentile(self, fraction):
+        """Returns an estimate of the duration below which the given fraction of the observations fall. The
+        observations of the bucket containing the fraction are assumed to be spread evenly between its bounds
+        :param fraction: fraction of the observations between 0 and 1, for example 0.95
+        """
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            if bucket_count and seen + bucket_count >= rank:
+                lower_bound = BUCKET_BOUNDS[index - 1] if index else 0.0
+                estimate = lower_bound + (BUCKET_BOUNDS[index] - lower_bound) * (rank - seen) / bucket_count
+                return min(estimate, self.max_seconds)
+            seen += bucket_count
+        return self.max_seconds
+
+    def merge(self, snapshot):
+        """Adds the observations of a snapshot taken from another histogram
+        :param snapshot: dictionary returned by the snapshot method
+        """
+        self.count += snapshot["count"]
+        self.total_seconds += snapshot["total_seconds"]
+        self.max_seconds = max(self.max_seconds, snapshot["max_seconds"])
+        self.total_bytes += snapshot["total_bytes"]
+        for index, bucket_count in enumerate(snapshot["buckets"]):
+            self.buckets[index] += bucket_count
+
+    def snapshot(self):
+        """Returns the raw state of the histogram, to be merged in another process"""
+        return {
+            "count": self.count,
+            "total_seconds": self.total_seconds,
+            "max_seconds": self.max_seconds,
+            "total_bytes": self.total_bytes,
+            "buckets": list(self.buckets),
+        }
+
+    def summary(self):
+        """Returns the statistics of the histogram"""
+        return {
+            "count": self.count,
+            "total_seconds": round(self.total_seconds, 6),
+            "p50_seconds": round(self.percentile(0.50), 6),
+            "p95_seconds": round(self.percentile(0.95), 6),
+            "p99_seconds": round(self.percentile(0.99), 6),
+            "max_seconds": round(self.max_seconds, 6),
+            "total_bytes": self.total_bytes,
+        }
+
+
+class Metrics:
+    """This class holds the histograms of the stages of the sync, along with the counters and gauges
+    of the sync, shared by all the threads of a process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+
+    def increment(self, counter, value=1):
+        """Adds the value to the counter
+        :param counter: name of the counter
+        :param value: value to be added
+        """
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def register_gauge(self, gauge, function):
+        """Registers the function returning the current value of a gauge. The function is called
+        each time the metrics are exported
+        :param gauge: name of the gauge
+        :param function: function without arguments returning a number
+        """
+        with self.lock:
+            self.gauges[gauge] = function
+
+    def unregister_gauge(self, gauge):
+        """Removes a gauge registered with register_gauge
+        :param gauge: name of the gauge
+        """
+        with self.lock:
+            self.gauges.pop(gauge, None)
+
+    def read_gauges(self):
+        """Returns the current values of the gauges. Gauges that cannot be read, for example the size
+        of a queue on platforms that do not support it, are left out
+        """
+        with self.lock:
+            gauges = dict(self.gauges)
+        values = {}
+        for gauge, function in gauges.items():
+            try:
+                values[gauge] = function()
+            except Exception:
+                continue
+        return values
+
+    def observe(self, stage, seconds, size=0):
+        """Records the duration of a stage
+        :param stage: name of the stage
+        :param seconds: duration of the stage
+        :param size: number of bytes processed by the stage
+        """
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds, size)
+
+    @contextmanager
+    def timer(self, stage):
+        """Records the time spent in the block as an observation of the stage. The number of bytes
+        processed can be set on the yielded dictionary under the size key
+        :param stage: name of the stage
+        """
+        observation = {"size": 0}
+        started_at = time.perf_counter()
+        try:
+            yield observation
+        finally:
+            self.observe(stage, time.perf_counter() - started_at, observation["size"])
+
+    def drain(self):
+        """Returns the snapshots of all the histograms and the counters, and resets them. Worker processes
+        send their snapshots to the parent process along with the fetched documents
+        """
+        with self.lock:
+            histograms, self.histograms = self.histograms, {}
+            counters, self.counters = self.counters, {}
+        return {
+            "histograms": {stage: histogram.snapshot() for stage, histogram in histograms.items()},
+            "counters": counters,
+        }
+
+    def merge(self, snapshots):
+        """Adds the observations drained from another process
+        :param snapshots: dictionary returned by the drain method
+        """
+        snapshots = snapshots or {}
+        with self.lock:
+            for stage, snapshot in snapshots.get("histograms", {}).items():
+                self.histograms.setdefault(stage, Histogram()).merge(snapshot)
+            for counter, value in snapshots.get("counters", {}).items():
+                self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def collect(self):
+        """Returns the snapshots of the histograms, the counters and the gauges, to be exported"""
+        with self.lock:
+            histograms = {stage: histogram.snapshot() for stage, histogram in self.histograms.items()}
+            counters = dict(self.counters)
+        return histograms, counters, self.read_gauges()
+
+    def summary(self):
+        """Returns the statistics of all the stages"""
+        with self.lock:
+            return {stage: histogram.summary() for stage, histogram in sorted(self.histograms.items())}
+
+    def log_summary(self, logger):
+        """Logs the statistics of all the stages and the counters as a JSON document, if anything was
+        observed
+        :param logger: logger object
+        """
+        summary = self.summary()
+        with self.lock:
+            counters = dict(sorted(self.counters.items()))
+        if summary or counters:
+            report = {'stages': summary, 'counters': counters}
+            lookups = counters.get(CONTENT_CACHE_HITS, 0) + counters.get(CONTENT_CACHE_MISSES, 0)
+            if lookups:
+                report['content_cache_hit_rate'] = round(counters.get(CONTENT_CACHE_HITS, 0) / lookups, 4)
+            logger.info(f"Sync summary: {json.dumps(report)}")
+
+
+# Metrics of the current process, shared by the producer and consumer threads
+METRICS = Metrics()
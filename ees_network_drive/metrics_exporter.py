@@ -0,0 +1,149 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""This module exports the metrics of a running sync in the Prometheus text format.
+
+    The metrics can be served over HTTP for Prometheus to scrape them while the sync is running,
+    and/or written periodically to a file read by the textfile collector of the node exporter,
+    which suits syncs scheduled with cron.
+"""
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .constant import METRICS_EXPORT_INTERVAL
+from .metrics import (ACTIVE_SMB_CONNECTIONS, BUCKET_BOUNDS, BYTES_DOWNLOADED, CONTENT_CACHE_HITS,
+                      CONTENT_CACHE_MISSES, DOCUMENTS_FAILED, DOCUMENTS_FETCHED, DOCUMENTS_INDEXED,
+                      DOCUMENTS_PERMISSIONS_UPDATED, METRICS, QUEUE_DEPTH)
+from .utils import atomic_write
+
+PREFIX = "ees_network_drive"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+COUNTERS = {
+    DOCUMENTS_FETCHED: "Number of documents fetched from the Network Drives",
+    DOCUMENTS_INDEXED: "Number of documents indexed to Enterprise Search",
+    DOCUMENTS_FAILED: "Number of documents rejected by Enterprise Search",
+    BYTES_DOWNLOADED: "Number of bytes downloaded from the Network Drives",
+    DOCUMENTS_PERMISSIONS_UPDATED: "Number of documents whose permissions were updated without downloading the file",
+    CONTENT_CACHE_HITS: "Number of files whose text was taken from the content cache instead of being extracted",
+    CONTENT_CACHE_MISSES: "Number of files whose text was not found in the content cache",
+}
+
+GAUGES = {
+    QUEUE_DEPTH: "Number of document batches waiting in the queue to be indexed",
+    ACTIVE_SMB_CONNECTIONS: "Number of SMB connections open by the fetching threads",
+}
+
+
+def render_metrics(metrics=METRICS):
+    """Returns the metrics in the Prometheus text exposition format
+    :param metrics: Metrics object to be exported
+    """
+    histograms, counters, gauges = metrics.collect()
+    lines = []
+    for counter, description in COUNTERS.items():
+        name = f"{PREFIX}_{counter}_total"
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {counters.get(counter, 0)}")
+    for gauge, description in GAUGES.items():
+        if gauge in gauges:
+            name = f"{PREFIX}_{gauge}"
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {gauges[gauge]}")
+
+    name = f"{PREFIX}_stage_duration_seconds"
+    lines.append(f"# HELP {name} Time spent in each stage of the sync")
+    lines.append(f"# TYPE {name} histogram")
+    for stage, snapshot in sorted(histograms.items()):
+        cumulative_count = 0
+        for bound, bucket_count in zip(BUCKET_BOUNDS, snapshot["buckets"]):
+            cumulative_count += bucket_count
+            lines.append(f'{name}_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative_count}')
+        lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {snapshot["count"]}')
+        lines.append(f'{name}_sum{{stage="{stage}"}} {snapshot["total_seconds"]}')
+        lines.append(f'{name}_count{{stage="{stage}"}} {snapshot["count"]}')
+
+    name = f"{PREFIX}_stage_bytes_total"
+    lines.append(f"# HELP {name} Number of bytes processed by each stage of the sync")
+    lines.append(f"# TYPE {name} counter")
+    for stage, snapshot in sorted(histograms.items()):
+        lines.append(f'{name}{{stage="{stage}"}} {snapshot["total_bytes"]}')
+    return "\n".join(lines) + "\n"
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serves the metrics on the /metrics path"""
+
+    def do_GET(self):
+        """Responds to the scrape requests"""
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics(self.server.metrics).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Scrape requests are not logged"""
+
+
+class MetricsExporter:
+    """This class exports the metrics while a command is running, as configured by the metrics_port
+    and metrics_textfile_path settings. It does nothing if neither setting is provided.
+    """
+
+    def __init__(self, config, logger, metrics=METRICS, interval=METRICS_EXPORT_INTERVAL):
+        self.logger = logger
+        self.port = config.get_value("metrics_port")
+        self.textfile_path = config.get_value("metrics_textfile_path")
+        self.metrics = metrics
+        self.interval = interval
+        self.server = None
+        self.writer = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        """Starts serving the metrics and/or writing them to the textfile in background threads"""
+        if self.port is not None:
+            self.server = ThreadingHTTPServer(("", self.port), MetricsRequestHandler)
+            self.server.daemon_threads = True
+            self.server.metrics = self.metrics
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+            self.logger.info(f"Serving the metrics on port {self.server.server_address[1]} at /metrics")
+        if self.textfile_path:
+            self.writer = threading.Thread(target=self.write_periodically, daemon=True)
+            self.writer.start()
+
+    def write_textfile(self):
+        """Writes the metrics to the textfile. The file is replaced atomically, so the collector never
+        reads a partially written file"""
+        try:
+            with atomic_write(self.textfile_path) as textfile:
+                textfile.write(render_metrics(self.metrics))
+            # The temporary file is only readable by its owner, the collector may run as another user
+            os.chmod(self.textfile_path, 0o644)
+        except OSError as exception:
+            self.logger.error(f"Error while writing the metrics to {self.textfile_path}. Error: {exception}")
+
+    def write_periodically(self):
+        """Writes the metrics to the textfile until the exporter is stopped"""
+        while not self.stopped.wait(self.interval):
+            self.write_textfile()
+
+    def stop(self):
+        """Stops serving the metrics, and writes the final metrics to the textfile"""
+        self.stopped.set()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.writer:
+            self.writer.join()
+            self.write_textfile()
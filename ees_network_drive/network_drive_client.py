@@ -6,6 +6,8 @@
 """network_drive_client allows to call Network Drives and returns a connection object
     that can be used to fetch files from Network Drives.
 """
+import threading
+
 from smb.base import NotConnectedError, SMBTimeout
 from smb.SMBConnection import SMBConnection
 from .utils import retry
@@ -27,6 +29,8 @@ class NetworkDrive:
         self.username = config.get_value("network_drive.username")
         self.password = config.get_value("network_drive.password")
         self.retry_count = int(config.get_value("retry_count"))
+        # Identifies the connections opened by the clients of the same drive, see ConnectionCache
+        self.connection_key = (self.server_ip, self.server_name, self.domain, self.username)
 
     @retry(exception_list=(NotConnectedError, SMBTimeout))
     def connect(self):
@@ -44,3 +48,66 @@ class NetworkDrive:
             self.logger.exception(
                 f"Unknown error while connecting to Network Drives. Error: {exception}"
             )
+
+
+class ConnectionCache:
+    """Keeps one SMB connection per thread and drive so that a worker can reuse its connection for
+    every folder it fetches, and closes all the connections once the sync is over.
+    """
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+
+    def thread_connections(self):
+        """Returns the connections of the current thread, by connection key of the client that opened them"""
+        if not hasattr(self.local, "connections"):
+            self.local.connections = {}
+        return self.local.connections
+
+    def get(self, network_drive_client):
+        """Returns the connection of the current thread, connecting to the Network Drives if needed
+        :param network_drive_client: Network Drives client used to open the connection
+        """
+        thread_connections = self.thread_connections()
+        smb_connection = thread_connections.get(network_drive_client.connection_key)
+        if not smb_connection:
+            smb_connection = network_drive_client.connect()
+            if not smb_connection:
+                raise ConnectionError("Unknown error while connecting to network drives")
+            thread_connections[network_drive_client.connection_key] = smb_connection
+            with self.lock:
+                self.connections.append(smb_connection)
+        return smb_connection
+
+    def active_count(self):
+        """Returns the number of connections currently open by the threads"""
+        with self.lock:
+            return len(self.connections)
+
+    def discard(self, network_drive_client):
+        """Closes the connection of the current thread, so that the next call to get reconnects
+        :param network_drive_client: Network Drives client which opened the connection
+        """
+        smb_connection = self.thread_connections().pop(network_drive_client.connection_key, None)
+        if smb_connection:
+            with self.lock:
+                self.connections.remove(smb_connection)
+            close_quietly(smb_connection)
+
+    def close_all(self):
+        """Closes the connections of all the threads"""
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for smb_connection in connections:
+            close_quietly(smb_connection)
+
+
+def close_quietly(smb_connection):
+    """Closes the connection, ignoring the errors raised by a connection that is already broken
+    :param smb_connection: SMB connection object
+    """
+    try:
+        smb_connection.close()
+    except Exception:
+        pass
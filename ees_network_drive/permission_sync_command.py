@@ -10,6 +10,7 @@
 """
 import csv
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 from .base_command import BaseCommand
 
@@ -50,19 +51,48 @@ class PermissionSyncCommand(BaseCommand):
         self.ws_source = config.get_value("enterprise_search.source_id")
         self.enable_document_permission = config.get_value("enable_document_permission")
         self.user_mapping = config.get_value("network_drive_enterprise_search.user_mapping")
-
-    def remove_all_permissions(self):
-        """ Removes all the permissions present in the workplace
+        self.thread_count = config.get_value("enterprise_search_sync_thread_count")
+
+    def get_permission_changes(self, mappings, current_permissions):
+        """Compares the user mappings with the permissions present in the workplace
+        :param mappings: dictionary of Enterprise Search users and their list of Network Drives sids
+        :param current_permissions: dictionary of users and their permission objects in the workplace,
+            None if they could not be retrieved
+        Returns:
+            changes: tuple of the users to be created, the users to be updated and the permission objects
+                to be removed
+        """
+        if current_permissions is None:
+            self.logger.warning(
+                "The permissions present in the workplace could not be retrieved, adding the permissions of every \
+                mapped user without removing the unmapped users"
+            )
+            return mappings, {}, []
+        created = {user: sids for user, sids in mappings.items() if user not in current_permissions}
+        updated = {
+            user: sids for user, sids in mappings.items()
+            if user in current_permissions and set(sids) != set(current_permissions[user].get("permissions") or [])
+        }
+        removed = [permission for user, permission in current_permissions.items() if user not in mappings]
+        return created, updated, removed
+
+    def sync_permissions(self, mappings):
+        """Applies the differences between the user mappings and the permissions of the workplace. Users
+        whose permissions did not change are left untouched, and the requests are sent concurrently
+        :param mappings: dictionary of Enterprise Search users and their list of Network Drives sids
         """
-        try:
-            user_permission = self.workplace_search_custom_client.list_permissions()
-            if user_permission:
-                self.logger.info("Removing the permissions from the workplace...")
-                permission_list = user_permission['results']
-                for permission in permission_list:
-                    self.workplace_search_custom_client.remove_permissions(permission)
-        except Exception as exception:
-            self.logger.exception(f"Error while removing the permissions from the workplace. Error: {exception}")
+        client = self.workplace_search_custom_client
+        created, updated, removed = self.get_permission_changes(mappings, client.list_all_permissions())
+        self.logger.info(
+            f"Permission changes: {len(created)} users to create, {len(updated)} users to update and "
+            f"{len(removed)} users to remove"
+        )
+        with ThreadPoolExecutor(max_workers=self.thread_count) as executor:
+            futures = [executor.submit(client.add_permissions, user, sids) for user, sids in created.items()]
+            futures += [executor.submit(client.put_permissions, user, sids) for user, sids in updated.items()]
+            futures += [executor.submit(client.remove_permissions, permission) for permission in removed]
+            for future in futures:
+                future.result()
 
     def execute(self):
         """ Runs the permission indexing logic.
@@ -89,9 +119,7 @@ class PermissionSyncCommand(BaseCommand):
                 except csv.Error as e:
                     self.logger.exception(f"Error while reading user mapping file at the location: \
                         {self.user_mapping}. Error: {e}")
-            self.remove_all_permissions()
-            for key, val in mappings.items():
-                self.workplace_search_custom_client.add_permissions(key, val)
+            self.sync_permissions(mappings)
         else:
             self.logger.error(f'Could not find the users mapping file at the location: {self.user_mapping} or the file is empty. \
                 Please add the sid->user mappings to sync the permissions in the Enterprise Search')
@@ -0,0 +1,200 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""This module downloads the next files of a fetching thread ahead of time.
+
+    A fetching thread processes the files of a folder one by one, so the SMB connection is idle
+    while a file is extracted and the CPU is idle while a file is downloaded. The prefetcher
+    downloads the next files of the thread to temporary files in a background thread, using a
+    separate SMB connection, so that the downloads overlap with the extraction. The files are
+    downloaded in the order they are processed, up to a number of files and bytes ahead. When the
+    bytes in flight are bounded, the size of a file is reserved from the budget before it is
+    downloaded ahead, and the reservation is handed to the document of the file once it is taken.
+"""
+import threading
+from collections import deque
+
+from .constant import BUDGET_POLL_INTERVAL
+
+
+class Prefetcher:
+    """This class downloads the scheduled files in a background thread, until the fetching thread takes
+    them or the prefetcher is closed"""
+
+    def __init__(self, download, smb_connection, file_count, max_bytes, budget=None):
+        """
+        :param download: function downloading a file with the given connection, returning the downloaded
+            temporary file and the hash of its contents
+        :param smb_connection: SMB connection dedicated to the prefetching
+        :param file_count: maximum number of files downloaded ahead
+        :param max_bytes: maximum number of bytes downloaded ahead, a larger file is downloaded alone
+        :param budget: ByteBudget from which the size of each file is reserved, by file id, before downloading it
+        """
+        self.download = download
+        self.smb_connection = smb_connection
+        self.file_count = file_count
+        self.max_bytes = max_bytes
+        self.budget = budget
+        self.condition = threading.Condition()
+        self.sequence = 0
+        # Files waiting to be downloaded, as tuples of sequence number, file id and file details
+        self.pending = deque()
+        # Downloaded files by file id, as tuples of sequence number, size and downloaded file
+        self.ready = {}
+        self.ready_bytes = 0
+        self.downloading = None
+        self.closed = False
+        self.failed = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def schedule(self, files):
+        """Schedules the download of files, in the order they are going to be taken
+        :param files: list of tuples of file id and file details
+        """
+        with self.condition:
+            for file_id, file_details in files:
+                self.sequence += 1
+                self.pending.append((self.sequence, file_id, file_details))
+            self.condition.notify_all()
+
+    def has_room(self, size):
+        """Returns True if a file of the given size can be downloaded without exceeding the limits"""
+        return not self.ready or (len(self.ready) < self.file_count and self.ready_bytes + size <= self.max_bytes)
+
+    def next_size(self):
+        """Returns the size of the next file to be downloaded"""
+        return self.pending[0][2].get('file_size') or 0
+
+    def run(self):
+        """Downloads the pending files in order. The prefetching stops at the first failure, as the connection
+        may be broken, and the remaining files are downloaded by the fetching thread"""
+        while True:
+            with self.condition:
+                while not self.closed:
+                    if self.pending and self.has_room(self.next_size()) and \
+                            self.reserve(self.pending[0][1], self.next_size()):
+                        break
+                    # The budget is released by the indexing threads, which do not notify the prefetcher
+                    self.condition.wait(BUDGET_POLL_INTERVAL if self.budget and self.pending else None)
+                if self.closed:
+                    return
+                sequence, file_id, file_details = self.pending.popleft()
+                self.downloading = (sequence, file_id)
+            try:
+                downloaded = self.download(file_details, self.smb_connection)
+            except Exception:
+                downloaded = None
+            with self.condition:
+                self.downloading = None
+                if downloaded is None:
+                    self.release(file_id)
+                    self.failed = self.closed = True
+                    self.pending.clear()
+                elif self.closed:
+                    self.release(file_id)
+                    close_download(downloaded)
+                else:
+                    size = file_details.get('file_size') or 0
+                    self.ready[file_id] = (sequence, size, downloaded)
+                    self.ready_bytes += size
+                self.condition.notify_all()
+
+    def reserve(self, file_id, size):
+        """Reserves the size of the file from the budget, returns False if the budget is exhausted"""
+        return not self.budget or self.budget.try_acquire(str(file_id), size)
+
+    def release(self, file_id):
+        """Releases the size reserved for a file which is not handed to the fetching thread"""
+        if self.budget:
+            self.budget.release([str(file_id)])
+
+    def discard_before(self, sequence):
+        """Drops the files scheduled before the given sequence number, which were skipped by the fetching thread"""
+        self.pending = deque(item for item in self.pending if item[0] >= sequence)
+        for file_id, (file_sequence, size, downloaded) in list(self.ready.items()):
+            if file_sequence < sequence:
+                del self.ready[file_id]
+                self.ready_bytes -= size
+                self.release(file_id)
+                close_download(downloaded)
+
+    def sequence_of(self, file_id):
+        """Returns the sequence number of a file that is pending, being downloaded or downloaded, None otherwise"""
+        if file_id in self.ready:
+            return self.ready[file_id][0]
+        if self.downloading and self.downloading[1] == file_id:
+            return self.downloading[0]
+        for sequence, pending_id, _ in self.pending:
+            if pending_id == file_id:
+                return sequence
+        return None
+
+    def will_download(self, file_id):
+        """Returns True if the file is being downloaded, or is the next file to be downloaded. With a budget, the
+        next file may wait for the budget held by the documents of the fetching thread, which downloads it instead"""
+        if self.downloading:
+            return self.downloading[1] == file_id
+        return not (self.closed or self.budget) and bool(self.pending) and self.pending[0][1] == file_id
+
+    def drop_ready(self):
+        """Deletes the files downloaded ahead and releases their reservations, so that the fetching thread waiting
+        for the budget does not wait for bytes it holds itself. The dropped files are downloaded by the fetching
+        thread"""
+        with self.condition:
+            for file_id, (_, _, downloaded) in self.ready.items():
+                self.release(file_id)
+                close_download(downloaded)
+            self.ready.clear()
+            self.ready_bytes = 0
+            self.condition.notify_all()
+
+    def take(self, file_id):
+        """Returns the downloaded file, waiting for its download if it is in progress or about to start. The
+        files scheduled before it were skipped by the fetching thread and are dropped
+        :param file_id: id of the file
+        Returns:
+            downloaded: tuple of the temporary file and the hash of its contents, None if the file was not
+                downloaded ahead and has to be downloaded by the fetching thread. The size reserved from the budget
+                for a downloaded file is kept for the document of the file
+        """
+        with self.condition:
+            sequence = self.sequence_of(file_id)
+            if sequence is None:
+                return None
+            self.discard_before(sequence)
+            self.condition.notify_all()
+            while file_id not in self.ready and self.will_download(file_id):
+                self.condition.wait()
+            downloaded = None
+            if file_id in self.ready:
+                _, size, downloaded = self.ready.pop(file_id)
+                self.ready_bytes -= size
+            else:
+                # The prefetcher is still busy with a skipped file or stopped, the fetching thread downloads the
+                # file itself
+                self.discard_before(sequence + 1)
+            self.condition.notify_all()
+            return downloaded
+
+    def close(self):
+        """Stops the downloads and deletes the files that were downloaded but not taken"""
+        with self.condition:
+            self.closed = True
+            self.pending.clear()
+            self.condition.notify_all()
+        self.thread.join()
+        for file_id, (_, _, downloaded) in self.ready.items():
+            self.release(file_id)
+            close_download(downloaded)
+        self.ready.clear()
+        self.ready_bytes = 0
+
+
+def close_download(downloaded):
+    """Deletes the temporary file of a download
+    :param downloaded: tuple of the temporary file and the hash of its contents
+    """
+    downloaded[0].close()
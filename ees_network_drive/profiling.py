@@ -0,0 +1,146 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""This module profiles the execution of a command, as requested with the --profile option.
+
+    In the cpu and wall modes, every thread started by the command is profiled by its own cProfile
+    profiler, measuring respectively the CPU time of the thread or the elapsed time, and the
+    profile of each thread is written to a separate file. In the memory mode, the allocations are
+    traced with tracemalloc and the largest allocations are written when the command completes.
+    A metadata file describing the sync is written along with the profiles.
+"""
+import cProfile
+import json
+import os
+import platform
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+from .metrics import METRICS
+from .utils import get_current_time
+
+PROFILE_MODES = ["cpu", "wall", "memory"]
+TOP_ENTRIES = 50
+TRACEBACK_FRAMES = 10
+# Since Python 3.12 a cProfile profiler records the calls of all the threads, so a single profiler
+# is used instead of one per thread
+PROFILER_PER_THREAD = sys.version_info < (3, 12)
+
+# Configuration settings recorded in the metadata of the profiles
+METADATA_SETTINGS = [
+    "network_drive.server_name",
+    "network_drive.path",
+    "network_drives_sync_thread_count",
+    "network_drives_sync_executor",
+    "enterprise_search_sync_thread_count",
+    "enable_document_permission",
+]
+
+
+class Profiler:
+    """This class profiles the command executed in its context and writes the results to a new
+    directory created in profile_dir"""
+
+    def __init__(self, mode, profile_dir, command_name, config, logger):
+        self.mode = mode
+        self.command_name = command_name
+        self.config = config
+        self.logger = logger
+        run_name = f"{command_name}-{mode}-{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}-{os.getpid()}"
+        self.output_dir = os.path.join(profile_dir, run_name)
+        self.lock = threading.Lock()
+        self.profiles = []
+        self.started_at = None
+        self.started_counter = None
+
+    def create_profile(self):
+        """Returns a new cProfile profiler measuring the time of the profiling mode"""
+        timer = time.thread_time if self.mode == "cpu" else time.perf_counter
+        return cProfile.Profile(timer)
+
+    def start_thread_profile(self, frame, event, argument):
+        """Installed with threading.setprofile, starts the profiler of each new thread"""
+        profile = self.create_profile()
+        thread = threading.current_thread()
+        with self.lock:
+            self.profiles.append((thread.name, thread.ident, profile))
+        profile.enable()
+
+    def __enter__(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.started_at = get_current_time()
+        self.started_counter = time.perf_counter()
+        if self.mode == "memory":
+            tracemalloc.start(TRACEBACK_FRAMES)
+        else:
+            if PROFILER_PER_THREAD:
+                threading.setprofile(self.start_thread_profile)
+            profile = self.create_profile()
+            self.profiles.append((threading.current_thread().name, threading.get_ident(), profile))
+            profile.enable()
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        duration = time.perf_counter() - self.started_counter
+        if self.mode == "memory":
+            self.write_memory_profile()
+        else:
+            threading.setprofile(None)
+            self.write_thread_profiles()
+        self.write_metadata(duration, exception)
+        self.logger.info(f"The {self.mode} profile of the {self.command_name} command was written to {self.output_dir}")
+
+    def write_thread_profiles(self):
+        """Writes the profile of each thread, along with a text report of the profiles of all the threads"""
+        profile_files = []
+        with self.lock:
+            profiles = list(self.profiles)
+        for thread_name, thread_id, profile in profiles:
+            profile.disable()
+            profile.create_stats()
+            if not profile.stats:
+                continue
+            path = os.path.join(self.output_dir, f"{thread_name}-{thread_id}.prof")
+            profile.dump_stats(path)
+            profile_files.append(path)
+        if profile_files:
+            with open(os.path.join(self.output_dir, "summary.txt"), "w", encoding="utf-8") as summary_file:
+                stats = pstats.Stats(*profile_files, stream=summary_file)
+                stats.sort_stats("cumulative").print_stats(TOP_ENTRIES)
+
+    def write_memory_profile(self):
+        """Writes the tracemalloc snapshot, along with a text report of the largest allocations"""
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        snapshot.dump(os.path.join(self.output_dir, "memory.snapshot"))
+        with open(os.path.join(self.output_dir, "summary.txt"), "w", encoding="utf-8") as summary_file:
+            summary_file.write(f"Peak traced memory: {peak} bytes\n\n")
+            for statistic in snapshot.statistics("lineno")[:TOP_ENTRIES]:
+                summary_file.write(f"{statistic}\n")
+
+    def write_metadata(self, duration, exception):
+        """Writes the description of the profiled sync"""
+        metadata = {
+            "command": self.command_name,
+            "mode": self.mode,
+            "started_at": self.started_at,
+            "ended_at": get_current_time(),
+            "duration_seconds": round(duration, 3),
+            "succeeded": exception is None,
+            "pid": os.getpid(),
+            "hostname": platform.node(),
+            "python_version": platform.python_version(),
+            "platform": platform.platform(),
+            "profiler_per_thread": PROFILER_PER_THREAD,
+            "settings": {setting: self.config.get_value(setting) for setting in METADATA_SETTINGS},
+            "stages": METRICS.summary(),
+        }
+        with open(os.path.join(self.output_dir, "metadata.json"), "w", encoding="utf-8") as metadata_file:
+            json.dump(metadata, metadata_file, indent=2, default=str)
@@ -48,6 +48,47 @@ schema = {
         'type': 'string',
         'empty': False
     },
+    'network_drives': {
+        'required': False,
+        'nullable': True,
+        'type': 'list',
+        'default': [],
+        'schema': {
+            'type': 'dict',
+            'schema': {
+                'name': {
+                    'required': True,
+                    'type': 'string',
+                    'regex': '[A-Za-z0-9_-]+'
+                },
+                'path': {
+                    'required': True,
+                    'type': 'string',
+                    'empty': False
+                },
+                'domain': {
+                    'type': 'string',
+                    'empty': False
+                },
+                'username': {
+                    'type': 'string',
+                    'empty': False
+                },
+                'password': {
+                    'type': 'string',
+                    'empty': False
+                },
+                'server_name': {
+                    'type': 'string',
+                    'empty': False
+                },
+                'server_ip': {
+                    'type': 'string',
+                    'empty': False
+                },
+            }
+        }
+    },
     'client_machine.name': {
         'required': True,
         'type': 'string',
@@ -89,6 +130,16 @@ schema = {
             },
         }
     },
+    'metadata_only_file_types': {
+        'required': False,
+        'nullable': True,
+        'type': 'list',
+        'default': [],
+        'schema': {
+            'type': 'string',
+            'empty': False
+        }
+    },
     'exclude': {
         'nullable': True,
         'type': 'dict',
@@ -142,6 +193,12 @@ schema = {
         'default': 5,
         'min': 1
     },
+    'network_drives_sync_executor': {
+        'required': False,
+        'type': 'string',
+        'default': 'thread',
+        'allowed': ['thread', 'process']
+    },
     'enterprise_search_sync_thread_count': {
         'required': False,
         'type': 'integer',
@@ -153,8 +210,62 @@ schema = {
         'type': 'boolean',
         'default': True
     },
+    'full_sync_deletion': {
+        'required': False,
+        'type': 'boolean',
+        'default': False
+    },
     'network_drive_enterprise_search.user_mapping': {
         'required': False,
         'type': 'string',
+    },
+    'permissions_page_size': {
+        'required': False,
+        'type': 'integer',
+        'default': 100,
+        'min': 1
+    },
+    'max_in_flight_bytes': {
+        'required': False,
+        'nullable': True,
+        'type': 'integer',
+        'min': 1
+    },
+    'prefetch_file_count': {
+        'required': False,
+        'type': 'integer',
+        'default': 0,
+        'min': 0
+    },
+    'prefetch_max_bytes': {
+        'required': False,
+        'type': 'integer',
+        'default': 67108864,
+        'min': 1
+    },
+    'content_cache_max_bytes': {
+        'required': False,
+        'nullable': True,
+        'type': 'integer',
+        'default': None,
+        'min': 1
+    },
+    'content_cache_path': {
+        'required': False,
+        'nullable': True,
+        'type': 'string',
+        'default': None
+    },
+    'metrics_port': {
+        'required': False,
+        'nullable': True,
+        'type': 'integer',
+        'min': 0,
+        'max': 65535
+    },
+    'metrics_textfile_path': {
+        'required': False,
+        'nullable': True,
+        'type': 'string'
     }
 }
@@ -0,0 +1,79 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""This module contains the helpers used to split a full sync into shards.
+
+    The folders of the Network Drive are partitioned deterministically by hashing their
+    paths, so that several full-sync processes, possibly on different machines, can each
+    sync one slice of the drive. Every shard keeps its own local storage and checkpoint
+    files which are combined afterwards by the merge-shards command.
+"""
+import hashlib
+import os
+import re
+from argparse import ArgumentTypeError
+from collections import namedtuple
+
+Shard = namedtuple("Shard", ["index", "count"])
+
+
+def parse_shard(value):
+    """Parses the value of the --shard argument
+    :param value: shard in the format i/N where 0 <= i < N
+    Returns:
+        shard: Shard tuple containing the index and the total number of shards
+    """
+    match = re.fullmatch(r"(\d+)/(\d+)", value.strip())
+    if not match:
+        raise ArgumentTypeError(f"Invalid shard: {value}. Expected format: i/N, for example 0/4")
+    shard = Shard(int(match.group(1)), int(match.group(2)))
+    if shard.count < 1 or shard.index >= shard.count:
+        raise ArgumentTypeError(f"Invalid shard: {value}. The shard index must be between 0 and {shard.count - 1}")
+    return shard
+
+
+def parse_shard_count(value):
+    """Parses the value of the --shards argument
+    :param value: total number of shards, at least 1
+    Returns:
+        count: total number of shards
+    """
+    try:
+        count = int(value)
+    except ValueError:
+        raise ArgumentTypeError(f"Invalid number of shards: {value}. Expected an integer, for example 4")
+    if count < 1:
+        raise ArgumentTypeError(f"Invalid number of shards: {value}. The number of shards must be at least 1")
+    return count
+
+
+def shard_of(folder_path, shard_count):
+    """Returns the index of the shard owning the folder
+    :param folder_path: path of the folder in the Network Drive
+    :param shard_count: total number of shards
+    """
+    digest = hashlib.md5(folder_path.replace("\\", "/").encode("utf-8")).hexdigest()
+    return int(digest, 16) % shard_count
+
+
+def filter_folders_for_shard(folders, shard):
+    """Returns the folders that belong to the shard
+    :param folders: list of folder paths in the Network Drive
+    :param shard: Shard tuple, or None when sharding is disabled
+    """
+    if not shard:
+        return folders
+    return [folder for folder in folders if shard_of(folder, shard.count) == shard.index]
+
+
+def shard_file_path(path, shard):
+    """Returns the path of the file used by the shard instead of the given path
+    :param path: path of the local storage or checkpoint file
+    :param shard: Shard tuple, or None when sharding is disabled
+    """
+    if not shard:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.shard-{shard.index}-of-{shard.count}{extension}"
@@ -0,0 +1,173 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""This module allows one run of the connector to sync several Network Drives.
+
+    The drive configured with the network_drive.* settings is synced along with the drives
+    listed in the network_drives setting, each of which only provides the settings that differ
+    from the network_drive.* ones. Every drive keeps its own local storage, crawl statistics,
+    full sync progress and checkpoint, while the fetching threads, the byte budget, the content
+    cache and the indexing threads of the run are shared by all the drives. The folders of the
+    drives are fetched in turn, so that a large drive does not delay the others.
+"""
+import os
+import threading
+from itertools import zip_longest
+
+from .local_storage import FILE_STATES
+from .network_drive_client import NetworkDrive
+
+# Settings of a drive listed in network_drives which replace the network_drive.* settings
+SOURCE_SETTINGS = ["domain", "username", "password", "path", "server_name", "server_ip"]
+
+
+class DriveSyncException(Exception):
+    """Exception raised when some of the drives could not be synced, once the other drives are synced.
+
+    Attributes:
+        drives -- names of the drives that could not be synced
+    """
+
+    def __init__(self, drives):
+        super().__init__(f"Could not list the folders of the drives: {drives}. Their checkpoints were not saved.")
+        self.drives = drives
+
+
+class SourceConfiguration:
+    """This class gives the view of the configuration of a drive listed in the network_drives setting, where
+    the network_drive.* settings are replaced by the settings of the drive"""
+
+    def __init__(self, config, source):
+        """
+        :param config: Configuration object
+        :param source: dictionary of the settings of the drive, as listed in the network_drives setting
+        """
+        self.config = config
+        self.source = source
+
+    def get_value(self, key):
+        """Returns the setting of the drive if it provides one, the configuration value otherwise"""
+        prefix, _, name = key.partition(".")
+        if prefix == "network_drive" and (name == "name" or name in SOURCE_SETTINGS):
+            value = self.source.get(name)
+            if value is not None:
+                return value
+        return self.config.get_value(key)
+
+
+class Source:
+    """This class holds a Network Drive synced by the connector"""
+
+    def __init__(self, config, logger, name=None):
+        """
+        :param config: configuration of the drive
+        :param logger: logger object
+        :param name: name of the drive listed in the network_drives setting, None for the drive configured
+            with the network_drive.* settings
+        """
+        self.config = config
+        self.name = name
+        self.server_name = config.get_value("network_drive.server_name")
+        self.network_drive_client = NetworkDrive(config, logger)
+
+    @property
+    def checkpoint_key(self):
+        """Returns the key of the checkpoint of the drive in the checkpoint file"""
+        return self.name or self.server_name
+
+    def file_path(self, path):
+        """Returns the path of the file used by the drive instead of the given path, so that the local storage,
+        statistics and progress of the drives are kept apart
+        :param path: path of the local storage, crawl statistics or progress file
+        """
+        if not self.name:
+            return path
+        root, extension = os.path.splitext(path)
+        return f"{root}.{self.name}{extension}"
+
+
+def get_sources(config, logger):
+    """Returns the drives synced by the connector, starting with the drive configured with the network_drive.*
+    settings
+    :param config: Configuration object
+    :param logger: logger object
+    """
+    sources = [Source(config, logger)]
+    for source in config.get_value("network_drives") or []:
+        sources.append(Source(SourceConfiguration(config, source), logger, source["name"]))
+    return sources
+
+
+def interleave(job_lists):
+    """Returns the jobs of the drives in turn, one job of each drive after the other, so that the fetching
+    threads shared by the drives make progress on all of them
+    :param job_lists: list of the lists of jobs of each drive, in the order they should be run
+    """
+    return [job for jobs in zip_longest(*job_lists) for job in jobs if job is not None]
+
+
+class DriveSync:
+    """This class holds the objects syncing a drive during a full or an incremental sync.
+
+    Only the IDs of the files fetched by the sync are kept in memory. The IDs stored by the previous syncs are read
+    from the local storage record by record when the folders are ordered, when the deleted files are swept and when
+    the local storage is updated."""
+
+    def __init__(self, source, sync_network_drives, local_storage, crawl_statistics):
+        """
+        :param source: Source object of the drive
+        :param sync_network_drives: SyncNetworkDrives object fetching the files of the drive
+        :param local_storage: LocalStorage object of the drive
+        :param crawl_statistics: CrawlStatistics object of the drive
+        """
+        self.source = source
+        self.sync_network_drives = sync_network_drives
+        self.local_storage = local_storage
+        self.crawl_statistics = crawl_statistics
+        # IDs and paths of the files fetched by the sync
+        self.fetched_files = {}
+        # IDs of the stored files deleted by the sync
+        self.deleted_ids = set()
+        # Set by a full sync which swept the deleted files, to tell whether the stored files of a folder are still to
+        # be checked by the next deletion sync. By default, all the files stored by the previous syncs are checked
+        self.is_left_to_deletion_sync = None
+        self.folders = []
+        self.lock = threading.Lock()
+        # Set when the folders of the drive could not be listed, in which case its storage and checkpoint are kept
+        self.failed = False
+
+    def fetch(self, partition_paths):
+        """Fetches a group of folders of the drive and records the IDs of the fetched files
+        :param partition_paths: list of folder paths to fetch
+        """
+        ids = self.sync_network_drives.perform_sync(self.source.server_name, partition_paths)
+        with self.lock:
+            self.fetched_files.update(ids)
+
+    def iter_records(self):
+        """Yields the records of the local storage of the drive once synced. The stored files that were not fetched
+        again are kept unless they were deleted, and are checked by the next deletion sync, along with their states"""
+        for _, document_id, file_path in self.local_storage.iter_storage("global_keys"):
+            if document_id not in self.fetched_files and document_id not in self.deleted_ids:
+                yield "global_keys", document_id, file_path
+        for document_id, file_path in self.fetched_files.items():
+            yield "global_keys", document_id, file_path
+        for _, document_id, file_path in self.local_storage.iter_storage("global_keys"):
+            if document_id not in self.deleted_ids and (
+                self.is_left_to_deletion_sync is None or self.is_left_to_deletion_sync(os.path.dirname(file_path))
+            ):
+                yield "delete_keys", document_id, file_path
+        file_states = self.sync_network_drives.file_states
+        for _, document_id, state in self.local_storage.iter_storage(FILE_STATES):
+            if document_id not in file_states and document_id not in self.deleted_ids:
+                yield FILE_STATES, document_id, state
+        for document_id, state in file_states.items():
+            if document_id not in self.deleted_ids:
+                yield FILE_STATES, document_id, state
+
+    def save(self):
+        """Stores the IDs and the states of the files and the crawl statistics of the drive"""
+        self.local_storage.write_storage(self.iter_records())
+        self.crawl_statistics.save()
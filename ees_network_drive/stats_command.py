@@ -0,0 +1,57 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+"""This module allows to inspect the crawl statistics recorded by the previous syncs.
+
+    It prints the folders that took the longest to sync, along with their number of files
+    and total size, which are used to order the folders of the next sync. The statistics of a
+    sharded full sync are recorded by each shard, and are printed shard by shard when the
+    number of shards is given.
+"""
+from .base_command import BaseCommand
+from .crawl_statistics import STATS_PATH, CrawlStatistics
+from .sharding import Shard, shard_file_path
+
+
+class StatsCommand(BaseCommand):
+    """This class prints the statistics of the folders crawled by the previous syncs."""
+
+    def execute(self):
+        """Prints the statistics of the slowest folders and the totals of all the folders of each drive, and of each
+        shard if the number of shards is given"""
+        shard_count = getattr(self.args, "shards", None)
+        shards = [Shard(index, shard_count) for index in range(shard_count)] if shard_count else [None]
+        for source in self.sources:
+            for shard in shards:
+                if source.name:
+                    print(f"Drive: {source.name}")
+                if shard:
+                    print(f"Shard: {shard.index}/{shard.count}")
+                stats_path = shard_file_path(source.file_path(STATS_PATH), shard)
+                self.print_statistics(CrawlStatistics(self.logger, stats_path))
+
+    def print_statistics(self, crawl_statistics):
+        """Prints the statistics of the slowest folders and the totals of all the folders of a drive
+        :param crawl_statistics: CrawlStatistics object of the drive
+        """
+        folders = crawl_statistics.load()
+        if not folders:
+            print("No crawl statistics found. Run a full-sync to record them.")
+            return
+
+        slowest_folders = sorted(folders, key=crawl_statistics.weight, reverse=True)[:self.args.top]
+        print(f"{'FILES':>10} {'BYTES':>15} {'LISTING (s)':>12} {'EXTRACTION (s)':>15} {'UPDATED AT':>21}  FOLDER")
+        for folder in slowest_folders:
+            statistics = folders[folder]
+            print(
+                f"{statistics.get('file_count', 0):>10} {statistics.get('total_bytes', 0):>15} "
+                f"{statistics.get('listing_seconds', 0):>12.2f} {statistics.get('extraction_seconds', 0):>15.2f} "
+                f"{statistics.get('updated_at', ''):>21}  {folder}"
+            )
+        print(
+            f"Total: {len(folders)} folders, {sum(item.get('file_count', 0) for item in folders.values())} files, "
+            f"{sum(item.get('total_bytes', 0) for item in folders.values())} bytes, "
+            f"{sum(crawl_statistics.weight(folder) for folder in folders):.2f} seconds"
+        )
@@ -7,16 +7,21 @@
     It's possible to run full syncs and incremental syncs with this module.
 """
 import threading
+from queue import Empty
 
-from .constant import BATCH_SIZE, CONNECTION_TIMEOUT
+from .constant import BATCH_SIZE, BUDGET_POLL_INTERVAL, CONNECTION_TIMEOUT
+from .document import to_json
+from .metrics import DOCUMENTS_FAILED, DOCUMENTS_INDEXED, INDEX_REQUEST, METRICS, QUEUE_WAIT
 from .utils import split_documents_into_equal_chunks
 
 
 class SyncEnterpriseSearch:
     """This class contains common logic for indexing to workplace search"""
 
-    def __init__(self, config, logger, workplace_search_custom_client, queue):
+    def __init__(self, config, logger, workplace_search_custom_client, queue, sync_progress=None, budget=None):
         self.logger = logger
+        self.sync_progress = sync_progress
+        self.budget = budget
         self.workplace_search_custom_client = workplace_search_custom_client
         self.queue = queue
         self.ws_source = config.get_value("enterprise_search.source_id")
@@ -30,19 +35,66 @@ class SyncEnterpriseSearch:
         """
         self.total_documents_found += len(documents)
         if documents:
-            documents_indexed = 0
-            responses = self.workplace_search_custom_client.index_documents(
-                documents,
-                CONNECTION_TIMEOUT,
-            )
-            for document in responses["results"]:
-                if not document["errors"]:
-                    documents_indexed += 1
-                else:
-                    self.logger.error(
-                        f"Unable to index the document with id: {document['id']} Error {document['errors']}"
-                    )
-            self.total_document_indexed += documents_indexed
+            # The documents are only converted to json documents once they are sent
+            json_documents = [to_json(document) for document in documents]
+            with METRICS.timer(INDEX_REQUEST):
+                responses = self.workplace_search_custom_client.index_documents(
+                    json_documents,
+                    CONNECTION_TIMEOUT,
+                )
+            self.acknowledge(documents, responses, "index")
+
+    def update_document_permissions(self, documents):
+        """This method updates the permissions of documents already indexed to the Enterprise Search, whose content
+        did not change
+        :param documents: list of the documents of the files whose permissions changed
+        """
+        self.total_documents_found += len(documents)
+        if documents:
+            with METRICS.timer(INDEX_REQUEST):
+                responses = self.workplace_search_custom_client.update_document_permissions(
+                    [document.to_permission_update() for document in documents],
+                    CONNECTION_TIMEOUT,
+                )
+            self.acknowledge(documents, responses, "update the permissions of")
+
+    def acknowledge(self, documents, responses, action):
+        """Records the documents accepted by the Enterprise Search and logs the rejected ones
+        :param documents: list of the documents sent to the Enterprise Search
+        :param responses: response of the Enterprise Search, holding the errors of each document
+        :param action: action performed on the documents, used in the error messages
+        """
+        indexed_ids = []
+        for document in responses["results"]:
+            if not document["errors"]:
+                indexed_ids.append(document["id"])
+            else:
+                self.logger.error(
+                    f"Unable to {action} the document with id: {document['id']} Error {document['errors']}"
+                )
+        self.total_document_indexed += len(indexed_ids)
+        METRICS.increment(DOCUMENTS_INDEXED, len(indexed_ids))
+        METRICS.increment(DOCUMENTS_FAILED, len(documents) - len(indexed_ids))
+        if self.sync_progress:
+            self.sync_progress.acknowledge(indexed_ids)
+
+    def get_from_queue(self, batch_started):
+        """Returns the next message of the queue. If documents were already pulled for the current batch and
+        a fetching thread waits for the byte budget, returns None so that the pulled documents are indexed
+        and their bytes released, instead of waiting for a full batch that cannot be fetched
+        :param batch_started: True if documents were already pulled for the current batch
+        """
+        with METRICS.timer(QUEUE_WAIT):
+            if not (self.budget and batch_started):
+                return self.queue.get()
+            while True:
+                try:
+                    if self.budget.has_waiters():
+                        return self.queue.get_nowait()
+                    return self.queue.get(timeout=BUDGET_POLL_INTERVAL)
+                except Empty:
+                    if self.budget.has_waiters():
+                        return None
 
     def perform_sync(self):
         """Pull documents from the queue and synchronize it to the Enterprise Search."""
@@ -50,19 +102,33 @@ class SyncEnterpriseSearch:
             signal_open = True
             while signal_open:
                 documents_to_index = []
-                while len(documents_to_index) < BATCH_SIZE:
-                    document = self.queue.get()
+                documents_to_update = []
+                while len(documents_to_index) + len(documents_to_update) < BATCH_SIZE:
+                    document = self.get_from_queue(bool(documents_to_index or documents_to_update))
+                    if document is None:
+                        break
                     if document.get("type") == "signal_close":
                         self.logger.info(f"Found an end signal in the queue. Closing Thread ID {threading.get_ident()}")
                         signal_open = False
                         break
+                    elif document.get("type") == "permission_update":
+                        documents_to_update.extend(document.get("data"))
                     else:
                         documents_to_index.extend(document.get("data"))
                 # This loop is to ensure if the last document fetched from the queue exceeds the size of
                 # documents_to_index to more than the permitted chunk size, then we split the documents as per the limit
-                for document_list in split_documents_into_equal_chunks(documents_to_index, BATCH_SIZE):
-                    self.index_documents(document_list)
+                try:
+                    for document_list in split_documents_into_equal_chunks(documents_to_index, BATCH_SIZE):
+                        self.index_documents(document_list)
+                    for document_list in split_documents_into_equal_chunks(documents_to_update, BATCH_SIZE):
+                        self.update_document_permissions(document_list)
+                finally:
+                    if self.budget:
+                        self.budget.release([document["id"] for document in documents_to_index + documents_to_update])
         except Exception as exception:
             self.logger.error(exception)
+            if self.budget:
+                # This thread stops indexing, the fetching threads must not wait for it to release bytes
+                self.budget.close()
         self.logger.info(f"Thread ID: {threading.get_ident()} Total {self.total_document_indexed} documents \
             indexed out of: {self.total_documents_found} till now..")
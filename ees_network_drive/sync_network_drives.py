@@ -6,12 +6,35 @@
 """This module allows to sync data to Elastic Enterprise Search.
     It's possible to run full syncs and incremental syncs with this module.
 """
-import copy
+import logging
+import multiprocessing
 import os
 import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count
 from pathlib import Path
+from queue import Empty, Queue
 
+from .constant import BATCH_SIZE, WORKER_POLL_INTERVAL
+from .content_cache import ContentCache
+from .document import Document
 from .files import Files
+from .local_storage import FILE_STATES
+from .metrics import ACTIVE_SMB_CONNECTIONS, DOCUMENTS_FETCHED, METRICS, QUEUE_DEPTH
+from .network_drive_client import ConnectionCache
+from .utils import rfc_3339_to_epoch
+
+# SMB connections of the current worker process, when the files are fetched by a process pool
+WORKER_CONNECTIONS = ConnectionCache()
+WORKER_PREFETCH_CONNECTIONS = ConnectionCache()
+# Texts extracted by the current worker process, when the files are fetched by a process pool
+WORKER_CONTENT_CACHE = ContentCache(0)
+# Queue on which the current worker process sends the batches of fetched documents to the connector process
+WORKER_BATCHES = None
+# Objects fetching the files of the drives synced by the current run, whose connections are reported together
+ACTIVE_SYNCS = []
+ACTIVE_SYNCS_LOCK = threading.Lock()
 
 
 class SyncNetworkDrives:
@@ -25,30 +48,127 @@ class SyncNetworkDrives:
         network_drive_client,
         indexing_rules,
         queue,
+        crawl_statistics=None,
+        sync_progress=None,
+        budget=None,
+        skip_unchanged_files=False,
+        content_cache=None,
+        process_pool=None,
     ):
         self.logger = logger
         self.config = config
-        self.time_range = time_range
+        # The time range is converted to epoch seconds once per sync so that the folder listings can
+        # be compared against the raw timestamps returned by the Network Drives server
+        self.time_range = {
+            "start_time": rfc_3339_to_epoch(time_range.get("start_time")),
+            "end_time": rfc_3339_to_epoch(time_range.get("end_time")),
+        }
         self.drive_path = Path(self.config.get_value("network_drive.path"))
         self.network_drive_client = network_drive_client
         self.indexing_rules = indexing_rules
         self.network_drives_sync_thread_count = config.get_value("network_drives_sync_thread_count")
         self.queue = queue
+        self.crawl_statistics = crawl_statistics
+        self.sync_progress = sync_progress
+        self.budget = budget
+        # When set, the files whose path and content did not change since the previous sync are not downloaded
+        # again, see get_stored_files
+        self.skip_unchanged_files = skip_unchanged_files
+        self.stored_files_by_folder = {}
+        # States of the fetched files, recorded in the local storage for the next incremental sync
+        self.file_states = {}
+        self.file_states_lock = threading.Lock()
+        self.content_cache = content_cache
+        self.connections = ConnectionCache()
+        # IDs of all the files listed by the sync and the folders that could not be listed, from which a full sync
+        # finds the stored files that were deleted from the Network Drives
+        self.listed_ids = set()
+        self.listing_errors = []
+        self.listing_lock = threading.Lock()
+        # Each fetching thread downloads its next files ahead with a second connection
+        self.prefetch_connections = ConnectionCache() if config.get_value("prefetch_file_count") else None
+        with ACTIVE_SYNCS_LOCK:
+            ACTIVE_SYNCS.append(self)
+        METRICS.register_gauge(QUEUE_DEPTH, queue.qsize)
+        METRICS.register_gauge(ACTIVE_SMB_CONNECTIONS, count_active_connections)
+        # The process pool provided by the caller is shared with the other drives of the run, and is not shut down
+        # when this object is closed
+        self.owns_process_pool = process_pool is None
+        self.process_pool = create_process_pool(config, logger) if self.owns_process_pool else process_pool
+
+    def active_connection_count(self):
+        """Returns the number of SMB connections open by the fetching threads, including the prefetching ones"""
+        count = self.connections.active_count()
+        if self.prefetch_connections:
+            count += self.prefetch_connections.active_count()
+        return count
+
+    def close(self):
+        """Closes the SMB connections of the fetching threads and shuts down the worker processes, if any"""
+        self.connections.close_all()
+        if self.prefetch_connections:
+            self.prefetch_connections.close_all()
+        with ACTIVE_SYNCS_LOCK:
+            if self in ACTIVE_SYNCS:
+                ACTIVE_SYNCS.remove(self)
+            if not ACTIVE_SYNCS:
+                METRICS.unregister_gauge(QUEUE_DEPTH)
+                METRICS.unregister_gauge(ACTIVE_SMB_CONNECTIONS)
+        if self.process_pool and self.owns_process_pool:
+            self.process_pool.shutdown()
 
-    def get_storage_with_collection(self, local_storage):
-        """Returns a dictionary containing the locally stored IDs of files fetched from network drives
+    def count_stored_files(self, local_storage):
+        """Reads the local storage record by record and returns the number of files stored by the previous syncs in
+        each folder. When the unchanged files are skipped, the paths and states of the stored files are also indexed
+        by folder, see get_stored_files
         :param local_storage: The object of the local storage used to store the indexed document IDs
+        Returns:
+            folder_sizes: dictionary of the number of stored files, by folder path
         """
-        storage_with_collection = {"global_keys": {}, "delete_keys": {}}
-        ids_collection = local_storage.load_storage()
-        storage_with_collection["delete_keys"] = copy.deepcopy(ids_collection.get("global_keys"))
+        folder_sizes = Counter()
+        previous_states = {}
+        if self.skip_unchanged_files:
+            previous_states = {
+                document_id: state for _, document_id, state in local_storage.iter_storage(FILE_STATES)
+            }
+        for _, document_id, file_path in local_storage.iter_storage("global_keys"):
+            folder_path = os.path.dirname(file_path)
+            folder_sizes[folder_path] += 1
+            state = previous_states.pop(document_id, None)
+            if state:
+                self.stored_files_by_folder.setdefault(folder_path, {})[document_id] = (file_path, state)
+        return folder_sizes
 
-        if not ids_collection["global_keys"]:
-            ids_collection["global_keys"] = {"files": {}}
+    def get_stored_files(self, partition_paths):
+        """Returns the paths and states recorded in the local storage for the files of the given folders, from which
+        the files whose content did not change are found without requesting Enterprise Search
+        :param partition_paths: list of folder paths to fetch
+        Returns:
+            stored_files: dictionary of tuples of the path and the state of the files, by document id. None if the
+                unchanged files are not skipped
+        """
+        if not self.skip_unchanged_files:
+            return None
+        stored_files = {}
+        for folder_path in partition_paths:
+            stored_files.update(self.stored_files_by_folder.get(folder_path) or {})
+        return stored_files
 
-        storage_with_collection["global_keys"] = copy.deepcopy(ids_collection["global_keys"])
+    def prioritize_folders(self, folders, folder_sizes):
+        """Orders the folders so that the folders that took the longest to sync, or held the most files,
+        in the previous sync are fetched first. Folders are then pulled one by one by the idle fetching
+        threads, so a large folder started early does not keep a single thread busy long after the others
+        are done.
+        :param folders: list of folder paths in the Network Drive
+        :param folder_sizes: dictionary of the number of files stored by the previous sync, by folder path
+        Returns:
+            folders: list of folder paths sorted by decreasing weight
+        """
+        def weight(folder):
+            sync_time = self.crawl_statistics.weight(folder) if self.crawl_statistics else 0
+            return sync_time, folder_sizes.get(folder, 0)
 
-        return storage_with_collection
+        return sorted(folders, key=weight, reverse=True)
 
     def connect_and_get_all_folders(self):
         """Connects to the Network drive and returns the list of all the folders present on the Network drive"""
@@ -64,36 +184,270 @@ class SyncNetworkDrives:
             store=[],
         )
         smb_connection.close()
+        self.record_listing((), files.listing_errors)
         return store
 
+    def record_listing(self, listed_ids, listing_errors):
+        """Records the IDs of the files listed by a fetching thread and the folders it could not list
+        :param listed_ids: IDs of the files present in the listed folders
+        :param listing_errors: list of the folder paths that could not be listed
+        """
+        with self.listing_lock:
+            self.listed_ids.update(listed_ids)
+            self.listing_errors.extend(listing_errors)
+
     def perform_sync(self, drive, partition_paths):
         """This method fetches all the objects from Network Drives server and
         appends them to the shared queue
         :param drive: The Network Drive name
-        :param indexing_rules: Object of the indexing rules
+        :param partition_paths: list of folder paths to fetch
         Returns:
             storage: dictionary containing the ids and path of all the files in Network Drives
         """
         if not partition_paths:
             return {}
 
-        files = Files(self.logger, self.config, self.network_drive_client)
-        documents_to_index = []
         self.logger.info(f"Thread: [{threading.get_ident()}] fetching all the files for folder {partition_paths}")
         ids_storage = {}
+        # Only the stored files of the fetched folders are sent to the worker processes
+        stored_files = self.get_stored_files(partition_paths)
+
+        def flush(documents):
+            # Documents handed to the indexing threads before the folders are completely fetched
+            if self.sync_progress:
+                self.sync_progress.register(partition_paths, documents, fetched=False)
+            self.queue_documents(documents, ids_storage)
+
         try:
-            fetched_documents = files.fetch_files(
-                self.drive_path.parts[0],
-                partition_paths,
-                self.time_range,
-                self.indexing_rules,
-            )
-            self.queue.append_to_queue(fetched_documents)
-            documents_to_index.extend(fetched_documents)
+            if self.process_pool:
+                fetched_documents, folder_statistics, listing, worker_metrics = self.process_pool.fetch(
+                    flush,
+                    self.logger,
+                    self.config,
+                    self.network_drive_client,
+                    self.drive_path.parts[0],
+                    partition_paths,
+                    self.time_range,
+                    self.indexing_rules,
+                    stored_files,
+                )
+                METRICS.merge(worker_metrics)
+                self.record_listing(*listing)
+                listing_errors = listing[1]
+            else:
+                files = Files(self.logger, self.config, self.network_drive_client, self.content_cache)
+                try:
+                    fetched_documents = files.fetch_files(
+                        self.drive_path.parts[0],
+                        partition_paths,
+                        self.time_range,
+                        self.indexing_rules,
+                        self.connections.get(self.network_drive_client),
+                        self.budget,
+                        flush,
+                        stored_files,
+                        self.get_prefetch_connection(),
+                    )
+                except Exception:
+                    self.connections.discard(self.network_drive_client)
+                    raise
+                finally:
+                    if files.prefetch_failed:
+                        self.prefetch_connections.discard(self.network_drive_client)
+                folder_statistics = files.folder_statistics
+                self.record_listing(files.listed_ids, files.listing_errors)
+                listing_errors = files.listing_errors
+            if self.crawl_statistics:
+                for folder_path, statistics in folder_statistics.items():
+                    self.crawl_statistics.record(folder_path, statistics)
+            if self.sync_progress:
+                # The folders that could not be listed are not completed, a resumed full sync fetches them again
+                self.sync_progress.register(partition_paths, fetched_documents, failed_folders=listing_errors)
+            self.queue_documents(fetched_documents, ids_storage)
         except Exception as exception:
             self.logger.error(f"Error while fetching files for the path: {partition_paths}. Error: {exception}")
-
-        for doc in documents_to_index:
-            ids_storage.update({doc["id"]: doc["path"]})
+            self.record_listing((), partition_paths)
 
         return ids_storage
+
+    def get_prefetch_connection(self):
+        """Returns the prefetching connection of the current thread, None if the files are not prefetched or the
+        connection cannot be opened, in which case the thread downloads its files itself"""
+        if not self.prefetch_connections:
+            return None
+        try:
+            return self.prefetch_connections.get(self.network_drive_client)
+        except Exception as exception:
+            self.logger.warning(f"Could not open the connection prefetching the files. Error: {exception}")
+            return None
+
+    def queue_documents(self, documents, ids_storage):
+        """Appends the documents to the shared queue and records their ids and the states of their files
+        :param documents: list of documents fetched from the Network Drives
+        :param ids_storage: dictionary of the ids and paths of the documents queued by the current job
+        """
+        METRICS.increment(DOCUMENTS_FETCHED, len(documents))
+        # The documents of the files whose content did not change only have their permissions updated
+        permission_updates = [doc for doc in documents if isinstance(doc, Document) and doc.permissions_only]
+        if permission_updates:
+            self.queue.append_permission_updates(permission_updates)
+            self.queue.append_to_queue(
+                [doc for doc in documents if not (isinstance(doc, Document) and doc.permissions_only)]
+            )
+        else:
+            self.queue.append_to_queue(documents)
+        for doc in documents:
+            ids_storage[doc["id"]] = doc["path"]
+        states = {doc.id: doc.state() for doc in documents if isinstance(doc, Document)}
+        with self.file_states_lock:
+            self.file_states.update(states)
+
+
+def count_active_connections():
+    """Returns the number of SMB connections open by the fetching threads of all the drives synced by the run"""
+    with ACTIVE_SYNCS_LOCK:
+        syncs = list(ACTIVE_SYNCS)
+    return sum(sync.active_connection_count() for sync in syncs)
+
+
+class WorkerPool:
+    """This class holds the worker processes fetching the files when the process executor is configured. A worker
+    process sends the documents it fetches back to the connector process in batches of BATCH_SIZE documents while it
+    fetches the next files, so that the documents of a large folder are indexed without waiting for the whole folder
+    """
+
+    def __init__(self, config, logger):
+        """
+        :param config: configuration object
+        :param logger: logger object, configured in the worker processes
+        """
+        self.batches = multiprocessing.Queue()
+        self.executor = ProcessPoolExecutor(
+            max_workers=config.get_value("network_drives_sync_thread_count"),
+            initializer=initialize_worker,
+            initargs=(logger.name, logger.level, self.batches),
+        )
+        # Batches of the jobs in progress, by id of the job
+        self.jobs = {}
+        self.job_ids = count()
+        self.lock = threading.Lock()
+        self.dispatcher = threading.Thread(target=self.dispatch_batches, daemon=True)
+        self.dispatcher.start()
+
+    def dispatch_batches(self):
+        """Hands the batches of documents sent by the worker processes to the threads waiting for their jobs"""
+        while True:
+            batch = self.batches.get()
+            if batch is None:
+                return
+            job_id, documents = batch
+            with self.lock:
+                job_batches = self.jobs.get(job_id)
+            if job_batches is not None:
+                job_batches.put(documents)
+
+    def fetch(self, flush, *arguments):
+        """Fetches a group of folders in a worker process, handing the batches of documents sent by the worker to
+        flush until the folders are fetched
+        :param flush: function appending a batch of documents to the shared queue
+        :param arguments: arguments of fetch_files_in_process following the id of the job
+        Returns:
+            result: tuple returned by fetch_files_in_process
+        """
+        job_batches = Queue()
+        with self.lock:
+            job_id = next(self.job_ids)
+            self.jobs[job_id] = job_batches
+        try:
+            future = self.executor.submit(fetch_files_in_process, job_id, *arguments)
+            while True:
+                try:
+                    documents = job_batches.get(timeout=WORKER_POLL_INTERVAL)
+                except Empty:
+                    # A worker process that died could not send the end of its batches
+                    if future.done() and future.exception() is not None:
+                        break
+                    continue
+                if documents is None:
+                    break
+                flush(documents)
+            return future.result()
+        finally:
+            with self.lock:
+                self.jobs.pop(job_id, None)
+
+    def shutdown(self):
+        """Waits for the worker processes to exit and stops dispatching their batches"""
+        self.executor.shutdown()
+        self.batches.put(None)
+        self.dispatcher.join()
+
+
+def create_process_pool(config, logger):
+    """Returns the pool of worker processes fetching the files when the process executor is configured, None
+    otherwise. Each worker process opens its own SMB connections, so the SMB message packing and NTLM computations
+    do not compete for the GIL of the process indexing the documents
+    :param config: configuration object
+    :param logger: logger object, configured in the worker processes
+    """
+    if config.get_value("network_drives_sync_executor") != "process":
+        return None
+    return WorkerPool(config, logger)
+
+
+def initialize_worker(name, level, batches):
+    """Configures the logger of a worker process started by the process pool and keeps the queue on which it sends
+    the fetched documents
+    :param name: name of the logger used by the connector
+    :param level: log level of the logger used by the connector
+    :param batches: queue on which the batches of fetched documents are sent to the connector process
+    """
+    global WORKER_BATCHES
+    WORKER_BATCHES = batches
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setLevel(level)
+        logger.addHandler(handler)
+
+
+def fetch_files_in_process(job_id, logger, config, network_drive_client, service_name, partition_paths, time_range,
+                           indexing_rules, stored_files=None):
+    """Fetches the documents of the given folders in a worker process. The documents are sent to the parent
+    process in batches while the folders are fetched, and the last documents are returned along with the
+    statistics of the folders, the IDs of the listed files and the timings recorded by the worker
+    :param job_id: id of the job, which the parent process uses to hand the batches to the waiting thread
+    :param logger: logger object
+    :param config: configuration object
+    :param network_drive_client: Network Drives client used to open the SMB connections of the worker
+    :param service_name: name of the drive
+    :param partition_paths: list of folder paths inside the network drives
+    :param time_range: Start and End Time in seconds since the epoch
+    :param indexing_rules: object of indexing_rules
+    :param stored_files: dictionary of the paths and states recorded in the local storage for the files of the
+        folders, None if the unchanged files are not skipped
+    """
+    # The worker processes keep their own content cache, which is not saved
+    WORKER_CONTENT_CACHE.limit = config.get_value("content_cache_max_bytes") or 0
+    files = Files(logger, config, network_drive_client, WORKER_CONTENT_CACHE if WORKER_CONTENT_CACHE.limit else None)
+    prefetch_connection = None
+    if files.prefetch_file_count:
+        try:
+            prefetch_connection = WORKER_PREFETCH_CONNECTIONS.get(network_drive_client)
+        except Exception as exception:
+            logger.warning(f"Could not open the connection prefetching the files. Error: {exception}")
+    try:
+        documents = files.fetch_files(
+            service_name, partition_paths, time_range, indexing_rules, WORKER_CONNECTIONS.get(network_drive_client),
+            flush=lambda batch: WORKER_BATCHES.put((job_id, batch)), stored_files=stored_files,
+            prefetch_connection=prefetch_connection, batch_size=BATCH_SIZE,
+        )
+    except Exception:
+        WORKER_CONNECTIONS.discard(network_drive_client)
+        raise
+    finally:
+        if files.prefetch_failed:
+            WORKER_PREFETCH_CONNECTIONS.discard(network_drive_client)
+        WORKER_BATCHES.put((job_id, None))
+    return documents, files.folder_statistics, (files.listed_ids, files.listing_errors), METRICS.drain()
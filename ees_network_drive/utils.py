@@ -5,17 +5,26 @@
 #
 """This module contains un-categorized utility methods.
 """
+import calendar
 import csv
 import hashlib
+import json
 import os
+import stat
+import tempfile
 import time
 import urllib.parse
+from contextlib import contextmanager
 from datetime import datetime
 
 from tika import parser
 
 from .constant import RFC_3339_DATETIME_FORMAT
 
+# The umask of the process, read once at import time as reading it requires changing it
+UMASK = os.umask(0)
+os.umask(UMASK)
+
 
 def extract(content):
     """Extracts the contents
@@ -46,7 +55,7 @@ def hash_id(file_name, file_path):
     :param file_path: path of the file in the Network Drives
     :Returns: hashed file id
     """
-    return hashlib.sha256(file_name + "-" + file_path).hexdigest()
+    return hashlib.sha256(f"{file_name}-{file_path}".encode("utf-8")).hexdigest()
 
 
 def retry(exception_list):
@@ -152,3 +161,49 @@ def group_files_by_folder_path(file_details):
 def get_current_time():
     """Returns current time in rfc 3339 format"""
     return (datetime.utcnow()).strftime(RFC_3339_DATETIME_FORMAT)
+
+
+def rfc_3339_to_epoch(value):
+    """Converts a time in rfc 3339 format to seconds since the epoch
+    :param value: time in rfc 3339 format
+    Returns:
+        epoch: number of seconds since the epoch in UTC
+    """
+    return calendar.timegm(datetime.strptime(value, RFC_3339_DATETIME_FORMAT).timetuple())
+
+
+@contextmanager
+def atomic_write(path):
+    """Opens a temporary file to be written in place of the given file. When the block completes,
+    the temporary file is flushed to the disk and renamed to the given path, so the file always
+    contains either its previous or its new contents, even if the connector is stopped while writing.
+    The file keeps the permissions of the replaced file, or gets the permissions allowed by the umask
+    if it is new
+    :param path: path of the file to be written
+    """
+    directory, file_name = os.path.split(os.path.abspath(path))
+    file_descriptor, temporary_path = tempfile.mkstemp(prefix=f".{file_name}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(file_descriptor, "w", encoding="utf-8") as temporary_file:
+            yield temporary_file
+            temporary_file.flush()
+            os.fsync(temporary_file.fileno())
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = 0o666 & ~UMASK
+        os.chmod(temporary_path, mode)
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+
+def write_json_atomically(path, data):
+    """Writes the data to a json file atomically
+    :param path: path of the json file
+    :param data: json serializable data to be written
+    """
+    with atomic_write(path) as json_file:
+        json.dump(data, json_file, separators=(",", ":"))
@@ -0,0 +1,61 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import os
+import sys
+import threading
+import time
+from unittest.mock import Mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from ees_network_drive.byte_budget import ByteBudget  # noqa
+
+
+def wait_for_waiter(budget):
+    """Waits until a thread waits for the budget"""
+    deadline = time.monotonic() + 5
+    while not budget.has_waiters():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_acquire_waits_until_release():
+    """Test that a reservation exceeding the budget waits for other documents to be released"""
+    budget = ByteBudget(100)
+    budget.acquire("1", 70)
+    on_wait = Mock()
+    waiter = threading.Thread(target=budget.acquire, args=("2", 50, on_wait))
+    waiter.start()
+    wait_for_waiter(budget)
+    on_wait.assert_called_once_with()
+    budget.release(["1"])
+    waiter.join(5)
+    assert not waiter.is_alive()
+    assert budget.used == 50
+    assert budget.reservations == {"2": 50}
+
+
+def test_oversized_document_is_reserved_when_budget_is_empty():
+    """Test that a document larger than the whole budget does not block the sync forever"""
+    budget = ByteBudget(100)
+    on_wait = Mock()
+    budget.acquire("1", 1000, on_wait)
+    on_wait.assert_not_called()
+    assert budget.used == 100
+    budget.release(["1", "unknown"])
+    assert budget.used == 0
+
+
+def test_close_releases_waiters():
+    """Test that the waiting threads are released when the budget is closed"""
+    budget = ByteBudget(10)
+    budget.acquire("1", 10)
+    waiter = threading.Thread(target=budget.acquire, args=("2", 10))
+    waiter.start()
+    wait_for_waiter(budget)
+    budget.close()
+    waiter.join(5)
+    assert not waiter.is_alive()
@@ -9,21 +9,16 @@ import datetime
 import os
 import logging
 import sys
+import threading
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from ees_network_drive.checkpointing import Checkpoint # noqa
+from ees_network_drive import checkpointing # noqa
+from ees_network_drive.checkpointing import Checkpoint, SyncProgress # noqa
 from ees_network_drive.constant import RFC_3339_DATETIME_FORMAT # noqa
 from ees_network_drive.configuration import Configuration # noqa
 
 
-CHECKPOINT_PATH = os.path.join(
-    os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
-    "ees_network_drive",
-    "checkpoint.json",
-)
-
-
 def settings():
     """This function loads config from the file and returns it."""
     configuration = Configuration(
@@ -37,21 +32,22 @@ def settings():
     return configuration, logger
 
 
-def test_set_checkpoint_when_checkpoint_file_available():
+def test_set_checkpoint_when_checkpoint_file_available(tmp_path):
     """Test that set_checkpoint method set current time in checkpoint.json file \
         when checkpoint.json file is available."""
     configs, logger = settings()
-    checkpoint_obj = Checkpoint(configs, logger)
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    checkpoint_obj = Checkpoint(configs, logger, checkpoint_path)
     json_object = {
         "CLIENT": (datetime.datetime.utcnow() - datetime.timedelta(days=3)).strftime(
             RFC_3339_DATETIME_FORMAT
         )
     }
-    with open(CHECKPOINT_PATH, "w") as outfile:
+    with open(checkpoint_path, "w") as outfile:
         json.dump(json_object, outfile, indent=4)
     current_time = (datetime.datetime.utcnow()).strftime(RFC_3339_DATETIME_FORMAT)
     checkpoint_obj.set_checkpoint(current_time, "incremental", "CLIENT")
-    with open(CHECKPOINT_PATH, encoding="UTF-8") as checkpoint_store:
+    with open(checkpoint_path, encoding="UTF-8") as checkpoint_store:
         checkpoint_list = json.load(checkpoint_store)
     assert checkpoint_list["CLIENT"] == current_time
 
@@ -74,34 +70,116 @@ def test_set_checkpoint_when_checkpoint_file_available():
     ],
 )
 def test_set_checkpoint_when_checkpoint_file_not_available(
-    index_type, expected_time, current_time, drive_name
+    index_type, expected_time, current_time, drive_name, tmp_path
 ):
     """Test that set_checkpoint method set correct time in checkpoint.json file \
         when checkpoint.json file is not available."""
     configs, logger = settings()
-    checkpoint_obj = Checkpoint(configs, logger)
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    checkpoint_obj = Checkpoint(configs, logger, checkpoint_path)
     checkpoint_obj.config._Configuration__configurations["end_time"] = expected_time
-    if os.path.exists(CHECKPOINT_PATH):
-        os.remove(CHECKPOINT_PATH)
 
     checkpoint_obj.set_checkpoint(current_time, index_type, drive_name)
-    with open(CHECKPOINT_PATH, encoding="UTF-8") as checkpoint_store:
+    with open(checkpoint_path, encoding="UTF-8") as checkpoint_store:
         checkpoint_list = json.load(checkpoint_store)
     assert checkpoint_list[drive_name] == expected_time
 
 
-def test_get_checkpoint_when_checkpoint_file_available():
+def test_get_checkpoint_when_checkpoint_file_available(tmp_path):
     """Test that get_checkpoint method set current time in checkpoint.json file \
         when checkpoint.json file is available."""
     configs, logger = settings()
-    checkpoint_obj = Checkpoint(configs, logger)
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    checkpoint_obj = Checkpoint(configs, logger, checkpoint_path)
     checkpoint_time = (
         datetime.datetime.utcnow() - datetime.timedelta(days=3)
     ).strftime(RFC_3339_DATETIME_FORMAT)
     json_object = {"CLIENT": checkpoint_time}
-    with open(CHECKPOINT_PATH, "w") as outfile:
+    with open(checkpoint_path, "w") as outfile:
         json.dump(json_object, outfile, indent=4)
     current_time = (datetime.datetime.utcnow()).strftime(RFC_3339_DATETIME_FORMAT)
     start_time, end_time = checkpoint_obj.get_checkpoint(current_time, "CLIENT")
     assert start_time == checkpoint_time
     assert end_time == current_time
+
+
+def test_sync_progress_completes_folder_once_all_documents_are_acknowledged(tmp_path):
+    """Test that a folder is completed only when all its documents are indexed, and that the progress \
+        of the interrupted full sync can be resumed."""
+    _, logger = settings()
+    progress_path = str(tmp_path / "full_sync_progress.json")
+    sync_progress = SyncProgress(logger, progress_path, flush_interval=0)
+    sync_progress.start("2022-03-25T15:14:28Z")
+    sync_progress.register(["dummy/empty"], [])
+    sync_progress.register(["dummy/folder1"], [
+        {"id": "1", "path": "dummy/folder1/file1.txt"},
+        {"id": "2", "path": "dummy/folder1/file2.txt"},
+    ])
+    sync_progress.acknowledge(["1"])
+    assert "dummy/folder1" not in sync_progress.completed_folders
+
+    resumed_progress = SyncProgress(logger, progress_path)
+    assert resumed_progress.resume()
+    assert resumed_progress.started_at == "2022-03-25T15:14:28Z"
+    assert list(resumed_progress.completed_folders) == ["dummy/empty"]
+
+    sync_progress.acknowledge(["2"])
+    resumed_progress = SyncProgress(logger, progress_path)
+    resumed_progress.resume()
+    assert resumed_progress.completed_ids() == {"1": "dummy/folder1/file1.txt", "2": "dummy/folder1/file2.txt"}
+
+    sync_progress.clear()
+    assert not SyncProgress(logger, progress_path).resume()
+
+
+def test_sync_progress_flushes_periodically(tmp_path):
+    """Test that the progress file is not rewritten before the flush interval has elapsed."""
+    _, logger = settings()
+    progress_path = str(tmp_path / "full_sync_progress.json")
+    sync_progress = SyncProgress(logger, progress_path, flush_interval=3600)
+    sync_progress.start("2022-03-25T15:14:28Z")
+    sync_progress.register(["dummy/empty"], [])
+    with open(progress_path, encoding="UTF-8") as progress_file:
+        assert json.load(progress_file)["folders"] == {}
+    sync_progress.flush(force=True)
+    with open(progress_path, encoding="UTF-8") as progress_file:
+        assert json.load(progress_file)["folders"] == {"dummy/empty": {}}
+
+
+def test_sync_progress_registers_documents_in_several_calls(tmp_path):
+    """Test that a folder whose documents are handed over in several batches is completed only once \
+        it is completely fetched and all its documents are acknowledged."""
+    _, logger = settings()
+    sync_progress = SyncProgress(logger, str(tmp_path / "full_sync_progress.json"), flush_interval=0)
+    sync_progress.start("2022-03-25T15:14:28Z")
+    sync_progress.register(["dummy/folder1"], [{"id": "1", "path": "dummy/folder1/file1.txt"}], fetched=False)
+    sync_progress.acknowledge(["1"])
+    assert "dummy/folder1" not in sync_progress.completed_folders
+    sync_progress.register(["dummy/folder1"], [{"id": "2", "path": "dummy/folder1/file2.txt"}])
+    sync_progress.acknowledge(["2"])
+    assert sync_progress.completed_ids() == {"1": "dummy/folder1/file1.txt", "2": "dummy/folder1/file2.txt"}
+
+
+def test_sync_progress_is_not_locked_while_the_progress_file_is_written(tmp_path, monkeypatch):
+    """Test that the documents can be registered and acknowledged while another thread writes the progress file."""
+    _, logger = settings()
+    sync_progress = SyncProgress(logger, str(tmp_path / "full_sync_progress.json"), flush_interval=0)
+    sync_progress.start("2022-03-25T15:14:28Z")
+    writing, release = threading.Event(), threading.Event()
+    written = []
+
+    def write_json_atomically(path, data):
+        writing.set()
+        release.wait(10)
+        written.append(data)
+
+    monkeypatch.setattr(checkpointing, "write_json_atomically", write_json_atomically)
+    flushing_thread = threading.Thread(target=sync_progress.flush, kwargs={"force": True})
+    flushing_thread.start()
+    assert writing.wait(10)
+    sync_progress.register(["dummy/folder1"], [{"id": "1", "path": "dummy/folder1/file1.txt"}])
+    sync_progress.acknowledge(["1"])
+    assert "dummy/folder1" in sync_progress.completed_folders
+    release.set()
+    flushing_thread.join()
+    assert written == [{"started_at": "2022-03-25T15:14:28Z", "folders": {}}]
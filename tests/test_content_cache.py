@@ -0,0 +1,75 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import hashlib
+import io
+import logging
+import os
+import sys
+from unittest.mock import Mock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from ees_network_drive import files  # noqa
+from ees_network_drive.content_cache import ContentCache, HashingWriter  # noqa
+from ees_network_drive.files import Files  # noqa
+from ees_network_drive.metrics import CONTENT_CACHE_HITS, CONTENT_CACHE_MISSES, METRICS  # noqa
+
+logger = logging.getLogger("unit_test_content_cache")
+
+
+def test_hashing_writer():
+    """Test that the contents are hashed while they are written"""
+    file_obj = io.BytesIO()
+    writer = HashingWriter(file_obj)
+    writer.write(b"some ")
+    writer.write(b"text")
+    assert file_obj.getvalue() == b"some text"
+    assert writer.tell() == 9
+    assert writer.hexdigest() == hashlib.sha256(b"some text").hexdigest()
+
+
+def test_content_cache_evicts_least_recently_used_texts():
+    """Test that the least recently used texts are evicted once the cache is full"""
+    content_cache = ContentCache(10)
+    content_cache.put("a", "1234")
+    content_cache.put("b", "5678")
+    assert content_cache.get("a") == "1234"
+    content_cache.put("c", "90")
+    content_cache.put("d", "ab")
+    assert content_cache.get("b") is None
+    assert [content_cache.get(key) for key in ["a", "c", "d"]] == ["1234", "90", "ab"]
+    content_cache.put("e", "too large text")
+    assert content_cache.get("e") is None
+    assert content_cache.size == 8
+
+
+def test_content_cache_save_and_load(tmp_path):
+    """Test that the saved texts are loaded by the next sync"""
+    cache_path = str(tmp_path / "content_cache.jsonl")
+    content_cache = ContentCache(100)
+    content_cache.put(ContentCache.key("tika", "digest"), "some text")
+    content_cache.save(cache_path, logger)
+    loaded_cache = ContentCache(100)
+    loaded_cache.load(cache_path, logger)
+    assert loaded_cache.get(ContentCache.key("tika", "digest")) == "some text"
+
+
+def test_fetch_file_content_extracts_copies_once():
+    """Test that the text of identical contents is extracted once, whatever the names of the copies, unless they
+    are sent to another extractor"""
+    files_obj = Files(logger, Mock(get_value=Mock(return_value=None)), Mock(), ContentCache(100))
+    smb_connection = Mock()
+    smb_connection.retrieveFile = Mock(side_effect=lambda service_name, path, file_obj: file_obj.write(b"same"))
+    METRICS.drain()
+    with patch.object(files, "extract_content", return_value="same") as extract_content:
+        for file_name in ["file1.txt", "copy of file1.md", "README", "file1.pdf"]:
+            assert files_obj.fetch_file_content("Users", {"file_name": file_name, "file_path": file_name},
+                                                smb_connection) == "same"
+    # The plain text copies are extracted once, the pdf file is sent to Tika
+    assert extract_content.call_count == 2
+    counters = METRICS.drain()["counters"]
+    assert counters[CONTENT_CACHE_HITS] == 2
+    assert counters[CONTENT_CACHE_MISSES] == 2
@@ -0,0 +1,103 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import argparse
+import logging
+import os
+import sys
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from ees_network_drive import stats_command  # noqa
+from ees_network_drive.crawl_statistics import CrawlStatistics  # noqa
+from ees_network_drive.sharding import Shard, shard_file_path  # noqa
+from ees_network_drive.stats_command import StatsCommand  # noqa
+
+CONFIG_FILE = os.path.join(
+    os.path.join(os.path.dirname(__file__), "config"),
+    "network_drive_connector.yml",
+)
+
+
+def create_statistics(tmp_path):
+    """This function creates crawl statistics stored in a temporary file."""
+    logger = logging.getLogger("unit_test_crawl_statistics")
+    return CrawlStatistics(logger, str(tmp_path / "crawl_stats.json"))
+
+
+def test_record_save_and_load(tmp_path):
+    """Test that the statistics recorded by a sync are loaded by the next one"""
+    crawl_statistics = create_statistics(tmp_path)
+    crawl_statistics.record(
+        "dummy/folder1", {"file_count": 3, "total_bytes": 60, "listing_seconds": 0.5, "extraction_seconds": 2}
+    )
+    crawl_statistics.save()
+    folders = create_statistics(tmp_path).load()
+    assert folders["dummy/folder1"]["file_count"] == 3
+    assert "updated_at" in folders["dummy/folder1"]
+    assert crawl_statistics.weight("dummy/folder1") == 2.5
+    assert crawl_statistics.weight("dummy/unknown") == 0
+
+
+def test_suggest_thread_count(tmp_path):
+    """Test that suggest_thread_count does not start more threads than the slowest folder allows"""
+    crawl_statistics = create_statistics(tmp_path)
+    for folder, seconds in [("a", 10), ("b", 4), ("c", 3)]:
+        crawl_statistics.record(folder, {"listing_seconds": 0, "extraction_seconds": seconds})
+    assert crawl_statistics.suggest_thread_count(["a", "b", "c"], 5) == 2
+    assert crawl_statistics.suggest_thread_count(["a", "b", "c", "new"], 5) == 5
+    assert crawl_statistics.suggest_thread_count([], 5) == 5
+
+
+def test_incremental_sync_does_not_shrink_the_thread_pool_of_full_syncs(tmp_path):
+    """Test that the timings of an incremental sync, which only fetches the changed files, are not recorded"""
+    logger = logging.getLogger("unit_test_crawl_statistics")
+    full_sync_statistics = create_statistics(tmp_path)
+    for folder in ["a", "b", "c", "d"]:
+        full_sync_statistics.record(folder, {"listing_seconds": 0, "extraction_seconds": 10})
+    full_sync_statistics.save()
+
+    incremental_sync_statistics = CrawlStatistics(logger, str(tmp_path / "crawl_stats.json"), read_only=True)
+    incremental_sync_statistics.load()
+    assert incremental_sync_statistics.suggest_thread_count(["a", "b", "c", "d"], 5) == 4
+    incremental_sync_statistics.record("a", {"listing_seconds": 0, "extraction_seconds": 10})
+    for folder in ["b", "c", "d"]:
+        incremental_sync_statistics.record(folder, {"listing_seconds": 0, "extraction_seconds": 0.1})
+    incremental_sync_statistics.save()
+
+    next_full_sync_statistics = create_statistics(tmp_path)
+    next_full_sync_statistics.load()
+    assert next_full_sync_statistics.suggest_thread_count(["a", "b", "c", "d"], 5) == 4
+
+
+def test_stats_command(tmp_path, capsys):
+    """Test that the stats command prints the slowest folders first"""
+    crawl_statistics = create_statistics(tmp_path)
+    crawl_statistics.record("dummy/fast", {"file_count": 1, "listing_seconds": 0.1, "extraction_seconds": 0.1})
+    crawl_statistics.record("dummy/slow", {"file_count": 9, "listing_seconds": 1, "extraction_seconds": 30})
+    crawl_statistics.save()
+    args = argparse.Namespace(config_file=CONFIG_FILE, top=20)
+    with patch.object(stats_command, "CrawlStatistics", lambda logger, stats_path: create_statistics(tmp_path)):
+        StatsCommand(args).execute()
+    output = capsys.readouterr().out
+    assert output.index("dummy/slow") < output.index("dummy/fast")
+    assert "Total: 2 folders, 10 files" in output
+
+
+def test_stats_command_prints_the_statistics_of_each_shard(tmp_path, capsys, monkeypatch):
+    """Test that the stats command prints the statistics recorded by each shard of a sharded full sync"""
+    stats_path = str(tmp_path / "crawl_stats.json")
+    monkeypatch.setattr(stats_command, "STATS_PATH", stats_path)
+    logger = logging.getLogger("unit_test_crawl_statistics")
+    for index in range(2):
+        crawl_statistics = CrawlStatistics(logger, shard_file_path(stats_path, Shard(index, 2)))
+        crawl_statistics.record(f"dummy/shard{index}", {"file_count": 1, "extraction_seconds": 1})
+        crawl_statistics.save()
+    args = argparse.Namespace(config_file=CONFIG_FILE, top=20, shards=2)
+    StatsCommand(args).execute()
+    output = capsys.readouterr().out
+    assert output.index("Shard: 0/2") < output.index("dummy/shard0") < output.index("Shard: 1/2")
+    assert output.index("Shard: 1/2") < output.index("dummy/shard1")
@@ -0,0 +1,72 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import os
+import pickle
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from ees_network_drive.document import Document, to_json  # noqa
+
+FILE_DETAILS = {
+    "updated_at": "2021-12-30T15:14:28Z",
+    "file_type": ".txt",
+    "file_size": 30,
+    "created_at": "1975-03-15T03:55:26Z",
+    "file_name": "file1.txt",
+    "file_path": "dummy/folder1/file1.txt",
+    "web_path": "file://1.2.3.4/Users/dummy/folder1/file1.txt",
+}
+
+
+def test_to_dict():
+    """Test that a document is converted to the json document of Enterprise Search"""
+    document = Document.from_file_details(1, FILE_DETAILS, "file://1.2.3.4/Users/")
+    document.body = "some text"
+    assert document.to_dict() == {
+        "id": "1",
+        "body": "some text",
+        "last_updated": "2021-12-30T15:14:28Z",
+        "type": ".txt",
+        "size": 30,
+        "created_at": "1975-03-15T03:55:26Z",
+        "title": "file1.txt",
+        "path": "dummy/folder1/file1.txt",
+        "url": "file://1.2.3.4/Users/dummy/folder1/file1.txt",
+    }
+    document.set_permissions({"allow": ["sid1"], "deny": ["sid2"]}, "hash")
+    assert document.to_dict()["_allow_permissions"] == ["sid1"]
+    assert "permission_hash" not in document.to_dict()
+    assert document.to_permission_update() == {"id": "1", "_allow_permissions": ["sid1"], "_deny_permissions": ["sid2"]}
+
+
+def test_fields_are_read_like_the_json_document():
+    """Test that the fields of a document are read with the names of the json document"""
+    document = Document.from_file_details(1, FILE_DETAILS, "file://1.2.3.4/Users/")
+    assert document["id"] == "1"
+    assert document["title"] == "file1.txt"
+    assert document.get("size") == 30
+    assert document.get("permission_hash") is None
+    assert document.get("_allow_permissions", []) == []
+    with pytest.raises(KeyError):
+        document["_deny_permissions"]
+
+
+def test_documents_are_sent_to_worker_processes():
+    """Test that a document can be pickled, as the worker processes return documents to the parent process"""
+    document = Document.from_file_details(1, FILE_DETAILS, "file://1.2.3.4/Users/")
+    document.body = "some text"
+    assert pickle.loads(pickle.dumps(document)).to_dict() == document.to_dict()
+    # The names of the attributes are not pickled with each document
+    assert isinstance(document.__getstate__(), tuple)
+
+
+def test_to_json():
+    """Test that the documents that are already dictionaries are indexed as they are"""
+    assert to_json({"id": "1"}) == {"id": "1"}
+    assert to_json(Document.from_file_details(1, FILE_DETAILS, "file://1.2.3.4/Users/"))["id"] == "1"
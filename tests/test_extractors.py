@@ -0,0 +1,50 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import os
+import sys
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from ees_network_drive import extractors  # noqa
+from ees_network_drive.metrics import METRICS  # noqa
+
+
+def test_select_extractor():
+    """Test that plain text files are decoded in process and the other files are sent to Tika"""
+    assert extractors.select_extractor("notes.txt", b"some text") == extractors.PLAIN_TEXT
+    assert extractors.select_extractor("setup.PY", b"import os") == extractors.PLAIN_TEXT
+    assert extractors.select_extractor("report.pdf", b"%PDF-1.4") == extractors.TIKA
+    assert extractors.select_extractor("README", b"some text") == extractors.PLAIN_TEXT
+    assert extractors.select_extractor("program", b"\x7fELF\x00\x00") == extractors.TIKA
+
+
+def test_select_extractor_sends_large_files_to_tika():
+    """Test that plain text files larger than the limit are sent to Tika"""
+    with patch.object(extractors, "PLAIN_TEXT_SIZE_LIMIT", 4):
+        assert extractors.select_extractor("notes.txt", b"some text") == extractors.TIKA
+
+
+def test_decode_plain_text():
+    """Test that plain text is decoded with its encoding"""
+    assert extractors.decode_plain_text("déjà vu".encode("utf-8")) == "déjà vu"
+    assert extractors.decode_plain_text("déjà vu".encode("utf-8-sig")) == "déjà vu"
+    assert extractors.decode_plain_text("déjà vu".encode("utf-16")) == "déjà vu"
+    assert extractors.decode_plain_text(b"binary\x00content") is None
+
+
+def test_extract_content_records_the_extractor():
+    """Test that the time spent by each extractor is recorded, and that binary content is sent to Tika"""
+    METRICS.drain()
+    with patch.object(extractors, "extract", return_value="parsed text") as tika:
+        assert extractors.extract_content("notes.txt", b"some text") == "some text"
+        tika.assert_not_called()
+        assert extractors.extract_content("notes.txt", b"\x00\x01") == "parsed text"
+        assert extractors.extract_content("report.pdf", b"%PDF-1.4") == "parsed text"
+    stages = METRICS.summary()
+    assert stages["extraction_plain_text"]["count"] == 2
+    assert stages["extraction_tika"]["count"] == 2
+    METRICS.drain()
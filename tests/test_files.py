@@ -3,13 +3,17 @@ import logging
 import sys
 import os
 
+import pytest
+
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 
+from ees_network_drive.byte_budget import ByteBudget  # noqa
 from ees_network_drive.configuration import Configuration  # noqa
 from ees_network_drive.indexing_rule import IndexingRules  # noqa
 from ees_network_drive.files import Files, STATUS_NO_SUCH_FILE  # noqa
 from ees_network_drive.network_drive_client import NetworkDrive  # noqa
+from ees_network_drive.utils import rfc_3339_to_epoch  # noqa
 
 
 CONFIG_FILE = os.path.join(
@@ -125,8 +129,8 @@ def test_extract_files():
     network_drive_client = NetworkDrive(config, logger)
     files_obj = Files(logger, config, network_drive_client)
     time_range = {
-        "start_time": "2021-12-28T15:14:28Z",
-        "end_time": "2022-03-25T15:14:28Z",
+        "start_time": rfc_3339_to_epoch("2021-12-28T15:14:28Z"),
+        "end_time": rfc_3339_to_epoch("2022-03-25T15:14:28Z"),
     }
     indexing_rule_obj = IndexingRules(config)
     indexing_rule_obj.should_index = Mock(return_value=True)
@@ -137,6 +141,7 @@ def test_extract_files():
             "file_size": 30,
             "created_at": "1975-03-15T03:55:26Z",
             "file_name": "file1.txt",
+            "last_write_time": 1640877268,
             "file_path": rf'{os.path.join("dummy", os.path.join("folder1", "file1.txt"))}',
             "web_path": rf'{os.path.join("file://1.2.3.4/Users/dummy", os.path.join("folder1", "file1.txt"))}'
         }
@@ -145,6 +150,7 @@ def test_extract_files():
         isDirectory=False,
         filename="file1.txt",
         last_attr_change_time=1640877268,
+        last_write_time=1640877268,
         create_time=164087726,
         file_size=30,
         file_id=1,
@@ -161,6 +167,41 @@ def test_extract_files():
     assert response == expected_response
 
 
+def test_extract_files_filters_listing_before_applying_rules():
+    """Test that extract_files skips folders and files outside the time range without evaluating indexing rules"""
+    config, logger = settings()
+    network_drive_client = NetworkDrive(config, logger)
+    files_obj = Files(logger, config, network_drive_client)
+    time_range = {
+        "start_time": rfc_3339_to_epoch("2021-12-28T15:14:28Z"),
+        "end_time": rfc_3339_to_epoch("2022-03-25T15:14:28Z"),
+    }
+    indexing_rule_obj = IndexingRules(config)
+    indexing_rule_obj.should_index = Mock(return_value=True)
+    listing = [
+        Mock(isDirectory=True, filename="folder1", last_attr_change_time=1640877268),
+        Mock(isDirectory=False, filename="old.txt", last_attr_change_time=1640704468, file_size=10, file_id=2),
+        Mock(isDirectory=False, filename="new.txt", last_attr_change_time=1648221269, file_size=20, file_id=3),
+        Mock(isDirectory=False, filename="file1.txt", last_attr_change_time=1640877268.5, create_time=164087726,
+             file_size=30, file_id=1),
+    ]
+    files_obj.network_drives_client.connect = Mock()
+    files_obj.network_drives_client.connect.listPath = Mock(return_value=listing)
+    response = files_obj.extract_files(
+        files_obj.network_drives_client.connect,
+        "Users",
+        "dummy",
+        time_range,
+        indexing_rule_obj,
+    )
+    assert list(response.keys()) == [1]
+    assert response[1]["updated_at"] == "2021-12-30T15:14:28Z"
+    assert files_obj.folder_statistics["dummy"]["file_count"] == 3
+    assert files_obj.folder_statistics["dummy"]["total_bytes"] == 60
+    assert files_obj.listed_ids == {"1", "2", "3"}
+    indexing_rule_obj.should_index.assert_called_once_with(response[1])
+
+
 def test_fetch_files():
     """Test that fetch_files successfully fetch files and create documents."""
     mock_response_files = {
@@ -200,11 +241,105 @@ def test_fetch_files():
     files_obj.retrieve_permission = Mock(return_value=mock_response_permission)
     files_obj.fetch_file_content = Mock(return_value=mock_response_file_content)
     time_range = {
-        "start_time": "2021-12-28T15:14:28Z",
-        "end_time": "2022-03-25T15:14:28Z",
+        "start_time": rfc_3339_to_epoch("2021-12-28T15:14:28Z"),
+        "end_time": rfc_3339_to_epoch("2022-03-25T15:14:28Z"),
     }
     indexing_rule_obj = IndexingRules(config)
     response = files_obj.fetch_files(
         "Users", ["dummy/folder1"], time_range, indexing_rule_obj
     )
-    assert response == expected_response
+    assert [doc.to_dict() for doc in response] == expected_response
+
+
+def test_fetch_files_skips_the_content_of_unchanged_files():
+    """Test that the files whose path and content did not change since the previous sync are not downloaded again,
+    only their permissions being updated if they changed."""
+    config, logger = settings()
+    files_obj = Files(logger, config, Mock())
+    files_obj.enable_document_permission = True
+    files_obj.extract_files = Mock(return_value={
+        index: {"file_size": 10, "file_name": f"file{index}.txt", "file_path": f"dummy/file{index}.txt",
+                "last_write_time": last_write_time}
+        for index, last_write_time in [(1, 100), (2, 100), (3, 300), (4, 100)]
+    })
+    permissions = {"allow": ["sid2", "sid1"], "deny": []}
+    files_obj.retrieve_permission = Mock(return_value=permissions)
+    files_obj.fetch_file_content = Mock(return_value="new text")
+    permission_hash = Files.permission_hash({"allow": ["sid1", "sid2"], "deny": []})
+    stored_files = {
+        # Only the permissions of the first file changed
+        "1": ("dummy/file1.txt", [10, 100, "previous"]),
+        "2": ("dummy/file2.txt", [10, 100, permission_hash]),
+        # The content of the third file changed, and the fourth file was moved
+        "3": ("dummy/file3.txt", [10, 100, permission_hash]),
+        "4": ("dummy/moved/file4.txt", [10, 100, permission_hash]),
+    }
+    budget = ByteBudget(100)
+    response = files_obj.fetch_files(
+        "Users", ["dummy"], {"start_time": 200, "end_time": 400}, Mock(), Mock(), budget, stored_files=stored_files,
+    )
+    assert [(doc.id, doc.body, doc.permissions_only) for doc in response] == [
+        ("1", None, True), ("3", "new text", False), ("4", "new text", False)
+    ]
+    assert response[0].state() == [10, 100, permission_hash]
+    assert files_obj.fetch_file_content.call_count == 2
+    assert budget.used == 20
+
+
+def test_fetch_files_indexes_metadata_only_file_types():
+    """Test that the files of the metadata only types are indexed without downloading their content."""
+    config, logger = settings()
+    files_obj = Files(logger, config, Mock())
+    files_obj.metadata_only_file_types = {".png"}
+    files_obj.extract_files = Mock(return_value={
+        1: {"file_size": 60, "file_name": "image.PNG", "file_type": ".PNG", "file_path": "dummy/image.PNG"},
+        2: {"file_size": 10, "file_name": "file2.txt", "file_type": ".txt", "file_path": "dummy/file2.txt"},
+    })
+    files_obj.retrieve_permission = Mock(return_value={"allow": [], "deny": []})
+    files_obj.fetch_file_content = Mock(return_value="some text")
+    budget = ByteBudget(100)
+    response = files_obj.fetch_files("Users", ["dummy"], {}, Mock(), Mock(), budget)
+    assert [(doc["id"], doc["body"]) for doc in response] == [("1", None), ("2", "some text")]
+    files_obj.fetch_file_content.assert_called_once()
+    assert budget.used == 10
+
+
+def test_fetch_files_hands_over_documents_when_budget_is_exhausted():
+    """Test that the documents fetched so far are flushed before waiting for the byte budget."""
+    config, logger = settings()
+    files_obj = Files(logger, config, Mock())
+    files_obj.extract_files = Mock(return_value={
+        index: {"file_size": 60, "file_name": f"file{index}.txt", "file_path": f"dummy/file{index}.txt"}
+        for index in range(1, 4)
+    })
+    files_obj.retrieve_permission = Mock(return_value={"allow": [], "deny": []})
+    files_obj.fetch_file_content = Mock(return_value="some text")
+    budget = ByteBudget(100)
+    flushed = []
+
+    def flush(documents):
+        flushed.append([doc["id"] for doc in documents])
+        # The indexing threads release the documents once they are indexed
+        budget.release([doc["id"] for doc in documents])
+
+    response = files_obj.fetch_files("Users", ["dummy"], {}, Mock(), Mock(), budget, flush)
+    assert flushed == [["1"], ["2"]]
+    assert [doc["id"] for doc in response] == ["3"]
+    assert budget.used == 60
+
+
+def test_fetch_files_releases_budget_on_error():
+    """Test that the bytes reserved by documents that are not handed over are released on errors."""
+    config, logger = settings()
+    files_obj = Files(logger, config, Mock())
+    files_obj.extract_files = Mock(return_value={
+        1: {"file_size": 10, "file_name": "file1.txt", "file_path": "dummy/file1.txt"},
+        2: {"file_size": 10, "file_name": "file2.txt", "file_path": "dummy/file2.txt"},
+    })
+    files_obj.retrieve_permission = Mock(return_value={"allow": [], "deny": []})
+    files_obj.fetch_file_content = Mock(side_effect=["some text", ConnectionError("broken pipe")])
+    budget = ByteBudget(100)
+    with pytest.raises(ConnectionError):
+        files_obj.fetch_files("Users", ["dummy"], {}, Mock(), Mock(), budget)
+    assert budget.used == 0
+    assert budget.reservations == {}
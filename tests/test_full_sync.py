@@ -0,0 +1,124 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import argparse
+import json
+import logging
+import os
+import sys
+from unittest.mock import Mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from ees_network_drive import full_sync_command  # noqa
+from ees_network_drive.full_sync_command import FullSyncCommand  # noqa
+from ees_network_drive.local_storage import LocalStorage  # noqa
+from ees_network_drive.sharding import Shard, shard_of  # noqa
+from ees_network_drive.sources import DriveSync, get_sources  # noqa
+
+CONFIG_FILE = os.path.join(
+    os.path.join(os.path.dirname(__file__), "config"),
+    "network_drive_connector.yml",
+)
+
+
+def create_full_sync_obj():
+    """This function creates a FullSyncCommand object whose deletions are mocked"""
+    args = argparse.Namespace()
+    args.config_file = CONFIG_FILE
+    full_sync_obj = FullSyncCommand(args)
+    full_sync_obj.workplace_search_custom_client.delete_documents = Mock()
+    return full_sync_obj
+
+
+PREVIOUS_FILES = {
+    "1": "dummy/folder1/file1.txt",
+    "2": "dummy/folder1/file2.txt",
+    "3": "dummy/folder2/file3.txt",
+}
+
+
+def create_drive_sync(tmp_path, previous_files, listed_ids, listing_errors=()):
+    """Returns a DriveSync object whose local storage holds the previous files, and which listed the given files"""
+    local_storage = LocalStorage(logging.getLogger("unit_test_full_sync"), str(tmp_path / "doc_id.jsonl"))
+    local_storage.write_storage(("global_keys", document_id, path) for document_id, path in previous_files.items())
+    sync_network_drives = Mock(listed_ids=set(listed_ids), listing_errors=list(listing_errors), file_states={})
+    drive_sync = DriveSync(Mock(), sync_network_drives, local_storage, Mock())
+    drive_sync.fetched_files = {document_id: previous_files[document_id] for document_id in listed_ids}
+    return drive_sync
+
+
+def test_sweep_deleted_files(tmp_path):
+    """Test that the stored files which were not listed by the full sync are deleted"""
+    full_sync_obj = create_full_sync_obj()
+    drive_sync = create_drive_sync(tmp_path, PREVIOUS_FILES, {"1", "3"})
+    deleted_ids = full_sync_obj.sweep_deleted_files(drive_sync)
+    assert deleted_ids == ["2"]
+    full_sync_obj.workplace_search_custom_client.delete_documents.assert_called_once_with(["2"])
+    drive_sync.save()
+    ids = drive_sync.local_storage.load_storage()
+    assert ids["global_keys"]["files"] == {"1": "dummy/folder1/file1.txt", "3": "dummy/folder2/file3.txt"}
+    assert ids["delete_keys"] == {}
+
+
+def test_sweep_deleted_files_keeps_the_files_of_completed_folders(tmp_path):
+    """Test that the files of the folders completed before the full sync was resumed are not deleted"""
+    full_sync_obj = create_full_sync_obj()
+    drive_sync = create_drive_sync(tmp_path, PREVIOUS_FILES, {"1"})
+    sync_progress = Mock(completed_folders={"dummy/folder2": {}})
+    deleted_ids = full_sync_obj.sweep_deleted_files(drive_sync, sync_progress)
+    assert deleted_ids == ["2"]
+
+
+def test_sweep_deleted_files_skipped_on_listing_errors(tmp_path):
+    """Test that nothing is deleted when a folder could not be listed"""
+    full_sync_obj = create_full_sync_obj()
+    drive_sync = create_drive_sync(tmp_path, PREVIOUS_FILES, {"1"}, ["dummy/folder2"])
+    assert full_sync_obj.sweep_deleted_files(drive_sync) == []
+    full_sync_obj.workplace_search_custom_client.delete_documents.assert_not_called()
+    drive_sync.save()
+    ids = drive_sync.local_storage.load_storage()
+    assert ids["global_keys"]["files"] == PREVIOUS_FILES
+    assert ids["delete_keys"]["files"] == PREVIOUS_FILES
+
+
+def test_sweep_deleted_files_of_a_resharded_run(tmp_path):
+    """Test that a sharded full sync only deletes the files of the folders belonging to its shard"""
+    full_sync_obj = create_full_sync_obj()
+    full_sync_obj.shard = Shard(0, 2)
+    folders = [f"dummy/folder{index}" for index in range(10)]
+    own_folder = next(folder for folder in folders if shard_of(folder, 2) == 0)
+    other_folder = next(folder for folder in folders if shard_of(folder, 2) == 1)
+    previous_files = {"1": f"{own_folder}/file1.txt", "2": f"{other_folder}/file2.txt"}
+    drive_sync = create_drive_sync(tmp_path, previous_files, set())
+    assert full_sync_obj.sweep_deleted_files(drive_sync) == ["1"]
+    drive_sync.save()
+    ids = drive_sync.local_storage.load_storage()
+    assert ids["global_keys"]["files"] == {"2": f"{other_folder}/file2.txt"}
+    assert ids["delete_keys"]["files"] == {"2": f"{other_folder}/file2.txt"}
+
+
+def test_resumed_full_sync_sets_the_checkpoint_of_every_drive(tmp_path, monkeypatch):
+    """Test that a resumed full sync of several drives sets the checkpoint of each drive to the time its first
+    attempt started"""
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    progress_path = str(tmp_path / "full_sync_progress.json")
+    monkeypatch.setattr(full_sync_command, "CHECKPOINT_PATH", checkpoint_path)
+    monkeypatch.setattr(full_sync_command, "PROGRESS_PATH", progress_path)
+    monkeypatch.setattr(full_sync_command, "LOCK_PATH", str(tmp_path / "connector.lock"))
+    args = argparse.Namespace(config_file=CONFIG_FILE, resume=True)
+    full_sync_obj = FullSyncCommand(args)
+    full_sync_obj.config._Configuration__configurations["network_drives"] = [{"name": "projects", "path": "Projects"}]
+    full_sync_obj.sources = get_sources(full_sync_obj.config, full_sync_obj.logger)
+    started_at = {"TEST_SERVER": "2022-03-24T15:14:28Z", "projects": "2022-03-25T15:14:28Z"}
+    for source in full_sync_obj.sources:
+        with open(source.file_path(progress_path), "w", encoding="utf-8") as progress_file:
+            json.dump({"started_at": started_at[source.checkpoint_key], "folders": {}}, progress_file)
+    full_sync_obj.run_producer_and_consumer = Mock()
+
+    full_sync_obj.execute()
+
+    with open(checkpoint_path, encoding="utf-8") as checkpoint_file:
+        assert json.load(checkpoint_file) == started_at
@@ -1,19 +1,29 @@
 import logging
 import os
+import pickle
 import sys
-from unittest.mock import Mock
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, patch
 
 import pytest
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 
+from ees_network_drive.checkpointing import SyncProgress  # noqa
 from ees_network_drive.configuration import Configuration  # noqa
 from ees_network_drive.connector_queue import ConnectorQueue  # noqa
+from ees_network_drive.constant import CONNECTION_TIMEOUT  # noqa
+from ees_network_drive.document import Document  # noqa
 from ees_network_drive.network_drive_client import NetworkDrive  # noqa
 from ees_network_drive.sync_enterprise_search import \
     SyncEnterpriseSearch  # noqa
-from ees_network_drive.sync_network_drives import SyncNetworkDrives  # noqa
+from ees_network_drive.files import Files  # noqa
+from ees_network_drive.indexing_rule import IndexingRules  # noqa
+from ees_network_drive.local_storage import FILE_STATES, LocalStorage  # noqa
+from ees_network_drive.sources import DriveSync  # noqa
+from ees_network_drive import sync_network_drives  # noqa
+from ees_network_drive.sync_network_drives import SyncNetworkDrives, WorkerPool  # noqa
 from elastic_enterprise_search import WorkplaceSearch  # noqa
 
 CONFIG_FILE = os.path.join(
@@ -125,9 +135,191 @@ def test_index_document_when_error_occurs(documents, mock_response, log_level, e
     assert error_msg in caplog.text
 
 
+def test_index_document_acknowledges_indexed_documents():
+    """Test that index_documents reports only the successfully indexed documents to the sync progress."""
+    indexer_obj = create_enterprise_search_obj()
+    indexer_obj.sync_progress = Mock()
+    indexer_obj.workplace_search_custom_client.index_documents = Mock(
+        return_value={"results": [{"id": "0", "errors": []}, {"id": "1", "errors": ["not indexed"]}]}
+    )
+    indexer_obj.index_documents([{"id": "0"}, {"id": "1"}])
+    indexer_obj.sync_progress.acknowledge.assert_called_once_with(["0"])
+
+
 def test_perform_sync_enterprise_search():
     """Test that perform_sync of sync_enterprise_search pull documents from the queue and index it to the Enterprise Search."""
     indexer_obj = create_enterprise_search_obj()
     indexer_obj.index_documents = Mock(return_value=True)
     indexer_obj.perform_sync()
     assert indexer_obj.queue.empty()
+
+
+def test_perform_sync_updates_the_permissions_of_unchanged_files():
+    """Test that perform_sync of sync_enterprise_search updates only the permissions of the documents whose content
+    did not change."""
+    configs, logger = settings()
+    queue = ConnectorQueue(logger)
+    document = Document("1", "dummy/file1.txt", "file://1.2.3.4/Users/", 10, None, None)
+    document.set_permissions({"allow": ["sid1"], "deny": []}, "hash")
+    document.permissions_only = True
+    queue.append_to_queue([{"id": "2"}])
+    queue.append_permission_updates([document])
+    queue.end_signal()
+    client = Mock()
+    client.index_documents.return_value = {"results": [{"id": "2", "errors": []}]}
+    client.update_document_permissions.return_value = {"results": [{"id": "1", "errors": []}]}
+    indexer_obj = SyncEnterpriseSearch(configs, logger, client, queue)
+    indexer_obj.perform_sync()
+    client.index_documents.assert_called_once_with([{"id": "2"}], CONNECTION_TIMEOUT)
+    client.update_document_permissions.assert_called_once_with(
+        [{"id": "1", "_allow_permissions": ["sid1"], "_deny_permissions": []}], CONNECTION_TIMEOUT
+    )
+    assert indexer_obj.total_document_indexed == 2
+
+
+def test_stored_files_are_read_from_the_local_storage(tmp_path):
+    """Test that the states of the files fetched by a sync are recorded in the local storage, and read back by the
+    next sync folder by folder."""
+    configs, logger = settings()
+    local_storage = LocalStorage(logger, str(tmp_path / "doc_id.jsonl"))
+    local_storage.write_storage([
+        ("global_keys", "1", "dummy/folder1/file1.txt"),
+        ("global_keys", "2", "dummy/folder2/file2.txt"),
+        (FILE_STATES, "1", [10, 100, "hash"]),
+        (FILE_STATES, "2", [20, 200, "hash"]),
+    ])
+    time_range = {"start_time": "2021-12-28T15:14:28Z", "end_time": "2022-03-25T15:14:28Z"}
+    sync_obj = SyncNetworkDrives(
+        logger, configs, time_range, NetworkDrive(configs, logger), IndexingRules(configs), ConnectorQueue(logger),
+        skip_unchanged_files=True,
+    )
+    sync_obj.close()
+    assert sync_obj.count_stored_files(local_storage) == {"dummy/folder1": 1, "dummy/folder2": 1}
+    assert sync_obj.get_stored_files(["dummy/folder1"]) == {"1": ("dummy/folder1/file1.txt", [10, 100, "hash"])}
+
+    document = Document("3", "dummy/folder1/file3.txt", "file://1.2.3.4/Users/", 30, None, None)
+    document.last_write_time = 300
+    sync_obj.queue_documents([document], {})
+    drive_sync = DriveSync(Mock(), sync_obj, local_storage, Mock())
+    drive_sync.deleted_ids.add("2")
+    drive_sync.fetched_files["3"] = document.path
+    drive_sync.save()
+    ids = local_storage.load_storage()
+    assert ids["global_keys"]["files"] == {"1": "dummy/folder1/file1.txt", "3": "dummy/folder1/file3.txt"}
+    assert ids["delete_keys"]["files"] == {"1": "dummy/folder1/file1.txt"}
+    assert ids[FILE_STATES]["files"] == {"1": [10, 100, "hash"], "3": [30, 300, None]}
+
+
+def test_perform_sync_network_drives_in_worker_processes():
+    """Test that perform_sync fetches the files in the process pool when the process executor is configured"""
+    configs, logger = settings()
+    configs._Configuration__configurations["network_drives_sync_executor"] = "process"
+    time_range = {
+        "start_time": "2021-12-28T15:14:28Z",
+        "end_time": "2022-03-25T15:14:28Z",
+    }
+    queue = ConnectorQueue(logger)
+    sync_obj = SyncNetworkDrives(
+        logger, configs, time_range, NetworkDrive(configs, logger), IndexingRules(configs), queue
+    )
+    sync_obj.close()
+    documents = [{"id": "1", "path": "dummy/folder1/file1.txt"}]
+    sync_obj.process_pool = Mock()
+
+    def fetch(flush, *arguments):
+        flush([{"id": "0", "path": "dummy/folder1/file0.txt"}])
+        return documents, {}, ({"1", "2"}, []), {}
+
+    sync_obj.process_pool.fetch.side_effect = fetch
+    ids = sync_obj.perform_sync("TEST_SERVER", ["dummy/folder1"])
+    assert ids == {"0": "dummy/folder1/file0.txt", "1": "dummy/folder1/file1.txt"}
+    assert sync_obj.listed_ids == {"1", "2"}
+    assert sync_obj.listing_errors == []
+    assert queue.get()["data"] == [{"id": "0", "path": "dummy/folder1/file0.txt"}]
+    assert queue.get() == {"type": "document_list", "data": documents}
+
+
+def test_worker_pool_hands_over_the_batches_of_a_job():
+    """Test that the batches sent by a worker process are handed to the thread waiting for its job"""
+    configs, logger = settings()
+    pool = WorkerPool(configs, logger)
+    pool.executor.shutdown()
+    pool.executor = ThreadPoolExecutor(max_workers=1)
+
+    def fetch_files(job_id, folder):
+        pool.batches.put((job_id, [f"{folder}/file1.txt", f"{folder}/file2.txt"]))
+        pool.batches.put((job_id, [f"{folder}/file3.txt"]))
+        pool.batches.put((job_id, None))
+        return [f"{folder}/file4.txt"]
+
+    batches = []
+    with patch.object(sync_network_drives, "fetch_files_in_process", fetch_files):
+        assert pool.fetch(batches.append, "dummy") == ["dummy/file4.txt"]
+    pool.shutdown()
+    assert batches == [["dummy/file1.txt", "dummy/file2.txt"], ["dummy/file3.txt"]]
+    assert pool.jobs == {}
+
+
+def test_worker_process_arguments_are_picklable():
+    """Test that the objects sent to the worker processes can be pickled"""
+    configs, logger = settings()
+    arguments = (logger, configs, NetworkDrive(configs, logger), IndexingRules(configs))
+    unpickled_logger, unpickled_configs, _, unpickled_rules = pickle.loads(pickle.dumps(arguments))
+    assert unpickled_logger is logger
+    assert unpickled_configs.get_value("network_drive.path") == "path1"
+    assert unpickled_rules.exclude == IndexingRules(configs).exclude
+
+
+def create_sync_network_drives_obj():
+    """This function creates a SyncNetworkDrives object fetching the files in threads."""
+    configs, logger = settings()
+    time_range = {
+        "start_time": "2021-12-28T15:14:28Z",
+        "end_time": "2022-03-25T15:14:28Z",
+    }
+    queue = ConnectorQueue(logger)
+    return SyncNetworkDrives(logger, configs, time_range, NetworkDrive(configs, logger), IndexingRules(configs), queue)
+
+
+def test_prioritize_folders():
+    """Test that prioritize_folders orders the folders by the number of files found in the previous sync"""
+    sync_obj = create_sync_network_drives_obj()
+    folders = ["dummy", "dummy/small", "dummy/new", "dummy/large"]
+    result = sync_obj.prioritize_folders(folders, {"dummy/small": 1, "dummy/large": 2})
+    assert result == ["dummy/large", "dummy/small", "dummy", "dummy/new"]
+
+
+def test_perform_sync_network_drives_reuses_connection():
+    """Test that perform_sync reuses the SMB connection of the thread for every folder and reconnects after an error"""
+    sync_obj = create_sync_network_drives_obj()
+    sync_obj.network_drive_client.connect = Mock(side_effect=[Mock(), Mock()])
+    with patch.object(Files, "fetch_files", side_effect=[
+        [{"id": "1", "path": "dummy/folder1/file1.txt"}], Exception("broken connection"), []
+    ]) as fetch_files:
+        assert sync_obj.perform_sync("TEST_SERVER", ["dummy/folder1"]) == {"1": "dummy/folder1/file1.txt"}
+        assert sync_obj.perform_sync("TEST_SERVER", ["dummy/folder2"]) == {}
+        assert sync_obj.perform_sync("TEST_SERVER", ["dummy/folder3"]) == {}
+    connections = [call[0][4] for call in fetch_files.call_args_list]
+    assert connections[0] is connections[1]
+    assert connections[2] is not connections[0]
+    assert sync_obj.network_drive_client.connect.call_count == 2
+    sync_obj.close()
+    connections[2].close.assert_called_once()
+
+
+def test_folders_that_could_not_be_listed_are_fetched_again_by_a_resumed_sync(tmp_path):
+    """Test that a folder whose listing failed is not completed, so that a resumed full sync fetches it again"""
+    sync_obj = create_sync_network_drives_obj()
+    progress_path = str(tmp_path / "full_sync_progress.json")
+    sync_obj.sync_progress = SyncProgress(sync_obj.logger, progress_path, flush_interval=0)
+    sync_obj.sync_progress.start("2022-03-25T15:14:28Z")
+    connection = Mock()
+    connection.listPath.side_effect = lambda service_name, path: [] if path == "dummy/folder1" else 1 / 0
+    sync_obj.network_drive_client.connect = Mock(return_value=connection)
+    sync_obj.perform_sync("TEST_SERVER", ["dummy/folder1", "dummy/folder2"])
+    sync_obj.close()
+    assert sync_obj.listing_errors == ["dummy/folder2"]
+
+    resumed_progress = SyncProgress(sync_obj.logger, progress_path)
+    assert resumed_progress.resume()
+    assert list(resumed_progress.completed_folders) == ["dummy/folder1"]
@@ -1,7 +1,9 @@
 import pytest
+import copy
 import logging
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
@@ -65,3 +67,36 @@ def test_should_index_when_indexing_rule_is_followed(file_details):
     indexing_rules_obj = IndexingRules(config)
     result = indexing_rules_obj.should_index(file_details)
     assert result == True
+
+
+def test_indexing_rules_does_not_mutate_configuration():
+    """Test that resolving the indexing rules keeps the patterns of the configuration untouched"""
+    config, logger = settings()
+    config._Configuration__configurations["include"] = {"size": [">100"], "path_template": ["**/*.png"]}
+    config._Configuration__configurations["exclude"] = {"size": [">100", "<10"], "path_template": ["**/*.png"]}
+    expected_include = copy.deepcopy(config.get_value("include"))
+    expected_exclude = copy.deepcopy(config.get_value("exclude"))
+    indexing_rules_obj = IndexingRules(config)
+    indexing_rules_obj.should_index({"file_path": "dummy_folder/file1.png", "file_size": 3000})
+    assert config.get_value("include") == expected_include
+    assert config.get_value("exclude") == expected_exclude
+    assert indexing_rules_obj.exclude == (("size", (("<", "10"),)), ("path_template", ()))
+
+
+def test_should_index_is_consistent_across_threads():
+    """Test that a shared IndexingRules object returns identical results when evaluated concurrently"""
+    config, logger = settings()
+    indexing_rules_obj = IndexingRules(config)
+    files = [
+        {"file_path": f"dummy_folder/file{index}.{extension}", "file_size": size}
+        for index, (extension, size) in enumerate(
+            [("png", 3000), ("txt", 3000), ("jpg", 23000), ("gif", 15000), ("png", 15001)] * 20
+        )
+    ]
+    expected_result = [indexing_rules_obj.should_index(file_details) for file_details in files]
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(
+            lambda _: [indexing_rules_obj.should_index(file_details) for file_details in files], range(200)
+        ))
+    assert all(result == expected_result for result in results)
+    assert expected_result[:5] == [True, False, False, True, False]
@@ -0,0 +1,66 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import json
+import logging
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from ees_network_drive.local_storage import ConnectorLockedException, FileLock, LocalStorage  # noqa
+
+
+def test_update_storage_keeps_previous_ids_when_write_fails(tmp_path):
+    """Test that a failed update leaves the previous local storage intact and no temporary file behind"""
+    logger = logging.getLogger("unit_test_local_storage")
+    local_storage = LocalStorage(logger, str(tmp_path / "doc_id.jsonl"))
+    ids = {"global_keys": {"files": {"1": "dummy/folder1/file1.txt"}}, "delete_keys": {}}
+    local_storage.update_storage(ids)
+
+    local_storage.update_storage({"global_keys": {"files": {"2": object()}}})
+
+    assert local_storage.load_storage() == ids
+    assert os.listdir(tmp_path) == ["doc_id.jsonl"]
+
+
+def test_iter_storage_reads_records_lazily(tmp_path):
+    """Test that iter_storage yields the records of the requested collection one by one"""
+    logger = logging.getLogger("unit_test_local_storage")
+    local_storage = LocalStorage(logger, str(tmp_path / "doc_id.jsonl"))
+    local_storage.write_storage(iter([
+        ("global_keys", "1", "dummy/folder1/file1.txt"),
+        ("delete_keys", "2", "dummy/folder1/file2.txt"),
+        ("global_keys", "3", "dummy/folder1/file3.txt"),
+    ]))
+    records = local_storage.iter_storage("global_keys")
+    assert next(records) == ("global_keys", "1", "dummy/folder1/file1.txt")
+    assert list(records) == [("global_keys", "3", "dummy/folder1/file3.txt")]
+
+
+def test_legacy_storage_is_migrated(tmp_path):
+    """Test that a doc_id.json file written by a previous version is read and replaced by the JSON Lines file"""
+    logger = logging.getLogger("unit_test_local_storage")
+    ids = {"global_keys": {"files": {"1": "dummy/folder1/file1.txt"}}, "delete_keys": {}}
+    with open(tmp_path / "doc_id.json", "w", encoding="utf-8") as legacy_file:
+        json.dump(ids, legacy_file, indent=4)
+    local_storage = LocalStorage(logger, str(tmp_path / "doc_id.jsonl"))
+    assert local_storage.load_storage() == ids
+    local_storage.update_storage(local_storage.load_storage())
+    assert os.listdir(tmp_path) == ["doc_id.jsonl"]
+    assert local_storage.load_storage() == ids
+
+
+def test_file_lock_prevents_overlapping_runs(tmp_path):
+    """Test that the lock cannot be acquired twice and is released at the end of the run"""
+    lock_path = str(tmp_path / "connector.lock")
+    with FileLock(lock_path):
+        with pytest.raises(ConnectorLockedException):
+            with FileLock(lock_path):
+                pass
+    with FileLock(lock_path):
+        pass
@@ -0,0 +1,95 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import json
+import logging
+import os
+import sys
+import threading
+from unittest.mock import Mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from ees_network_drive.metrics import BUCKET_COUNT, Histogram, Metrics  # noqa
+
+
+def test_histogram_percentiles():
+    """Test that the percentiles fall in the buckets of the observations"""
+    histogram = Histogram()
+    for _ in range(90):
+        histogram.observe(0.003)
+    for _ in range(10):
+        histogram.observe(1.5, 100)
+    summary = histogram.summary()
+    assert summary["count"] == 100
+    assert summary["total_bytes"] == 1000
+    assert 0.003 <= summary["p50_seconds"] < 0.006
+    assert summary["p99_seconds"] == 1.5
+    assert summary["max_seconds"] == 1.5
+
+
+def test_histogram_percentiles_are_interpolated():
+    """Test that the percentiles are interpolated within the bucket of the observations"""
+    histogram = Histogram()
+    for index in range(1, 1001):
+        histogram.observe(0.6 + 0.4 * index / 1000)
+    assert abs(histogram.percentile(0.50) - 0.8) < 0.05
+    assert abs(histogram.percentile(0.95) - 0.98) < 0.05
+
+
+def test_histogram_bounded_buckets():
+    """Test that very slow and very fast observations do not add buckets"""
+    histogram = Histogram()
+    histogram.observe(0)
+    histogram.observe(10 ** 9)
+    assert len(histogram.buckets) == BUCKET_COUNT
+    assert histogram.buckets[0] == 1
+    assert histogram.buckets[-1] == 1
+
+
+def test_metrics_thread_safety():
+    """Test that the observations of concurrent threads are all counted"""
+    metrics = Metrics()
+
+    def observe():
+        for _ in range(1000):
+            metrics.observe("stage", 0.001, 1)
+
+    threads = [threading.Thread(target=observe) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert metrics.summary()["stage"]["count"] == 8000
+    assert metrics.summary()["stage"]["total_bytes"] == 8000
+
+
+def test_drain_and_merge():
+    """Test that the metrics drained from a worker process are merged in the parent process"""
+    worker_metrics = Metrics()
+    with worker_metrics.timer("file_download") as observation:
+        observation["size"] = 42
+    snapshots = worker_metrics.drain()
+    assert worker_metrics.summary() == {}
+
+    metrics = Metrics()
+    metrics.observe("file_download", 0.5, 8)
+    metrics.merge(snapshots)
+    summary = metrics.summary()["file_download"]
+    assert summary["count"] == 2
+    assert summary["total_bytes"] == 50
+
+
+def test_log_summary():
+    """Test that the summary is logged as json only when a stage was observed"""
+    logger = Mock(spec=logging.Logger)
+    metrics = Metrics()
+    metrics.log_summary(logger)
+    logger.info.assert_not_called()
+    metrics.observe("index_request", 0.2)
+    metrics.log_summary(logger)
+    message = logger.info.call_args[0][0]
+    summary = json.loads(message[message.index("{"):])
+    assert summary["stages"]["index_request"]["count"] == 1
@@ -0,0 +1,76 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import logging
+import os
+import sys
+import urllib.request
+from unittest.mock import Mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from ees_network_drive.metrics import Metrics  # noqa
+from ees_network_drive.metrics_exporter import MetricsExporter, render_metrics  # noqa
+
+
+def create_metrics():
+    """This function returns metrics containing a few observations"""
+    metrics = Metrics()
+    metrics.increment("documents_indexed", 3)
+    metrics.observe("file_download", 0.25, 1024)
+    metrics.observe("file_download", 2, 2048)
+    metrics.register_gauge("queue_depth", lambda: 7)
+    metrics.register_gauge("active_smb_connections", Mock(side_effect=NotImplementedError))
+    return metrics
+
+
+def create_config(port=None, textfile_path=None):
+    """This function returns a configuration containing the metrics settings"""
+    config = Mock()
+    config.get_value = {"metrics_port": port, "metrics_textfile_path": textfile_path}.get
+    return config
+
+
+def test_render_metrics():
+    """Test that the counters, gauges and histograms are rendered in the Prometheus text format"""
+    lines = render_metrics(create_metrics()).splitlines()
+    assert "ees_network_drive_documents_indexed_total 3" in lines
+    assert "ees_network_drive_documents_failed_total 0" in lines
+    assert "ees_network_drive_queue_depth 7" in lines
+    assert not any(line.startswith("ees_network_drive_active_smb_connections") for line in lines)
+    assert 'ees_network_drive_stage_duration_seconds_bucket{stage="file_download",le="+Inf"} 2' in lines
+    assert 'ees_network_drive_stage_duration_seconds_count{stage="file_download"} 2' in lines
+    assert 'ees_network_drive_stage_bytes_total{stage="file_download"} 3072' in lines
+    bucket_counts = [
+        int(line.rsplit(" ", 1)[1]) for line in lines
+        if line.startswith("ees_network_drive_stage_duration_seconds_bucket")
+    ]
+    assert bucket_counts == sorted(bucket_counts)
+
+
+def test_serve_metrics():
+    """Test that the metrics are served over HTTP while the exporter is running"""
+    exporter = MetricsExporter(create_config(port=0), logging.getLogger("unit_test_metrics"), create_metrics())
+    exporter.start()
+    try:
+        port = exporter.server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            body = response.read().decode("utf-8")
+        assert "ees_network_drive_documents_indexed_total 3" in body
+    finally:
+        exporter.stop()
+
+
+def test_write_textfile(tmp_path):
+    """Test that the metrics are written to the textfile when the exporter stops"""
+    textfile_path = str(tmp_path / "ees_network_drive.prom")
+    exporter = MetricsExporter(
+        create_config(textfile_path=textfile_path), logging.getLogger("unit_test_metrics"), create_metrics(), 60
+    )
+    exporter.start()
+    exporter.stop()
+    with open(textfile_path, encoding="utf-8") as textfile:
+        assert "ees_network_drive_documents_indexed_total 3" in textfile.read()
+    assert os.listdir(tmp_path) == ["ees_network_drive.prom"]
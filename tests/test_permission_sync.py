@@ -4,6 +4,7 @@
 # you may not use this file except in compliance with the Elastic License 2.0.
 #
 from unittest.mock import Mock
+from packaging import version
 import logging
 import argparse
 import sys
@@ -29,18 +30,59 @@ def settings():
     return configuration, logger
 
 
-def test_remove_all_permissions():
-    """Test that remove_all_permissions remove all permissions from Enterprise Search."""
+def test_sync_permissions_only_applies_changes():
+    """Test that sync_permissions creates, updates and removes only the users whose permissions changed."""
     args = argparse.Namespace()
     args.config_file = CONFIG_FILE
     permission_obj = PermissionSyncCommand(args)
-    mocked_respose = {"results": [{"user": "user1", "permissions": "permission1"}]}
-    permission_obj.workplace_search_custom_client.list_permissions = Mock(
-        return_value=mocked_respose
-    )
-    permission_obj.workplace_search_custom_client.remove_permissions = Mock(
-        return_value=True
-    )
-    mock = Mock()
-    mock.permission_obj.remove_all_permissions()
-    mock.permission_obj.remove_all_permissions.assert_called()
+    client = Mock()
+    client.list_all_permissions = Mock(return_value={
+        "unchanged": {"user": "unchanged", "permissions": ["sid2", "sid1"]},
+        "changed": {"user": "changed", "permissions": ["sid3"]},
+        "unmapped": {"user": "unmapped", "permissions": ["sid4"]},
+    })
+    permission_obj.workplace_search_custom_client = client
+    permission_obj.sync_permissions({
+        "unchanged": ["sid1", "sid2"],
+        "changed": ["sid3", "sid5"],
+        "new": ["sid6"],
+    })
+    client.add_permissions.assert_called_once_with("new", ["sid6"])
+    client.put_permissions.assert_called_once_with("changed", ["sid3", "sid5"])
+    client.remove_permissions.assert_called_once_with({"user": "unmapped", "permissions": ["sid4"]})
+
+
+def test_sync_permissions_without_current_permissions():
+    """Test that no user is removed when the permissions of the workplace could not be retrieved."""
+    args = argparse.Namespace()
+    args.config_file = CONFIG_FILE
+    permission_obj = PermissionSyncCommand(args)
+    client = Mock()
+    client.list_all_permissions = Mock(return_value=None)
+    permission_obj.workplace_search_custom_client = client
+    permission_obj.sync_permissions({"user1": ["sid1"]})
+    client.add_permissions.assert_called_once_with("user1", ["sid1"])
+    client.remove_permissions.assert_not_called()
+
+
+def test_iter_permissions_reads_all_pages():
+    """Test that iter_permissions yields the permissions of every page of the workplace."""
+    args = argparse.Namespace()
+    args.config_file = CONFIG_FILE
+    permission_obj = PermissionSyncCommand(args)
+    wrapper = permission_obj.workplace_search_custom_client
+    wrapper.version = version.parse("7.16")
+    wrapper.permissions_page_size = 2
+    users = [f"user{index}" for index in range(5)]
+
+    def list_permissions(content_source_id, current_page, page_size):
+        page = users[(current_page - 1) * page_size:current_page * page_size]
+        return {
+            "meta": {"page": {"current": current_page, "total_pages": 3}},
+            "results": [{"user": user, "permissions": []} for user in page],
+        }
+
+    wrapper.workplace_search_client = Mock()
+    wrapper.workplace_search_client.list_permissions = Mock(side_effect=list_permissions)
+    assert list(wrapper.list_all_permissions()) == users
+    assert wrapper.workplace_search_client.list_permissions.call_count == 3
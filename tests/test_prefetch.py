@@ -0,0 +1,133 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import io
+import logging
+import os
+import sys
+import threading
+from unittest.mock import Mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from ees_network_drive.byte_budget import ByteBudget  # noqa
+from ees_network_drive.files import Files  # noqa
+from ees_network_drive.prefetch import Prefetcher  # noqa
+
+
+def download(file_details, smb_connection):
+    """Downloads a fake file, recording the connection used"""
+    smb_connection.downloads.append(file_details["file_path"])
+    return io.BytesIO(file_details["file_path"].encode("utf-8")), None
+
+
+def test_prefetcher_downloads_files_in_order():
+    """Test that the scheduled files are downloaded ahead in order, and that the skipped files are dropped"""
+    smb_connection = Mock(downloads=[])
+    prefetcher = Prefetcher(download, smb_connection, 10, 1000)
+    prefetcher.schedule([(index, {"file_path": f"file{index}", "file_size": 10}) for index in range(1, 5)])
+    downloaded = prefetcher.take(1)
+    assert downloaded[0].getvalue() == b"file1"
+    # The second file is skipped by the fetching thread
+    assert prefetcher.take(3)[0].getvalue() == b"file3"
+    assert 2 not in prefetcher.ready
+    assert prefetcher.take(5) is None
+    prefetcher.close()
+    assert prefetcher.ready == {}
+    assert smb_connection.downloads[:3] == ["file1", "file2", "file3"]
+
+
+def test_prefetcher_respects_the_limits():
+    """Test that no more than the given number of files are downloaded ahead"""
+    smb_connection = Mock(downloads=[])
+    prefetcher = Prefetcher(download, smb_connection, 2, 1000)
+    prefetcher.schedule([(index, {"file_path": f"file{index}", "file_size": 10}) for index in range(1, 5)])
+    with prefetcher.condition:
+        prefetcher.condition.wait_for(lambda: len(prefetcher.ready) == 2, timeout=5)
+    assert smb_connection.downloads == ["file1", "file2"]
+    assert prefetcher.take(1) is not None
+    assert prefetcher.take(2) is not None
+    assert prefetcher.take(3)[0].getvalue() == b"file3"
+    prefetcher.close()
+
+
+def test_prefetcher_reserves_the_downloads_from_the_budget():
+    """Test that the files downloaded ahead reserve their size from the budget, which is kept for the taken files
+    and released for the others"""
+    smb_connection = Mock(downloads=[])
+    budget = ByteBudget(25)
+    prefetcher = Prefetcher(download, smb_connection, 10, 1000, budget)
+    prefetcher.schedule([(index, {"file_path": f"file{index}", "file_size": 10}) for index in range(1, 5)])
+    with prefetcher.condition:
+        assert prefetcher.condition.wait_for(lambda: len(prefetcher.ready) == 2, timeout=5)
+    assert smb_connection.downloads == ["file1", "file2"]
+    assert budget.used == 20
+    assert prefetcher.take(1)[0].getvalue() == b"file1"
+    assert budget.reservations == {"1": 10, "2": 10}
+    budget.release(["1"])
+    with prefetcher.condition:
+        assert prefetcher.condition.wait_for(lambda: 3 in prefetcher.ready, timeout=5)
+    prefetcher.close()
+    assert budget.used == 0
+
+
+def test_prefetcher_stops_on_errors():
+    """Test that the files are left to the fetching thread once a download failed"""
+    failing_download = Mock(side_effect=ConnectionError("broken pipe"))
+    prefetcher = Prefetcher(failing_download, Mock(), 10, 1000)
+    prefetcher.schedule([(1, {"file_path": "file1"}), (2, {"file_path": "file2"})])
+    prefetcher.thread.join(5)
+    assert prefetcher.failed
+    assert prefetcher.take(1) is None
+    assert prefetcher.take(2) is None
+    prefetcher.close()
+    failing_download.assert_called_once()
+
+
+def test_fetch_files_downloads_files_ahead():
+    """Test that fetch_files extracts the files downloaded ahead with the prefetching connection"""
+    config = Mock(get_value=Mock(return_value=None))
+    files_obj = Files(logging.getLogger("unit_test_prefetch"), config, Mock())
+    files_obj.prefetch_file_count = 2
+    files_obj.prefetch_max_bytes = 100
+    files_obj.extract_files = Mock(return_value={
+        index: {"file_size": 5, "file_name": f"file{index}.txt", "file_path": f"file{index}.txt"}
+        for index in range(1, 4)
+    })
+    threads = set()
+
+    def retrieve_file(service_name, path, file_obj):
+        threads.add(threading.current_thread())
+        file_obj.write(path.encode("utf-8"))
+
+    smb_connection = Mock()
+    prefetch_connection = Mock()
+    prefetch_connection.retrieveFile = Mock(side_effect=retrieve_file)
+    response = files_obj.fetch_files(
+        "Users", ["dummy"], {}, Mock(), smb_connection, prefetch_connection=prefetch_connection
+    )
+    assert [doc["body"] for doc in response] == ["file1.txt", "file2.txt", "file3.txt"]
+    smb_connection.retrieveFile.assert_not_called()
+    assert threading.current_thread() not in threads
+
+
+def test_fetch_files_reserves_the_files_downloaded_ahead_once():
+    """Test that the size of a file downloaded ahead is reserved from the budget once, for its document"""
+    config = Mock(get_value=Mock(return_value=None))
+    files_obj = Files(logging.getLogger("unit_test_prefetch"), config, Mock())
+    files_obj.prefetch_file_count = 2
+    files_obj.prefetch_max_bytes = 100
+    files_obj.extract_files = Mock(return_value={
+        index: {"file_size": 5, "file_name": f"file{index}.txt", "file_path": f"file{index}.txt"}
+        for index in range(1, 4)
+    })
+    prefetch_connection = Mock()
+    prefetch_connection.retrieveFile = Mock(side_effect=lambda service_name, path, file_obj: file_obj.write(b"text"))
+    budget = ByteBudget(100)
+    response = files_obj.fetch_files(
+        "Users", ["dummy"], {}, Mock(), Mock(), budget=budget, prefetch_connection=prefetch_connection
+    )
+    assert len(response) == 3
+    assert budget.reservations == {"1": 5, "2": 5, "3": 5}
@@ -0,0 +1,68 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from ees_network_drive.configuration import Configuration  # noqa
+from ees_network_drive.profiling import PROFILER_PER_THREAD, Profiler  # noqa
+
+CONFIG_FILE = os.path.join(
+    os.path.join(os.path.dirname(__file__), "config"),
+    "network_drive_connector.yml",
+)
+
+
+def settings():
+    """This function loads config from the file and returns it."""
+    configuration = Configuration(file_name=CONFIG_FILE)
+
+    logger = logging.getLogger("unit_test_profiling")
+    return configuration, logger
+
+
+def busy_work():
+    """Spends some CPU time"""
+    return sum(index * index for index in range(20000))
+
+
+@pytest.mark.parametrize("mode", ["cpu", "wall"])
+def test_thread_profiles(tmp_path, mode):
+    """Test that the profile of each thread is written along with the summary and the metadata"""
+    config, logger = settings()
+    with Profiler(mode, str(tmp_path), "full-sync", config, logger) as profiler:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            for _ in range(4):
+                executor.submit(busy_work)
+    output_files = os.listdir(profiler.output_dir)
+    profile_files = [file_name for file_name in output_files if file_name.endswith(".prof")]
+    assert len(profile_files) == (3 if PROFILER_PER_THREAD else 1)
+    assert "summary.txt" in output_files
+    with open(os.path.join(profiler.output_dir, "metadata.json"), encoding="utf-8") as metadata_file:
+        metadata = json.load(metadata_file)
+    assert metadata["command"] == "full-sync"
+    assert metadata["mode"] == mode
+    assert metadata["succeeded"] is True
+    assert metadata["settings"]["network_drive.server_name"] == "TEST_SERVER"
+
+
+def test_memory_profile(tmp_path):
+    """Test that the allocations are written when the command fails"""
+    config, logger = settings()
+    with pytest.raises(ValueError):
+        with Profiler("memory", str(tmp_path), "incremental-sync", config, logger) as profiler:
+            blocks = [bytearray(1024) for _ in range(100)]
+            raise ValueError(len(blocks))
+    output_files = os.listdir(profiler.output_dir)
+    assert {"memory.snapshot", "summary.txt", "metadata.json"} <= set(output_files)
+    with open(os.path.join(profiler.output_dir, "metadata.json"), encoding="utf-8") as metadata_file:
+        assert json.load(metadata_file)["succeeded"] is False
@@ -0,0 +1,125 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import argparse
+import json
+import logging
+import os
+import sys
+from argparse import ArgumentTypeError
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from ees_network_drive import merge_shards_command  # noqa
+from ees_network_drive.local_storage import LocalStorage  # noqa
+from ees_network_drive.merge_shards_command import MergeShardsCommand, MissingShardException  # noqa
+from ees_network_drive.sharding import (Shard, filter_folders_for_shard,  # noqa
+                                        parse_shard, parse_shard_count, shard_file_path)
+
+CONFIG_FILE = os.path.join(
+    os.path.join(os.path.dirname(__file__), "config"),
+    "network_drive_connector.yml",
+)
+
+
+def test_parse_shard():
+    """Test that parse_shard parses the value of the --shard argument"""
+    assert parse_shard("1/4") == Shard(1, 4)
+
+
+@pytest.mark.parametrize("value", ["4/4", "1", "a/4", "0/0"])
+def test_parse_shard_when_value_is_invalid(value):
+    """Test that parse_shard raises an error for an invalid shard"""
+    with pytest.raises(ArgumentTypeError):
+        parse_shard(value)
+
+
+@pytest.mark.parametrize("value", ["0", "-1", "a"])
+def test_parse_shard_count_when_value_is_invalid(value):
+    """Test that parse_shard_count raises an error unless there is at least one shard"""
+    assert parse_shard_count("4") == 4
+    with pytest.raises(ArgumentTypeError):
+        parse_shard_count(value)
+
+
+def test_filter_folders_for_shard():
+    """Test that every folder belongs to exactly one shard and the partition is deterministic"""
+    folders = [f"dummy/folder{index}" for index in range(100)]
+    partitions = [filter_folders_for_shard(folders, Shard(index, 3)) for index in range(3)]
+    assert sorted(sum(partitions, [])) == sorted(folders)
+    assert all(partitions)
+    assert partitions[0] == filter_folders_for_shard(folders, Shard(0, 3))
+    assert filter_folders_for_shard(folders, None) == folders
+
+
+def test_shard_file_path():
+    """Test that shard_file_path returns a separate file for each shard"""
+    assert shard_file_path("/tmp/doc_id.json", Shard(0, 2)) == "/tmp/doc_id.shard-0-of-2.json"
+    assert shard_file_path("/tmp/doc_id.json", None) == "/tmp/doc_id.json"
+
+
+def test_merge_shards(tmp_path, monkeypatch):
+    """Test that merge-shards combines the ID registries and sets the earliest checkpoint"""
+    ids_path = str(tmp_path / "doc_id.jsonl")
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    monkeypatch.setattr(merge_shards_command, "IDS_PATH", ids_path)
+    monkeypatch.setattr(merge_shards_command, "CHECKPOINT_PATH", checkpoint_path)
+    monkeypatch.setattr(merge_shards_command, "LOCK_PATH", str(tmp_path / "connector.lock"))
+    shard_ids = [{"1": "folder1/file1.txt"}, {"2": "folder2/file2.txt"}]
+    shard_checkpoints = ["2022-03-25T15:14:28Z", "2022-03-24T15:14:28Z"]
+    for index in range(2):
+        shard = Shard(index, 2)
+        with open(shard_file_path(str(tmp_path / "doc_id.json"), shard), "w", encoding="utf-8") as ids_file:
+            json.dump({"global_keys": {"files": shard_ids[index]}, "delete_keys": {"files": shard_ids[index]}},
+                      ids_file)
+        with open(shard_file_path(checkpoint_path, shard), "w", encoding="utf-8") as checkpoint_file:
+            json.dump({"TEST_SERVER": shard_checkpoints[index]}, checkpoint_file)
+    with open(checkpoint_path, "w", encoding="utf-8") as checkpoint_file:
+        json.dump({"TEST_SERVER": "2021-12-28T15:14:28Z"}, checkpoint_file)
+
+    args = argparse.Namespace(config_file=CONFIG_FILE, shards=2)
+    MergeShardsCommand(args).execute()
+
+    merged_ids = LocalStorage(logging.getLogger("unit_test_sharding"), ids_path).load_storage()
+    with open(checkpoint_path, encoding="utf-8") as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    assert merged_ids["global_keys"]["files"] == {"1": "folder1/file1.txt", "2": "folder2/file2.txt"}
+    assert merged_ids["delete_keys"]["files"] == {"1": "folder1/file1.txt", "2": "folder2/file2.txt"}
+    assert checkpoint["TEST_SERVER"] == "2022-03-24T15:14:28Z"
+
+
+def test_merge_shards_when_shard_is_missing(tmp_path, monkeypatch):
+    """Test that merge-shards raises an error when a shard has not been synced"""
+    monkeypatch.setattr(merge_shards_command, "IDS_PATH", str(tmp_path / "doc_id.jsonl"))
+    monkeypatch.setattr(merge_shards_command, "CHECKPOINT_PATH", str(tmp_path / "checkpoint.json"))
+    monkeypatch.setattr(merge_shards_command, "LOCK_PATH", str(tmp_path / "connector.lock"))
+    args = argparse.Namespace(config_file=CONFIG_FILE, shards=2)
+    with pytest.raises(MissingShardException):
+        MergeShardsCommand(args).execute()
+
+
+def test_merge_shards_when_no_shard_saved_a_checkpoint(tmp_path, monkeypatch):
+    """Test that merge-shards merges the IDs but keeps the checkpoint of a drive no shard saved a checkpoint for"""
+    ids_path = str(tmp_path / "doc_id.jsonl")
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    monkeypatch.setattr(merge_shards_command, "IDS_PATH", ids_path)
+    monkeypatch.setattr(merge_shards_command, "CHECKPOINT_PATH", checkpoint_path)
+    monkeypatch.setattr(merge_shards_command, "LOCK_PATH", str(tmp_path / "connector.lock"))
+    for index in range(2):
+        shard = Shard(index, 2)
+        LocalStorage(logging.getLogger("unit_test_sharding"), shard_file_path(ids_path, shard)).write_storage(
+            [("global_keys", str(index), f"folder{index}/file{index}.txt")]
+        )
+        with open(shard_file_path(checkpoint_path, shard), "w", encoding="utf-8") as checkpoint_file:
+            json.dump({"OTHER_SERVER": "2022-03-25T15:14:28Z"}, checkpoint_file)
+
+    args = argparse.Namespace(config_file=CONFIG_FILE, shards=2)
+    MergeShardsCommand(args).execute()
+
+    merged_ids = LocalStorage(logging.getLogger("unit_test_sharding"), ids_path).load_storage()
+    assert merged_ids["global_keys"]["files"] == {"0": "folder0/file0.txt", "1": "folder1/file1.txt"}
+    assert not os.path.exists(checkpoint_path)
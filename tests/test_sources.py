@@ -0,0 +1,100 @@
+#
+# Copyright Elasticsearch B.V. and/or licensed to Elasticsearch B.V. under one
+# or more contributor license agreements. Licensed under the Elastic License 2.0;
+# you may not use this file except in compliance with the Elastic License 2.0.
+#
+import logging
+import os
+import sys
+from unittest.mock import Mock
+
+import pytest
+import yaml
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from ees_network_drive.configuration import Configuration, ConfigurationInvalidException  # noqa
+from ees_network_drive.files import Files  # noqa
+from ees_network_drive.network_drive_client import ConnectionCache  # noqa
+from ees_network_drive.sources import get_sources, interleave  # noqa
+
+CONFIG_FILE = os.path.join(
+    os.path.join(os.path.dirname(__file__), "config"),
+    "network_drive_connector.yml",
+)
+
+
+def settings(tmp_path, network_drives):
+    """This function writes the test config with the given drives and loads it"""
+    with open(CONFIG_FILE, encoding="utf-8") as config_file:
+        configurations = yaml.safe_load(config_file)
+    configurations["network_drives"] = network_drives
+    config_path = tmp_path / "network_drive_connector.yml"
+    config_path.write_text(yaml.safe_dump(configurations), encoding="utf-8")
+    return Configuration(file_name=str(config_path)), logging.getLogger("unit_test_sources")
+
+
+def test_get_sources(tmp_path):
+    """Test that the listed drives replace the network_drive settings they provide"""
+    config, logger = settings(tmp_path, [{"name": "projects", "path": "Projects/current", "server_ip": "10.0.0.2"}])
+    default, projects = get_sources(config, logger)
+    assert default.name is None
+    assert default.checkpoint_key == "TEST_SERVER"
+    assert default.file_path("/tmp/doc_id.jsonl") == "/tmp/doc_id.jsonl"
+    assert projects.checkpoint_key == "projects"
+    assert projects.file_path("/tmp/doc_id.jsonl") == "/tmp/doc_id.projects.jsonl"
+    assert projects.config.get_value("network_drive.path") == "Projects/current"
+    assert projects.config.get_value("network_drive.server_ip") == "10.0.0.2"
+    assert projects.config.get_value("network_drive.server_name") == "TEST_SERVER"
+    assert projects.config.get_value("network_drive.name") == "projects"
+    assert config.get_value("network_drive.name") is None
+
+
+def test_duplicate_source_names(tmp_path):
+    """Test that the names of the listed drives must be unique"""
+    with pytest.raises(ConfigurationInvalidException):
+        settings(tmp_path, [{"name": "projects", "path": "Projects"}, {"name": "projects", "path": "Archive"}])
+
+
+def test_source_name_of_server_name(tmp_path):
+    """Test that the names of the listed drives must differ from the server name of the configured drive"""
+    with pytest.raises(ConfigurationInvalidException):
+        settings(tmp_path, [{"name": "TEST_SERVER", "path": "Projects"}])
+
+
+def test_budget_is_rejected_with_worker_processes(tmp_path):
+    """Test that the byte budget cannot be set when the files are fetched by worker processes"""
+    with open(CONFIG_FILE, encoding="utf-8") as config_file:
+        configurations = yaml.safe_load(config_file)
+    configurations.update({"network_drives_sync_executor": "process", "max_in_flight_bytes": 1024})
+    config_path = tmp_path / "network_drive_connector.yml"
+    config_path.write_text(yaml.safe_dump(configurations), encoding="utf-8")
+    with pytest.raises(ConfigurationInvalidException):
+        Configuration(file_name=str(config_path))
+
+
+def test_interleave():
+    """Test that the jobs of the drives are taken in turn"""
+    assert interleave([[1, 2, 3], ["a"], [], [10, 20]]) == [1, "a", 10, 2, 20, 3]
+
+
+def test_document_ids_of_listed_drives_are_prefixed(tmp_path):
+    """Test that the IDs of the files of a listed drive are prefixed with the name of the drive"""
+    config, logger = settings(tmp_path, [{"name": "projects", "path": "Projects"}])
+    default, projects = get_sources(config, logger)
+    file = Mock(file_id=12, filename="file1.txt")
+    assert Files(logger, default.config, default.network_drive_client).document_id(file, "folder1") == 12
+    assert Files(logger, projects.config, projects.network_drive_client).document_id(file, "folder1") == "projects:12"
+
+
+def test_connection_cache_keeps_a_connection_per_drive():
+    """Test that a thread keeps a separate connection to each drive"""
+    connection_cache = ConnectionCache()
+    first_drive = Mock(connection_key=("10.0.0.1",))
+    second_drive = Mock(connection_key=("10.0.0.2",))
+    assert connection_cache.get(first_drive) is connection_cache.get(first_drive)
+    assert connection_cache.get(second_drive) is second_drive.connect.return_value
+    assert connection_cache.active_count() == 2
+    connection_cache.discard(first_drive)
+    assert connection_cache.active_count() == 1
+    first_drive.connect.return_value.close.assert_called_once()
@@ -1,11 +1,15 @@
 import logging
 import os
+import stat
 import sys
 
+import pytest
+
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 
-from ees_network_drive.utils import split_list_into_buckets, fetch_users_from_csv_file, url_encode, split_documents_into_equal_chunks # noqa
+from ees_network_drive.utils import split_list_into_buckets, fetch_users_from_csv_file, url_encode, split_documents_into_equal_chunks, rfc_3339_to_epoch # noqa
+from ees_network_drive.utils import UMASK, write_json_atomically  # noqa
 
 
 def test_split_list_into_buckets():
@@ -47,3 +51,24 @@ def test_split_documents_into_equal_chunks():
     expected_result = [["1", "3", "4"], ["6", "7", "5"], ["8", "9", "2"], ["0", "111"]]
     result = split_documents_into_equal_chunks(list_to_split, chunk_size)
     assert expected_result == result
+
+
+def test_rfc_3339_to_epoch():
+    """Tests rfc_3339_to_epoch converts a time in rfc 3339 format to seconds since the epoch in UTC"""
+    assert rfc_3339_to_epoch("1970-01-01T00:00:00Z") == 0
+    assert rfc_3339_to_epoch("2021-12-30T15:14:28Z") == 1640877268
+
+
+@pytest.mark.skipif(os.name == "nt", reason="file modes are not supported on Windows")
+def test_write_json_atomically_keeps_the_permissions(tmp_path):
+    """Tests write_json_atomically keeps the mode of the replaced file and applies the umask to a new file"""
+    existing_path = str(tmp_path / "checkpoint.json")
+    with open(existing_path, "w", encoding="utf-8") as existing_file:
+        existing_file.write("{}")
+    os.chmod(existing_path, 0o640)
+    write_json_atomically(existing_path, {"TEST_SERVER": "2022-03-24T15:14:28Z"})
+    assert stat.S_IMODE(os.stat(existing_path).st_mode) == 0o640
+
+    new_path = str(tmp_path / "full_sync_progress.json")
+    write_json_atomically(new_path, {"folders": {}})
+    assert stat.S_IMODE(os.stat(new_path).st_mode) == 0o666 & ~UMASK